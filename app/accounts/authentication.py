@@ -0,0 +1,105 @@
+import uuid
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from utils.cache import TTLCache
+from utils.routers import primary
+
+token_cache = TTLCache(settings.TOKEN_AUTH_CACHE['MAX_SIZE'],
+                       settings.TOKEN_AUTH_CACHE['TTL'])
+
+
+def shared_cache():
+    """Return the Django cache used as second tier, if one is configured"""
+    alias = settings.TOKEN_AUTH_CACHE['SHARED_CACHE']
+    return caches[alias] if alias else None
+
+
+def shared_cache_key(key):
+    return 'auth-token:%s' % key
+
+
+def version_cache_key(key):
+    return 'auth-token-version:%s' % key
+
+
+def invalidate_tokens(*keys):
+    """Drop cached users of the given token keys from both tiers.
+
+    Deleting the version of a key in the shared cache also revokes the
+    local entries of every other process at their next lookup.
+    """
+    for key in keys:
+        token_cache.delete(key)
+    cache = shared_cache()
+    if cache is not None and keys:
+        cache.delete_many([shared_cache_key(key) for key in keys]
+                          + [version_cache_key(key) for key in keys])
+
+
+def freeze_user(user):
+    """Return the field values of `user` as cached by both tiers"""
+    return user._state.db, tuple(
+        getattr(user, field.attname)
+        for field in user._meta.concrete_fields)
+
+
+def thaw_user(frozen):
+    """Build a fresh user instance from `freeze_user` values"""
+    db, values = frozen
+    User = get_user_model()
+    return User.from_db(db, [field.attname
+                             for field in User._meta.concrete_fields],
+                        values)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Token authentication caching token to user lookups.
+
+    Users are kept in a bounded in-process TTL LRU and, when
+    `TOKEN_AUTH_CACHE['SHARED_CACHE']` names a cache, in that cache too.
+    Entries are invalidated when a token is deleted or its user is saved
+    or deleted. With a shared cache every entry carries the version of
+    its key stored there, checked on each local hit, so invalidations
+    apply to all processes at once. Without one, other processes drop
+    their local entries after `TTL`. Each request gets its own instance
+    of the user.
+    """
+
+    def authenticate_credentials(self, key):
+        cache = shared_cache()
+        version = None
+        if cache is not None:
+            version = cache.get(version_cache_key(key))
+
+        entry = token_cache.get(key)
+        if entry is not None and entry[0] != version:
+            entry = None
+        if entry is None and version is not None:
+            entry = cache.get(shared_cache_key(key))
+            if entry is not None and entry[0] != version:
+                entry = None
+            if entry is not None:
+                token_cache.set(key, entry)
+
+        if entry is None:
+            if cache is not None and version is None:
+                # created before the lookup, so an invalidation racing
+                # with it deletes the version and orphans the entry
+                cache.add(version_cache_key(key), uuid.uuid4().hex, None)
+                version = cache.get(version_cache_key(key))
+            # a token issued moments ago may not have reached replicas
+            with primary():
+                user, token = super().authenticate_credentials(key)
+            entry = (version, freeze_user(user))
+            token_cache.set(key, entry)
+            if cache is not None:
+                cache.set(shared_cache_key(key), entry,
+                          settings.TOKEN_AUTH_CACHE['TTL'])
+            return (thaw_user(entry[1]), token)
+
+        user = thaw_user(entry[1])
+        return (user, Token(key=key, user=user))
@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.core import signing
+from django.utils.crypto import constant_time_compare, salted_hmac
+from rest_framework.authtoken.models import Token
+
+REFRESH_SALT = 'accounts.credentials.refresh'
+
+
+def token_digest(token):
+    return salted_hmac(REFRESH_SALT, token.key).hexdigest()
+
+
+def make_refresh_credential(token):
+    """Return a signed credential that can be exchanged for `token`.
+
+    It is bound to the token key and to the user's password hash, so it
+    stops working when the token is deleted or the password changes.
+    """
+    return signing.dumps({
+        'user': token.user_id,
+        'token': token_digest(token),
+        'auth': token.user.get_session_auth_hash(),
+    }, salt=REFRESH_SALT)
+
+
+def read_refresh_credential(value):
+    """Return the token a refresh credential was issued for.
+
+    Returns None when the credential is invalid, expired or revoked.
+    Costs one query and no password hashing.
+    """
+    try:
+        data = signing.loads(value, salt=REFRESH_SALT,
+                             max_age=settings.REFRESH_CREDENTIAL_MAX_AGE)
+        token = Token.objects.select_related('user').get(user_id=data['user'])
+    except (signing.BadSignature, KeyError, TypeError, Token.DoesNotExist):
+        return None
+
+    if not (token.user.is_active and
+            constant_time_compare(data['token'], token_digest(token)) and
+            constant_time_compare(data['auth'],
+                                  token.user.get_session_auth_hash())):
+        return None
+    return token
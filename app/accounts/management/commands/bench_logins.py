@@ -0,0 +1,41 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+from utils.benchmark import benchmark_database, timer
+
+
+class Command(BaseCommand):
+    """Measure token issuance throughput of a single process"""
+    help = "Benchmark password and refresh credential logins per second."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=50)
+        parser.add_argument('--iterations', type=int,
+                            help='Override PASSWORD_HASH_ITERATIONS.')
+
+    def handle(self, *args, **options):
+        overrides = {}
+        if options['iterations']:
+            overrides['PASSWORD_HASH_ITERATIONS'] = options['iterations']
+        with override_settings(**overrides), benchmark_database():
+            self.run(options['logins'])
+
+    def run(self, logins):
+        credentials = {'email': 'bench@husteen.com',
+                       'password': 'password@123'}
+        get_user_model().objects.create_user(**credentials)
+        client = APIClient()
+        url = reverse('users:token')
+
+        refresh = client.post(url, credentials).data['refresh']
+        for name, payload in (('password', credentials),
+                              ('refresh', {'refresh': refresh})):
+            with timer() as result:
+                for _ in range(logins):
+                    res = client.post(url, payload)
+                    assert res.status_code == 200, res.content
+            self.stdout.write('%-10s %6d logins %8.2fs %10.1f logins/s/core'
+                              % (name, logins, result['elapsed'],
+                                 logins / result['elapsed']))
@@ -0,0 +1,62 @@
+import os
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from accounts.onboarding import (ONBOARDING_CHUNK_SIZE,
+                                 onboard_users,
+                                 read_rows)
+
+
+class Command(BaseCommand):
+    """Create users and their products from a CSV or JSON file"""
+    help = "Bulk onboard users from a CSV or JSON file, or '-' for stdin."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=('csv', 'json'),
+                            help='Input format, guessed from the extension '
+                                 'by default.')
+        parser.add_argument('--chunk-size', type=int,
+                            default=ONBOARDING_CHUNK_SIZE)
+        parser.add_argument('--workers', type=int,
+                            default=settings.ONBOARDING_HASH_WORKERS,
+                            help='Password hashing processes, defaults to '
+                                 'ONBOARDING_HASH_WORKERS or the CPU count. '
+                                 '0 hashes inline.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format']
+        if file_format is None:
+            extension = os.path.splitext(path)[1].lower()
+            file_format = 'csv' if extension == '.csv' else 'json'
+
+        if path == '-':
+            report = self.onboard(sys.stdin, file_format, options)
+        else:
+            try:
+                stream = open(path, encoding='utf-8-sig', newline='')
+            except OSError as exc:
+                raise CommandError(exc)
+            with stream:
+                report = self.onboard(stream, file_format, options)
+
+        for error in report.errors:
+            self.stderr.write('row %(row)s: %(errors)s' % error)
+        self.stdout.write(self.style.SUCCESS(
+            'Created %d users, skipped %d.' % (report.created,
+                                               report.skipped)))
+
+    def onboard(self, stream, file_format, options):
+        return onboard_users(read_rows(stream, file_format),
+                             chunk_size=options['chunk_size'],
+                             workers=options['workers'],
+                             progress=self.progress)
+
+    def progress(self, report):
+        self.stdout.write('%d processed, %d created, %d skipped '
+                          '(%.0f rows/s)' % (report.processed,
+                                             report.created,
+                                             report.skipped,
+                                             report.rate))
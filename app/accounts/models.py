@@ -1,10 +1,39 @@
+from django.conf import settings
 from django.db import models
+from django.db.models import Prefetch
 from django.contrib.auth.models import (AbstractBaseUser,
                                         BaseUserManager,
                                         PermissionsMixin)
 
 
-class UserManager(BaseUserManager):
+class UserQuerySet(models.QuerySet):
+
+    def with_related(self, transaction_limit=None):
+        """Prefetch products and the most recent transactions of each user.
+
+        The nested user payload is then built from a fixed number of
+        queries regardless of page size or transaction history length.
+        The transactions are stored on `recent_transactions`.
+        """
+        from transactions.models import Transaction
+
+        if transaction_limit is None:
+            transaction_limit = settings.USER_TRANSACTION_PREVIEW_LIMIT
+        transactions = Transaction.objects.latest_per_user(
+            transaction_limit).order_by('-id')
+        return self.prefetch_related(
+            'product',
+            Prefetch('transaction',
+                     queryset=transactions,
+                     to_attr='recent_transactions'),
+        )
+
+    def with_transaction_summary(self):
+        """Join the ledger holding each user's transaction aggregates"""
+        return self.select_related('ledger')
+
+
+class UserManager(BaseUserManager.from_queryset(UserQuerySet)):
 
     def create_user(self, email, password=None, **extra_fields):
         """Create and saves a new user"""
@@ -0,0 +1,210 @@
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, islice
+import csv
+import io
+import json
+import time
+
+import django
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db.transaction import atomic
+from accounts.serializers import OnboardUserSerializer
+from products.models import Product
+
+ONBOARDING_CHUNK_SIZE = 1000
+READ_ARRAY_CHUNK_SIZE = 64 * 1024
+MAX_REPORTED_ERRORS = 100
+
+
+class OnboardingReport:
+    """Running totals of a bulk onboarding"""
+
+    def __init__(self):
+        self.created = 0
+        self.skipped = 0
+        self.errors = []
+        self.started = time.perf_counter()
+
+    @property
+    def processed(self):
+        return self.created + self.skipped
+
+    @property
+    def rate(self):
+        elapsed = time.perf_counter() - self.started
+        return self.processed / elapsed if elapsed else 0.0
+
+    def add_error(self, row, detail):
+        self.skipped += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': row, 'errors': detail})
+
+    def as_dict(self):
+        return {
+            'created': self.created,
+            'skipped': self.skipped,
+            'errors': self.errors,
+        }
+
+
+def read_rows(stream, file_format):
+    """Yield user rows from a CSV or JSON byte or text stream.
+
+    JSON input is either an array of objects or one object per line.
+    Both are decoded incrementally, without reading the whole stream.
+    """
+    if isinstance(stream.read(0), bytes):
+        stream = io.TextIOWrapper(stream, encoding='utf-8-sig')
+
+    if file_format == 'csv':
+        yield from csv.DictReader(stream)
+        return
+
+    head = stream.read(1)
+    while head.isspace():
+        head = stream.read(1)
+    if head == '[':
+        yield from read_array(stream)
+        return
+    for line in chain([head + stream.readline()], stream):
+        if line.strip():
+            yield json.loads(line)
+
+
+def read_array(stream, size=None):
+    """Yield the items of a JSON array whose `[` was already read.
+
+    The stream is read `size` characters at a time and each item is
+    decoded as soon as it is complete, so only one item and one chunk
+    are held in memory.
+    """
+    size = size or READ_ARRAY_CHUNK_SIZE
+    decoder = json.JSONDecoder()
+    buffer = ''
+    eof = False
+    expect_item = True
+    while True:
+        buffer = buffer.lstrip()
+        if not buffer:
+            if eof:
+                raise ValueError('Unterminated JSON array.')
+            chunk = stream.read(size)
+            eof = not chunk
+            buffer = chunk
+            continue
+        if buffer[0] == ']':
+            return
+        if not expect_item:
+            if buffer[0] != ',':
+                raise ValueError('Expected "," between JSON array items.')
+            buffer = buffer[1:]
+            expect_item = True
+            continue
+        try:
+            item, end = decoder.raw_decode(buffer)
+        except ValueError:
+            item, end = None, None
+        # an item ending the buffer may be a truncated number
+        if end is None or end == len(buffer) and not eof:
+            if eof:
+                raise ValueError('Invalid JSON array item.')
+            chunk = stream.read(size)
+            eof = not chunk
+            buffer += chunk
+            continue
+        yield item
+        buffer = buffer[end:]
+        expect_item = False
+
+
+def chunked(iterable, size):
+    """Yield lists of up to `size` items from `iterable`"""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def onboard_users(rows, chunk_size=ONBOARDING_CHUNK_SIZE, workers=None,
+                  progress=None):
+    """Create users and their products from an iterable of row dicts.
+
+    Rows are validated and inserted `chunk_size` at a time with
+    bulk_create. Passwords are hashed in a pool of `workers` processes,
+    or inline when `workers` is 0. Rows with invalid data or an email
+    that is already registered are skipped. `progress` is called with
+    the report after every chunk.
+    """
+    report = OnboardingReport()
+    executor = None
+    if workers != 0:
+        executor = ProcessPoolExecutor(workers, initializer=django.setup)
+    try:
+        for number, chunk in enumerate(chunked(rows, chunk_size)):
+            onboard_chunk(chunk, number * chunk_size, report, executor)
+            if progress is not None:
+                progress(report)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return report
+
+
+def onboard_chunk(rows, offset, report, executor):
+    """Validate, hash and insert one chunk of rows"""
+    User = get_user_model()
+    users = {}
+    for row_number, row in enumerate(rows, offset + 1):
+        serializer = OnboardUserSerializer(data=row)
+        if not serializer.is_valid():
+            report.add_error(row_number, serializer.errors)
+            continue
+        data = serializer.validated_data
+        data['email'] = User.objects.normalize_email(data['email'])
+        if data['email'] in users:
+            report.add_error(row_number, {'email': ['Duplicate email.']})
+            continue
+        users[data['email']] = (row_number, data)
+
+    existing = User.objects.filter(
+        email__in=list(users)).values_list('email', flat=True)
+    for email in existing:
+        row_number, _ = users.pop(email)
+        report.add_error(row_number, {'email': ['User already exists.']})
+    if not users:
+        return
+
+    rows = [data for _, data in users.values()]
+    passwords = [data.pop('password') for data in rows]
+    if executor is None:
+        hashes = [make_password(password) for password in passwords]
+    else:
+        hashes = list(executor.map(make_password, passwords,
+                                   chunksize=max(1, len(passwords) // 64)))
+
+    with atomic():
+        # A concurrent signup may register an email after the check
+        # above, those rows are ignored here and told apart from ours by
+        # their salted password hash
+        User.objects.bulk_create([
+            User(password=password, **data)
+            for data, password in zip(rows, hashes)
+        ], ignore_conflicts=True)
+        hashes = dict(zip((data['email'] for data in rows), hashes))
+        created = []
+        for pk, email, password in User.objects.filter(
+                email__in=list(users)).values_list('pk', 'email',
+                                                   'password'):
+            if hashes[email] == password:
+                created.append(pk)
+            else:
+                row_number, _ = users[email]
+                report.add_error(row_number,
+                                 {'email': ['User already exists.']})
+        Product.objects.bulk_create([
+            Product(user_id_id=pk) for pk in created
+        ])
+    report.created += len(created)
@@ -1,11 +1,19 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model, authenticate
+from django.urls import reverse
+from django.utils.http import urlencode
 from django.utils.translation import gettext_lazy as _
 from rest_framework import serializers
+from accounts.credentials import read_refresh_credential
 from products.serializers import ProductSerializer
-from transactions.serializers import RetrieveTransactionSerializer
+from transactions.models import Ledger
+from transactions.serializers import (RetrieveTransactionSerializer,
+                                      TransactionSummarySerializer)
+from utils.metrics import TimedRepresentationMixin
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(TimedRepresentationMixin,
+                     serializers.ModelSerializer):
     """Serializer for the user object."""
 
     class Meta:
@@ -37,10 +45,25 @@ class UserSerializer(serializers.ModelSerializer):
         return user
 
 
-class ListUserSerializer(serializers.ModelSerializer):
+class OnboardUserSerializer(serializers.Serializer):
+    """Serializer for one row of a bulk user onboarding"""
+    email = serializers.EmailField(max_length=255)
+    password = serializers.CharField(min_length=5)
+    first_name = serializers.CharField(max_length=100)
+    last_name = serializers.CharField(max_length=100)
+    phone_number = serializers.CharField(max_length=14)
+    state = serializers.CharField(max_length=100, required=False,
+                                  allow_null=True, allow_blank=True)
+    address = serializers.CharField(max_length=255, required=False,
+                                    allow_null=True, allow_blank=True)
+
+
+class ListUserSerializer(TimedRepresentationMixin,
+                         serializers.ModelSerializer):
     """Serializer for the user object."""
     product = ProductSerializer(many=True, required=False)
-    transaction = RetrieveTransactionSerializer(many=True, required=False)
+    transaction = serializers.SerializerMethodField()
+    transaction_summary = serializers.SerializerMethodField()
 
     class Meta:
         model = get_user_model()
@@ -54,22 +77,72 @@ class ListUserSerializer(serializers.ModelSerializer):
                   'address',
                   'product',
                   'transaction',
+                  'transaction_summary',
                   )
         extra_kwargs = {'password': {'write_only': True, 'min_length': 5}}
 
+    def get_transaction(self, obj):
+        """Return the latest transactions, prefetched when available"""
+        transactions = getattr(obj, 'recent_transactions', None)
+        if transactions is None:
+            transactions = obj.transaction.order_by('-id')[
+                :settings.USER_TRANSACTION_PREVIEW_LIMIT]
+        return RetrieveTransactionSerializer(
+            transactions, many=True, context=self.context).data
+
+    def get_transaction_summary(self, obj):
+        """Return transaction aggregates and a link to the full history"""
+        try:
+            ledger = obj.ledger
+        except Ledger.DoesNotExist:
+            ledger = Ledger(user_id=obj)
+
+        next_url = None
+        if ledger.transaction_count > settings.USER_TRANSACTION_PREVIEW_LIMIT:
+            next_url = '%s?%s' % (reverse('list-customer-transaction'),
+                                  urlencode({'user_id': obj.pk,
+                                             'pagination': 'cursor'}))
+            request = self.context.get('request')
+            if request is not None:
+                next_url = request.build_absolute_uri(next_url)
+
+        return TransactionSummarySerializer({
+            'count': ledger.transaction_count,
+            'success_count': ledger.success_count,
+            'pending_count': ledger.pending_count,
+            'total_amount': ledger.total_amount,
+            'hours_purchased': ledger.hours_purchased,
+            'next': next_url,
+        }).data
+
 
 class AuthTokenSerializer(serializers.Serializer):
     """Serializer for the user authentication objects"""
-    email = serializers.CharField()
+    email = serializers.CharField(required=False)
     password = serializers.CharField(
         style={'input_type': 'password'},
-        trim_whitespace=True
+        trim_whitespace=True,
+        required=False
     )
+    refresh = serializers.CharField(required=False)
 
     def validate(self, attrs):
-        """Validate and authenticate the user."""
+        """Validate and authenticate the user or the refresh credential."""
+        refresh = attrs.get('refresh')
+        if refresh:
+            token = read_refresh_credential(refresh)
+            if token is None:
+                msg = _('Refresh credential is invalid or expired.')
+                raise serializers.ValidationError(msg, code='authentication')
+            attrs['user'] = token.user
+            attrs['token'] = token
+            return attrs
+
         email = attrs.get('email')
         password = attrs.get('password')
+        if not (email and password):
+            msg = _('Must include "email" and "password".')
+            raise serializers.ValidationError(msg, code='authorization')
 
         user = authenticate(
             request=self.context.get('request'),
@@ -84,7 +157,8 @@ class AuthTokenSerializer(serializers.Serializer):
         return attrs
 
 
-class AdminUserSerializer(serializers.ModelSerializer):
+class AdminUserSerializer(TimedRepresentationMixin,
+                          serializers.ModelSerializer):
     """Serializer for the admin user object."""
 
     class Meta:
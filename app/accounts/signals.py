@@ -0,0 +1,29 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+from accounts.authentication import invalidate_tokens
+from utils.cache import invalidate_scopes
+
+
+# Invalidations wait for the commit: dropped earlier, a concurrent request
+# could cache the old row again until the TTL.
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    key = instance.key
+    transaction.on_commit(lambda: invalidate_tokens(key))
+
+
+@receiver(post_save, sender=get_user_model())
+def invalidate_user_tokens(sender, instance, **kwargs):
+    """Forget cached copies of a user that was edited or deactivated"""
+    keys = list(Token.objects.filter(user_id=instance.pk).values_list(
+        'key', flat=True))
+    if keys:
+        transaction.on_commit(lambda: invalidate_tokens(*keys))
+
+
+@receiver(post_save, sender=get_user_model())
+def invalidate_user_responses(sender, instance, **kwargs):
+    invalidate_scopes('user:%s' % instance.pk)
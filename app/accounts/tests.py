@@ -1,12 +1,34 @@
-from django.test import TestCase, Client
+from io import StringIO
+from unittest import mock
+import json
+import multiprocessing
+import os
+import tempfile
+
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, Client, override_settings
 from django.contrib.auth import get_user_model
+from django.db.models import Q
 from django.urls import reverse
 
 from rest_framework.test import APIClient
 from rest_framework import status
+from rest_framework.authtoken.models import Token
+from accounts import onboarding
+from accounts.authentication import (CachedTokenAuthentication,
+                                     token_cache, version_cache_key)
+from products.models import Product
+from transactions.models import Transaction
+from transactions.services import validate_payment
+import uuid
 
 CREATE_USER_URL = reverse('users:create')
 TOKEN_URL = reverse('users:token')
+LIST_USER_URL = reverse('users:list-user')
+BULK_CREATE_USER_URL = reverse('users:bulk-create')
+ME_URL = reverse('users:update')
 
 
 def create_user(**params):
@@ -65,14 +87,13 @@ class ModelTests(TestCase):
 
 class AdminSiteTests(TestCase):
 
-    def setUp(self):
-        self.client = Client()
-        self.admin_user = get_user_model().objects.create_superuser(
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = get_user_model().objects.create_superuser(
             email='admin201@husteen.com',
             password='password123'
         )
-        self.client.force_login(self.admin_user)
-        self.user = get_user_model().objects.create_user(
+        cls.user = get_user_model().objects.create_user(
             email='test456@husteen.com',
             password='password@123',
             last_name='Smith',
@@ -82,6 +103,10 @@ class AdminSiteTests(TestCase):
             first_name='Husteen'
             )
 
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.admin_user)
+
     def test_users_listed(self):
         """Test that users are listed on user page"""
         url = reverse('admin:accounts_user_changelist')
@@ -108,15 +133,13 @@ class AdminSiteTests(TestCase):
 class publicUserApiTest(TestCase):
     """Test the user api public"""
 
-    def setUp(self):
-        self.client = APIClient()
-
-        self.admin_user = get_user_model().objects.create_superuser(
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = get_user_model().objects.create_superuser(
             email='admin@husteen.com',
             password='password123'
         )
-        self.client.force_login(self.admin_user)
-        self.user = get_user_model().objects.create_user(
+        cls.user = get_user_model().objects.create_user(
             email='test@husteen.com',
             password='password123',
             last_name='Smith',
@@ -125,6 +148,10 @@ class publicUserApiTest(TestCase):
             address='Lagos, Nigeria',
             first_name='Husteen')
 
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_login(self.admin_user)
+
     def test_create_token_for_user(self):
         """Test that a token is created for the user"""
         payload = {
@@ -142,6 +169,66 @@ class publicUserApiTest(TestCase):
         self.assertIn('token', res.data)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
 
+    def test_refresh_credential_returns_existing_token(self):
+        """Test a refresh credential is exchanged without password hashing"""
+        res = self.client.post(TOKEN_URL, {'email': 'test@husteen.com',
+                                           'password': 'password123'})
+        self.assertIn('refresh', res.data)
+
+        with mock.patch('accounts.serializers.authenticate') as auth:
+            refreshed = self.client.post(TOKEN_URL,
+                                         {'refresh': res.data['refresh']})
+        auth.assert_not_called()
+        self.assertEqual(refreshed.status_code, status.HTTP_200_OK)
+        self.assertEqual(refreshed.data['token'], res.data['token'])
+
+    def test_refresh_credential_revoked(self):
+        """Test refresh credentials stop working after token deletion
+        or a password change"""
+        res = self.client.post(TOKEN_URL, {'email': 'test@husteen.com',
+                                           'password': 'password123'})
+        self.user.set_password('password456')
+        self.user.save()
+        refreshed = self.client.post(TOKEN_URL,
+                                     {'refresh': res.data['refresh']})
+        self.assertEqual(refreshed.status_code,
+                         status.HTTP_400_BAD_REQUEST)
+
+        res = self.client.post(TOKEN_URL, {'email': 'test@husteen.com',
+                                           'password': 'password456'})
+        Token.objects.filter(user=self.user).delete()
+        refreshed = self.client.post(TOKEN_URL,
+                                     {'refresh': res.data['refresh']})
+        self.assertEqual(refreshed.status_code,
+                         status.HTTP_400_BAD_REQUEST)
+
+    def test_login_rehashes_with_configured_iterations(self):
+        """Test a login upgrades a weaker stored hash to the settings"""
+        with override_settings(PASSWORD_HASH_ITERATIONS=100):
+            self.user.set_password('password123')
+        self.user.save()
+
+        with override_settings(PASSWORD_HASH_ITERATIONS=1000):
+            res = self.client.post(TOKEN_URL, {'email': 'test@husteen.com',
+                                               'password': 'password123'})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$1000$'))
+        self.assertTrue(self.user.check_password('password123'))
+
+    def test_login_keeps_stronger_hashes(self):
+        """Test lowering the iterations never weakens stored hashes"""
+        with override_settings(PASSWORD_HASH_ITERATIONS=1000):
+            self.user.set_password('password123')
+        self.user.save()
+
+        with override_settings(PASSWORD_HASH_ITERATIONS=10):
+            res = self.client.post(TOKEN_URL, {'email': 'test@husteen.com',
+                                               'password': 'password123'})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$1000$'))
+
     def test_create_token_invalid_credentials(self):
         """Test that token is not created if invallid credentials are given."""
         email = 'invalid-token@husteen.com'
@@ -187,8 +274,9 @@ class publicUserApiTest(TestCase):
 
 class privateUserApiTest(TestCase):
     """Test the authenticated url User API"""
-    def setUp(self):
-        self.admin_user = get_user_model().objects.create_superuser(
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = get_user_model().objects.create_superuser(
             email='admin-user@husteen.com',
             password='password@123',
             last_name='Smith',
@@ -198,7 +286,7 @@ class privateUserApiTest(TestCase):
             first_name='Husteen'
         )
 
-        self.user = get_user_model().objects.create_user(
+        cls.user = get_user_model().objects.create_user(
             email='test@husteen.com',
             password='password@123',
             last_name='Smith',
@@ -208,6 +296,7 @@ class privateUserApiTest(TestCase):
             first_name='Husteen'
             )
 
+    def setUp(self):
         self.client = APIClient()
         self.client.force_authenticate(self.user)
         self.client.force_authenticate(self.admin_user)
@@ -264,3 +353,347 @@ class privateUserApiTest(TestCase):
         user = get_user_model().objects.get(**res.data)
         self.assertTrue(user.check_password(payload['password']))
         self.assertNotIn('password', res.data)
+
+    def test_update_refreshes_cached_profile(self):
+        """Test updating the user drops the cached profile"""
+        res = self.client.get(ME_URL)
+        self.assertEqual(res.data['first_name'], 'Husteen')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            res = self.client.patch(ME_URL, {'first_name': 'Austin'})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        res = self.client.get(ME_URL)
+        self.assertEqual(res.data['first_name'], 'Austin')
+
+
+class listUserQueryTest(TestCase):
+    """Test the nested user payload runs a fixed number of queries"""
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = get_user_model().objects.create_superuser(
+            email='admin-list@husteen.com',
+            password='password@123'
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin_user)
+        self.users = 0
+
+    def create_customers(self, count, transactions):
+        for _ in range(count):
+            self.users += 1
+            user = get_user_model().objects.create_user(
+                email='customer%s@husteen.com' % self.users,
+                password='password@123',
+                last_name='Smith',
+                phone_number='07033562534',
+                first_name='Husteen'
+            )
+            product = Product.objects.create(user_id=user)
+            for _ in range(transactions):
+                Transaction.objects.create(
+                    amount=100000,
+                    payment_channel='paystack',
+                    product_id=product,
+                    user_id=user,
+                    reference=uuid.uuid4().hex,
+                )
+
+    def test_list_user_query_count_is_constant(self):
+        """Test the user list page query count does not grow with data"""
+        self.create_customers(2, 1)
+        with self.assertNumQueries(4):
+            res = self.client.get(LIST_USER_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        self.create_customers(12, 4)
+        with self.assertNumQueries(4):
+            res = self.client.get(LIST_USER_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['count'], 14)
+
+    @override_settings(USER_TRANSACTION_PREVIEW_LIMIT=2)
+    def test_list_user_limits_nested_transactions(self):
+        """Test only the latest transactions are embedded per user"""
+        self.create_customers(1, 5)
+        res = self.client.get(LIST_USER_URL)
+
+        transactions = res.data['results'][0]['transaction']
+        latest = Transaction.objects.order_by('-id').values_list(
+            'reference', flat=True)[:2]
+        self.assertEqual([t['reference'] for t in transactions],
+                         list(latest))
+
+    def test_latest_per_user_ranks_each_user(self):
+        """Test the window ranking keeps the latest rows of every user"""
+        self.create_customers(3, 4)
+        latest = Transaction.objects.latest_per_user(3)
+
+        self.assertEqual(latest.count(), 9)
+        for user in get_user_model().objects.filter(is_staff=False):
+            expected = Transaction.objects.filter(
+                user_id=user).order_by('-id').values_list('pk', flat=True)
+            self.assertEqual(
+                list(latest.filter(user_id=user).order_by('-id').values_list(
+                    'pk', flat=True)), list(expected[:3]))
+
+    def test_latest_per_user_combines_with_any_filter(self):
+        """Test rows are ranked among earlier filters and can be OR-ed"""
+        self.create_customers(2, 4)
+        user = get_user_model().objects.filter(is_staff=False).first()
+        history = Transaction.objects.filter(user_id=user).order_by('id')
+        oldest, newest = history.first(), history.last()
+
+        latest = Transaction.objects.filter(~Q(pk=newest.pk)).latest_per_user(
+            3).filter(user_id=user)
+        self.assertEqual(list(latest.order_by('id')), list(history[:3]))
+
+        latest = (Transaction.objects.latest_per_user(1)
+                  | Transaction.objects.filter(pk=oldest.pk))
+        self.assertEqual(latest.count(), 3)
+        self.assertIn(oldest, latest)
+
+    @override_settings(USER_TRANSACTION_PREVIEW_LIMIT=2)
+    def test_list_user_transaction_summary(self):
+        """Test the nested summary counts the whole transaction history"""
+        self.create_customers(1, 3)
+        transaction = Transaction.objects.order_by('id').first()
+        transaction.purchased_hour = 2
+        validate_payment(transaction)
+        res = self.client.get(LIST_USER_URL)
+
+        summary = res.data['results'][0]['transaction_summary']
+        self.assertEqual(summary['count'], 3)
+        self.assertEqual(summary['success_count'], 1)
+        self.assertEqual(summary['pending_count'], 2)
+        self.assertEqual(summary['total_amount'], '100000.00')
+        self.assertEqual(summary['hours_purchased'], '2.00')
+        self.assertIn(reverse('list-customer-transaction'), summary['next'])
+
+
+@override_settings(ONBOARDING_HASH_WORKERS=0)
+class bulkOnboardingTest(TestCase):
+    """Test onboarding users in bulk"""
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = get_user_model().objects.create_superuser(
+            email='admin-onboard@husteen.com',
+            password='password@123'
+        )
+        cls.row = {
+            'password': 'test@test123',
+            'first_name': 'Husteen',
+            'last_name': 'Smith',
+            'phone_number': '07033562534',
+            'state': 'Lagos',
+            'address': 'Lagos, Nigeria',
+        }
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin_user)
+
+    def test_bulk_onboard_json_list(self):
+        """Test valid rows are created with a product and bad rows skipped"""
+        payload = [
+            dict(self.row, email='one@HUSTEEN.com'),
+            dict(self.row, email='two@husteen.com'),
+            dict(self.row, email='two@husteen.com'),
+            dict(self.row, email='admin-onboard@husteen.com'),
+            dict(self.row, email='short@husteen.com', password='pw'),
+        ]
+        res = self.client.post(BULK_CREATE_USER_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['created'], 2)
+        self.assertEqual(res.data['skipped'], 3)
+        self.assertEqual([e['row'] for e in res.data['errors']], [3, 5, 4])
+        user = get_user_model().objects.get(email='one@husteen.com')
+        self.assertTrue(user.check_password(self.row['password']))
+        self.assertEqual(Product.objects.filter(user_id=user).count(), 1)
+
+    @override_settings(ONBOARDING_MAX_ROWS=1)
+    def test_bulk_onboard_rejects_too_many_rows(self):
+        """Test requests over the row cap are refused before hashing"""
+        payload = [dict(self.row, email='one@husteen.com'),
+                   dict(self.row, email='two@husteen.com')]
+        res = self.client.post(BULK_CREATE_USER_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('onboard_users', str(res.data))
+        self.assertFalse(get_user_model().objects.filter(
+            email='one@husteen.com').exists())
+
+    def test_bulk_onboard_csv_upload(self):
+        """Test users are onboarded from an uploaded CSV file"""
+        content = 'email,password,first_name,last_name,phone_number\n'
+        content += 'csv@husteen.com,test@test123,Husteen,Smith,0703\n'
+        upload = SimpleUploadedFile('users.csv', content.encode())
+        res = self.client.post(BULK_CREATE_USER_URL, {'file': upload},
+                               format='multipart')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['created'], 1)
+        self.assertTrue(get_user_model().objects.filter(
+            email='csv@husteen.com').exists())
+
+    def test_read_rows_decodes_json_arrays_incrementally(self):
+        """Test array items are decoded across small read chunks"""
+        rows = [dict(self.row, email='array%s@husteen.com' % number,
+                     amount=12345) for number in range(3)]
+        stream = StringIO(json.dumps(rows, indent=1))
+        with mock.patch.object(onboarding, 'READ_ARRAY_CHUNK_SIZE', 7), \
+                mock.patch.object(stream, 'read', wraps=stream.read) as read:
+            self.assertEqual(list(onboarding.read_rows(stream, 'json')),
+                             rows)
+        self.assertTrue(all(call.args[0] <= 7 for call in read.mock_calls
+                            if call.args))
+
+        with self.assertRaises(ValueError):
+            list(onboarding.read_rows(StringIO('[{"a": 1} {"b": 2}]'),
+                                      'json'))
+
+    def test_concurrent_signup_is_skipped(self):
+        """Test an email registered during the chunk is reported, not raised"""
+        make_password = onboarding.make_password
+
+        def racing_make_password(password):
+            if not get_user_model().objects.filter(
+                    email='race@husteen.com').exists():
+                create_user(email='race@husteen.com', password='other')
+            return make_password(password)
+
+        with mock.patch.object(onboarding, 'make_password',
+                               racing_make_password):
+            report = onboarding.onboard_users([
+                dict(self.row, email='race@husteen.com'),
+                dict(self.row, email='calm@husteen.com'),
+            ], workers=0)
+
+        self.assertEqual((report.created, report.skipped), (1, 1))
+        self.assertEqual(report.errors[0]['row'], 1)
+        raced = get_user_model().objects.get(email='race@husteen.com')
+        self.assertTrue(raced.check_password('other'))
+        self.assertFalse(Product.objects.filter(user_id=raced).exists())
+
+    def test_onboard_users_command_hashes_in_process_pool(self):
+        """Test the command onboards JSON lines using worker processes"""
+        if multiprocessing.current_process().daemon:
+            self.skipTest('parallel test workers cannot start processes')
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl',
+                                         delete=False) as stream:
+            for number in range(3):
+                stream.write('{"email": "cmd%s@husteen.com", '
+                             '"password": "test@test123", '
+                             '"first_name": "Husteen", "last_name": "Smith", '
+                             '"phone_number": "0703"}\n' % number)
+        self.addCleanup(os.remove, stream.name)
+
+        out = StringIO()
+        call_command('onboard_users', stream.name, '--workers', '1',
+                     stdout=out)
+
+        self.assertIn('Created 3 users, skipped 0.', out.getvalue())
+        user = get_user_model().objects.get(email='cmd2@husteen.com')
+        self.assertTrue(user.check_password('test@test123'))
+
+
+@override_settings(RESPONSE_CACHE={'ALIAS': 'default', 'TIMEOUT': 0})
+class cachedTokenAuthenticationTest(TestCase):
+    """Test token lookups are cached and invalidated"""
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
+            email='cached@husteen.com',
+            password='password@123',
+            last_name='Smith',
+            phone_number='07033562534',
+            first_name='Husteen'
+        )
+        cls.token = Token.objects.create(user=cls.user)
+
+    def setUp(self):
+        token_cache.clear()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+    def test_repeated_requests_skip_auth_query(self):
+        """Test only the first request looks the token up"""
+        with self.assertNumQueries(4):
+            res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        with self.assertNumQueries(3):
+            res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['email'], self.user.email)
+
+    @override_settings(TOKEN_AUTH_CACHE={'MAX_SIZE': 10, 'TTL': 60,
+                                         'SHARED_CACHE': 'default'})
+    def test_shared_cache_tier(self):
+        """Test the shared cache answers when the local tier is cold"""
+        self.client.get(ME_URL)
+        token_cache.clear()
+
+        with self.assertNumQueries(3):
+            res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        self.user.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        token_cache.clear()
+        res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @override_settings(TOKEN_AUTH_CACHE={'MAX_SIZE': 10, 'TTL': 60,
+                                         'SHARED_CACHE': 'default'})
+    def test_invalidation_reaches_other_processes(self):
+        """Test a local entry is revoked by another process' invalidation"""
+        self.client.get(ME_URL)
+        self.assertEqual(len(token_cache), 1)
+
+        # another process deactivates the user: only the shared tier and
+        # the database change, the local entry here is left in place
+        get_user_model().objects.filter(pk=self.user.pk).update(
+            is_active=False)
+        caches['default'].delete(version_cache_key(self.token.key))
+
+        res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_cached_users_are_fresh_instances(self):
+        """Test requests never share a cached user instance"""
+        authentication = CachedTokenAuthentication()
+        first, _ = authentication.authenticate_credentials(self.token.key)
+        second, _ = authentication.authenticate_credentials(self.token.key)
+
+        self.assertEqual(first, second)
+        self.assertIsNot(first, second)
+        self.assertIsNot(first._state, second._state)
+        self.assertFalse(first._state.adding)
+
+    def test_deactivated_user_is_rejected(self):
+        """Test deactivating a user drops the cached lookup on commit"""
+        self.client.get(ME_URL)
+        self.user.is_active = False
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.user.save()
+        self.assertEqual(len(token_cache), 1)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(len(token_cache), 0)
+
+        res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deleted_token_is_rejected(self):
+        """Test deleting a token drops the cached lookup"""
+        self.client.get(ME_URL)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.token.delete()
+
+        res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
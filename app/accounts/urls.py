@@ -6,6 +6,8 @@ app_name = 'users'
 
 urlpatterns = [
      path('create/', views.CreateUserView.as_view(), name='create'),
+     path('create/bulk/', views.BulkCreateUserView.as_view(),
+          name='bulk-create'),
      path('token/', views.CreateTokenView.as_view(), name='token'),
      path('update/', views.ManageUserView.as_view(), name='update'),
      path('create-admin/', views.CreateAdminUserView.as_view(),
@@ -1,19 +1,30 @@
+from itertools import islice
+import os
+
+from django.conf import settings
 from rest_framework import generics
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import JSONParser, MultiPartParser
+from rest_framework.response import Response
+from rest_framework.authtoken.models import Token
 from rest_framework.authtoken.views import ObtainAuthToken
-from rest_framework.authentication import TokenAuthentication
+from accounts.authentication import CachedTokenAuthentication
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from accounts.serializers import (UserSerializer,
                                   ListUserSerializer,
                                   AuthTokenSerializer,
                                   AdminUserSerializer)
-from utils.renderers import CustomRenderer
+from utils.cache import CachedResponseMixin
+from utils.renderers import CustomRenderer, FastCustomRenderer
+from accounts.credentials import make_refresh_credential
 from accounts.models import User
+from accounts.onboarding import onboard_users, read_rows
 from products.models import Product
 
 
 class CreateUserView(generics.CreateAPIView):
     """Create a new user in the system."""
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated, IsAdminUser)
     serializer_class = UserSerializer
     renderer_classes = [CustomRenderer]
@@ -27,9 +38,46 @@ class CreateUserView(generics.CreateAPIView):
         return user
 
 
+class BulkCreateUserView(generics.GenericAPIView):
+    """Onboard many users from a CSV or JSON upload or a JSON list.
+
+    At most ONBOARDING_MAX_ROWS rows are accepted per request.
+    """
+    authentication_classes = (CachedTokenAuthentication,)
+    permission_classes = (IsAuthenticated, IsAdminUser)
+    parser_classes = (JSONParser, MultiPartParser)
+    renderer_classes = [CustomRenderer]
+
+    def get_rows(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            if not isinstance(request.data, list):
+                raise ValidationError(
+                    {'file': ['Upload a file or send a JSON list.']})
+            return request.data
+
+        extension = os.path.splitext(upload.name)[1].lower()
+        if extension not in ('.csv', '.json', '.jsonl'):
+            raise ValidationError(
+                {'file': ['Only .csv, .json and .jsonl files are supported.']})
+        return read_rows(upload, extension.lstrip('.'))
+
+    def post(self, request, *args, **kwargs):
+        limit = settings.ONBOARDING_MAX_ROWS
+        rows = list(islice(self.get_rows(request), limit + 1))
+        if len(rows) > limit:
+            raise ValidationError({'file': [
+                'At most %d rows are onboarded per request, use the '
+                'onboard_users command for larger files.' % limit]})
+        # Passwords are hashed on the request thread: a process pool per
+        # request is too costly for a web worker.
+        report = onboard_users(rows, workers=0)
+        return Response(report.as_dict())
+
+
 class CreateAdminUserView(generics.CreateAPIView):
     " ""Create a new user in the system."""
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated, IsAdminUser)
     serializer_class = AdminUserSerializer
     renderer_classes = [CustomRenderer]
@@ -48,32 +96,52 @@ class CreateTokenView(ObtainAuthToken):
     serializer_class = AuthTokenSerializer
     renderer_classes = [CustomRenderer]
 
+    def post(self, request, *args, **kwargs):
+        """Return the user's token and a refresh credential for it"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        token = serializer.validated_data.get('token')
+        if token is None:
+            token, created = Token.objects.get_or_create(
+                user=serializer.validated_data['user'])
+        return Response({'token': token.key,
+                         'refresh': make_refresh_credential(token)})
+
 
-class ManageUserView(generics.RetrieveUpdateAPIView):
+class ManageUserView(CachedResponseMixin, generics.RetrieveUpdateAPIView):
     """Manage the authenticated user"""
     serializer_class = ListUserSerializer
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
     renderer_classes = [CustomRenderer]
 
     def get_object(self):
         """Retrieve and return authenticated user"""
-        return self.request.user
+        users = User.objects.with_related().with_transaction_summary()
+        return users.get(pk=self.request.user.pk)
 
 
 class AdminManageUserDetail(generics.RetrieveUpdateDestroyAPIView):
     """Manage data in the database"""
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated, IsAdminUser)
     queryset = User.objects.all().order_by('-id')
     serializer_class = ListUserSerializer
     renderer_classes = [CustomRenderer]
 
+    def get_queryset(self):
+        users = User.objects.with_related().with_transaction_summary()
+        return users.order_by('-id')
+
 
 class ListUserAPIView(generics.ListAPIView):
     """Manage data in the database"""
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated, IsAdminUser)
     queryset = User.objects.filter(is_superuser=False).order_by('-id')
     serializer_class = ListUserSerializer
-    renderer_classes = [CustomRenderer]
+    renderer_classes = [FastCustomRenderer]
+
+    def get_queryset(self):
+        users = User.objects.filter(is_superuser=False).with_related()
+        return users.with_transaction_summary().order_by('-id')
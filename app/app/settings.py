@@ -12,6 +12,11 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 
 import os
 
+from app.database import (caches_from_env,
+                          database_from_env,
+                          replicas_from_env,
+                          sqlite_pragmas_from_env)
+
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -44,10 +49,14 @@ INSTALLED_APPS = [
     'django_filters',
     'products',
     'transactions',
+    'usage',
+    'utils',
 ]
 
 MIDDLEWARE = [
+    'utils.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'utils.routers.ReplicaRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -75,18 +84,25 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'app.wsgi.application'
+ASGI_APPLICATION = 'app.asgi.application'
 
 
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
+# Configured from DATABASE_URL and friends, see app/database.py.
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
+    'default': database_from_env(os.environ,
+                                 os.path.join(BASE_DIR, 'db.sqlite3')),
+    **replicas_from_env(os.environ),
 }
 
+DATABASE_ROUTERS = ['utils.routers.ReplicaRouter']
+
+
+# PRAGMAs run by utils.signals on every new SQLite connection.
+SQLITE_PRAGMAS = sqlite_pragmas_from_env(os.environ)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -106,6 +122,25 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+PASSWORD_HASHERS = [
+    'accounts.hashers.ConfigurablePBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+
+# PBKDF2 iterations for new and rehashed passwords, weaker existing hashes
+# are upgraded on the next successful login
+PASSWORD_HASH_ITERATIONS = 390000
+
+# Hashes passwords with a single iteration and onboards users without
+# worker processes while testing, see utils.test_runner.TEST_SETTINGS
+TEST_RUNNER = 'utils.test_runner.TestRunner'
+
+# Lifetime in seconds of the refresh credential issued with auth tokens
+REFRESH_CREDENTIAL_MAX_AGE = 60 * 60 * 24 * 30
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/2.2/topics/i18n/
@@ -148,3 +183,95 @@ REST_FRAMEWORK = {
         'rest_framework.renderers.BrowsableAPIRenderer',
     ],
 }
+
+# Number of latest transactions embedded in the nested user payload
+USER_TRANSACTION_PREVIEW_LIMIT = 10
+
+# Processes used by the onboard_users command to hash passwords, None
+# uses every CPU and 0 hashes in the command's process
+ONBOARDING_HASH_WORKERS = None
+
+# Rows accepted per bulk onboarding request. Each password takes a full
+# PBKDF2 hash on the request thread, larger files go to onboard_users.
+ONBOARDING_MAX_ROWS = 100
+
+# Configured from CACHE_URL, see app/database.py.
+CACHES = caches_from_env(os.environ)
+
+# Alias of the cache shared by every process, None without CACHE_URL
+SHARED_CACHE = 'shared' if 'shared' in CACHES else None
+
+# Reads go to one of REPLICAS, except for clients that sent a write in
+# the last STICKY_SECONDS, remembered in the CACHE entry of CACHES. The
+# next request may reach another process, so a system check requires a
+# shared cache when there are replicas.
+REPLICA_ROUTING = {
+    'REPLICAS': [alias for alias in DATABASES if alias != 'default'],
+    'STICKY_SECONDS': 5,
+    'CACHE': SHARED_CACHE or 'default',
+}
+
+# Rendered GET responses cached per user by utils.cache.CachedResponseMixin.
+# A TIMEOUT of 0 disables the cache. Invalidations must reach every
+# process, so it is only enabled with a shared cache; a system check
+# refuses per-process caches.
+RESPONSE_CACHE = {
+    'ALIAS': SHARED_CACHE or 'default',
+    'TIMEOUT': 300 if SHARED_CACHE else 0,
+}
+
+# Token to user lookups cached by accounts.authentication. SHARED_CACHE
+# names an entry of CACHES used as a second tier shared by processes, so
+# that deleted tokens and deactivated users are revoked in all of them at
+# once. Without it other processes keep a revoked credential for up to
+# TTL seconds, hence the short default.
+TOKEN_AUTH_CACHE = {
+    'MAX_SIZE': 10000,
+    'TTL': 60 if SHARED_CACHE else 1,
+    'SHARED_CACHE': SHARED_CACHE,
+}
+
+# Payment providers the reconcile_payments command can verify against.
+PAYMENT_PROVIDERS = {
+    'paystack': 'transactions.reconciliation.PaystackProvider',
+    'fake': 'transactions.reconciliation.FakeProvider',
+}
+
+# reconcile_payments defaults. Transactions younger than MIN_AGE seconds
+# may still be in checkout and are left alone. CONCURRENCY is also the
+# number of threads PaystackProvider blocks on its HTTP calls.
+RECONCILIATION = {
+    'PROVIDER': 'paystack',
+    'BATCH_SIZE': 500,
+    'CONCURRENCY': 50,
+    'MIN_AGE': 600,
+}
+
+PAYSTACK = {
+    'SECRET_KEY': os.environ.get('PAYSTACK_SECRET_KEY', ''),
+    'BASE_URL': 'https://api.paystack.co',
+    'TIMEOUT': 10,
+}
+
+# Prometheus endpoint of utils.metrics. Scrapers must send the TOKEN as
+# "Authorization: Bearer <TOKEN>". Without one the endpoint is only
+# served when DEBUG is on.
+METRICS = {
+    'TOKEN': os.environ.get('METRICS_TOKEN', ''),
+}
+
+# Readings accepted per ingest request and folded into the rollups per
+# transaction by `rollup_usage`. NDJSON streams are written
+# INGEST_BATCH_SIZE readings at a time with at most INGEST_QUEUE_BATCHES
+# batches waiting for the writer. Lines longer than STREAM_MAX_LINE_BYTES
+# are rejected and request bodies are read up to STREAM_MAX_BYTES once
+# decompressed.
+USAGE = {
+    'INGEST_MAX_READINGS': 5000,
+    'ROLLUP_BATCH_SIZE': 50000,
+    'INGEST_BATCH_SIZE': 5000,
+    'INGEST_QUEUE_BATCHES': 4,
+    'STREAM_MAX_READINGS': 1000000,
+    'STREAM_MAX_LINE_BYTES': 4096,
+    'STREAM_MAX_BYTES': 256 * 1024 * 1024,
+}
@@ -19,6 +19,7 @@ from django.conf import settings
 from django.conf.urls.static import static
 
 
+from utils.metrics import metrics_view
 from drf_yasg import openapi
 from drf_yasg.views import get_schema_view as swagger_get_schema_view
 
@@ -36,6 +37,8 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/accounts/', include('accounts.urls')),
     path('api/transactions/', include('transactions.urls')),
+    path('api/usage/', include('usage.urls')),
+    path('metrics', metrics_view, name='metrics'),
     path('swagger/schema/', schema_view.with_ui(
         'swagger', cache_timeout=0),
          name="swagger-schema"),
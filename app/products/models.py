@@ -12,7 +12,7 @@ class Product(models.Model):
     user_id = models.ForeignKey(User, on_delete=models.CASCADE,
                                 related_name='product')
     created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
-        return self.unit_in_hours
+        return str(self.unit_in_hours)
@@ -1,8 +1,10 @@
 from rest_framework import serializers
 from products.models import Product
+from utils.metrics import TimedRepresentationMixin
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(TimedRepresentationMixin,
+                        serializers.ModelSerializer):
     """Product Serializer objects"""
 
     class Meta:
@@ -0,0 +1,10 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from products.models import Product
+from utils.cache import invalidate_scopes
+
+
+@receiver(post_save, sender=Product)
+def invalidate_product_responses(sender, instance, **kwargs):
+    """Drop cached responses of the user owning the product"""
+    invalidate_scopes('user:%s' % instance.user_id_id)
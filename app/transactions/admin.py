@@ -2,5 +2,30 @@ from django.contrib import admin
 from transactions import models
 
 
+class TransactionAdmin(admin.ModelAdmin):
+    """Transactions with the fields counted in the ledgers read-only.
+
+    The ledgers are only updated by `transactions.services`. Rows changed
+    by other means need `python manage.py rebuild_ledgers`.
+    """
+    list_display = ['reference', 'user_id', 'status', 'amount',
+                    'created_at']
+    readonly_fields = ['user_id', 'status', 'amount', 'is_active',
+                       'purchased_hour', 'created_at']
+
+
+class LedgerAdmin(admin.ModelAdmin):
+    """Ledgers are derived from the transactions, see `rebuild_ledgers`"""
+    list_display = ['user_id', 'transaction_count', 'pending_count',
+                    'success_count', 'total_amount']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
 # Register your models here.
-admin.site.register(models.Transaction)
+admin.site.register(models.Transaction, TransactionAdmin)
+admin.site.register(models.Ledger, LedgerAdmin)
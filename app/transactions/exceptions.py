@@ -5,3 +5,9 @@ class TransactionValidatedAlready(APIException):
     status_code = 400
     default_detail = "Transaction has already been validated."
     default_code = "transaction_validated_already"
+
+
+class TransactionFailed(APIException):
+    status_code = 400
+    default_detail = "Transaction has failed and cannot be validated."
+    default_code = "transaction_failed"
@@ -0,0 +1,83 @@
+from decimal import Decimal
+import csv
+import datetime
+import json
+
+from transactions.models import Transaction
+
+EXPORT_FIELDS = ('id',
+                 'reference',
+                 'user_id',
+                 'product_id',
+                 'status',
+                 'type',
+                 'amount',
+                 'payment_channel',
+                 'source',
+                 'is_active',
+                 'purchased_hour',
+                 'created_at',
+                 'updated_at')
+EXPORT_CHUNK_SIZE = 2000
+
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+class Echo:
+    """File-like object handing back what is written to it"""
+
+    def write(self, value):
+        return value
+
+
+def export_rows(user_id=None, status=None, created_after=None,
+                created_before=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """Iterate matching transactions as tuples of `EXPORT_FIELDS`.
+
+    Rows are fetched `chunk_size` at a time in id order, so memory use
+    does not depend on how many rows match.
+    """
+    queryset = Transaction.objects.order_by('id')
+    if user_id is not None:
+        queryset = queryset.filter(user_id=user_id)
+    if status is not None:
+        queryset = queryset.filter(status=status)
+    if created_after is not None:
+        queryset = queryset.filter(created_at__gte=created_after)
+    if created_before is not None:
+        queryset = queryset.filter(created_at__lt=created_before)
+    return queryset.values_list(*EXPORT_FIELDS).iterator(
+        chunk_size=chunk_size)
+
+
+def encode_value(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return value
+
+
+def iter_ndjson(rows):
+    """Yield one JSON object per row, newline terminated"""
+    for row in rows:
+        yield json.dumps(
+            dict(zip(EXPORT_FIELDS, map(encode_value, row))),
+            separators=(',', ':')) + '\n'
+
+
+def iter_csv(rows):
+    """Yield a CSV header followed by one line per row"""
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        yield writer.writerow(map(encode_value, row))
+
+
+def iter_export(rows, output):
+    if output == 'csv':
+        return iter_csv(rows)
+    return iter_ndjson(rows)
@@ -0,0 +1,57 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.urls import reverse
+from rest_framework.test import APIClient
+from products.models import Product
+from utils.benchmark import benchmark_database, timer
+
+
+class Command(BaseCommand):
+    """Compare single and bulk transaction creation throughput"""
+    help = "Benchmark the single and bulk transaction create endpoints."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=20000,
+                            help='Transactions created through bulk create.')
+        parser.add_argument('--batch', type=int, default=5000,
+                            help='Transactions per bulk create request.')
+        parser.add_argument('--single-rows', type=int, default=500,
+                            help='Transactions created one per request.')
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            user = get_user_model().objects.create_user(
+                email='bench@husteen.com', password='password@123')
+            Product.objects.create(user_id=user)
+            client = APIClient()
+            client.force_authenticate(user)
+
+            self.report('single', options['single_rows'],
+                        self.run_single(client, options['single_rows']))
+            self.report('bulk', options['rows'],
+                        self.run_bulk(client, options['rows'],
+                                      options['batch']))
+
+    def run_single(self, client, rows):
+        url = reverse('create-transaction')
+        payload = {'amount': 100000, 'payment_channel': 'paystack'}
+        with timer() as result:
+            for _ in range(rows):
+                client.post(url, payload, format='json')
+        return result['elapsed']
+
+    def run_bulk(self, client, rows, batch):
+        url = reverse('bulk-create-transaction')
+        with timer() as result:
+            for start in range(0, rows, batch):
+                payload = [
+                    {'amount': 100000, 'payment_channel': 'paystack'}
+                    for _ in range(min(batch, rows - start))
+                ]
+                res = client.post(url, payload, format='json')
+                assert res.status_code == 201, res.content
+        return result['elapsed']
+
+    def report(self, name, rows, elapsed):
+        self.stdout.write('%-8s %8d rows %8.2fs %10.0f rows/s' % (
+            name, rows, elapsed, rows / elapsed if elapsed else 0))
@@ -0,0 +1,104 @@
+import logging
+import threading
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+from app.database import OPTIMIZED_SQLITE_PRAGMAS
+from products.models import Product
+from utils.benchmark import benchmark_database, percentile, timer
+
+
+class Command(BaseCommand):
+    """Compare concurrent transaction creation across database modes"""
+    help = "Benchmark concurrent CreateTransactionAPIView writes with the " \
+           "plain and optimized SQLite modes, or the configured server " \
+           "database."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--requests', type=int, default=100,
+                            help='Transactions created by each thread.')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            self.run_mode(connection.vendor, {}, options)
+            return
+
+        settings_dict = connections.settings[DEFAULT_DB_ALIAS]
+        old_conn_max_age = settings_dict['CONN_MAX_AGE']
+        modes = [
+            ('sqlite', {}, 0),
+            ('sqlite-optimized', OPTIMIZED_SQLITE_PRAGMAS, 60),
+        ]
+        try:
+            for name, pragmas, conn_max_age in modes:
+                settings_dict['CONN_MAX_AGE'] = conn_max_age
+                self.run_mode(name, pragmas, options)
+        finally:
+            settings_dict['CONN_MAX_AGE'] = old_conn_max_age
+
+    def run_mode(self, name, pragmas, options):
+        # concurrent writers need a file, not the in-memory test DB
+        with override_settings(SQLITE_PRAGMAS=pragmas), \
+                benchmark_database(file_backed=True):
+            clients = [self.build_client(number)
+                       for number in range(options['threads'])]
+            connections.close_all()
+            latencies, errors, elapsed = self.run_clients(
+                clients, options['requests'])
+
+        self.stdout.write(
+            '%-18s %6d writes %5d errors %9.0f writes/s '
+            'p50 %7.2f ms p99 %7.2f ms' % (
+                name, len(latencies), errors,
+                len(latencies) / elapsed if elapsed else 0,
+                percentile(latencies, 50) * 1000,
+                percentile(latencies, 99) * 1000))
+
+    def build_client(self, number):
+        user = get_user_model().objects.create_user(
+            email='bench%d@husteen.com' % number, password='password@123')
+        Product.objects.create(user_id=user)
+        client = APIClient(raise_request_exception=False)
+        client.force_authenticate(user)
+        return client
+
+    def run_clients(self, clients, requests):
+        url = reverse('create-transaction')
+        payload = {'amount': 100000, 'payment_channel': 'paystack'}
+        latencies = []
+        errors = []
+        barrier = threading.Barrier(len(clients))
+
+        def write(client):
+            barrier.wait()
+            try:
+                for _ in range(requests):
+                    start = time.perf_counter()
+                    res = client.post(url, payload, format='json')
+                    if res.status_code == 201:
+                        latencies.append(time.perf_counter() - start)
+                    else:
+                        errors.append(res.status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=write, args=[client])
+                   for client in clients]
+        request_logger = logging.getLogger('django.request')
+        level = request_logger.level
+        request_logger.setLevel(logging.CRITICAL)
+        try:
+            with timer() as result:
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+        finally:
+            request_logger.setLevel(level)
+        return latencies, len(errors), result['elapsed']
@@ -0,0 +1,54 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from transactions.models import Transaction
+
+
+class Command(BaseCommand):
+    """Print the query plan of each transaction endpoint's queryset"""
+    help = "Run EXPLAIN on the querysets behind the transaction endpoints."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, default=1,
+                            help='User id used for per-customer queries.')
+        parser.add_argument('--reference', default='reference',
+                            help='Reference used for lookup queries.')
+        parser.add_argument('--days', type=int, default=30,
+                            help='Size of the reporting date range.')
+
+    def get_querysets(self, user, reference, days):
+        """Return (name, queryset) pairs matching the endpoint queries"""
+        end = timezone.now()
+        start = end - timedelta(days=days)
+        transactions = Transaction.objects.all()
+        return [
+            ('customer-transaction',
+             transactions.filter(user_id=user).order_by('-id')[:10]),
+            ('list-customer-transaction',
+             transactions.order_by('-id')[:10]),
+            ('list-customer-transaction?user_id',
+             transactions.filter(user_id=user).order_by('-id')[:10]),
+            ('retrieve-transaction',
+             transactions.filter(reference=reference)),
+            ('validate-transaction',
+             transactions.filter(reference=reference, is_active=False)),
+            ('pending-transactions',
+             transactions.filter(status='pending',
+                                 payment_channel='paystack').order_by('id')),
+            ('report-by-status',
+             transactions.filter(status='success',
+                                 created_at__range=(start, end))),
+            ('report-by-date',
+             transactions.filter(created_at__range=(start, end))),
+            ('list-user:recent-transactions',
+             transactions.filter(user_id__in=[user]).latest_per_user(10)),
+        ]
+
+    def handle(self, *args, **options):
+        querysets = self.get_querysets(
+            options['user'], options['reference'], options['days'])
+        for name, queryset in querysets:
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            self.stdout.write(queryset.explain())
+            self.stdout.write('')
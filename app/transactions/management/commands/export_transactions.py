@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+from transactions.export import EXPORT_CHUNK_SIZE, export_rows, iter_export
+from transactions.serializers import ExportTransactionSerializer
+
+
+class Command(BaseCommand):
+    """Stream transactions to a file or stdout"""
+    help = "Export transactions as NDJSON or CSV."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', dest='user_id', type=int)
+        parser.add_argument('--status')
+        parser.add_argument('--since', dest='created_after',
+                            help='Include transactions created at or '
+                                 'after this ISO 8601 datetime.')
+        parser.add_argument('--until', dest='created_before',
+                            help='Include transactions created before '
+                                 'this ISO 8601 datetime.')
+        parser.add_argument('--format', dest='output',
+                            choices=('ndjson', 'csv'), default='ndjson')
+        parser.add_argument('--output', dest='path', default='-',
+                            help="Destination file, '-' for stdout.")
+        parser.add_argument('--chunk-size', type=int,
+                            default=EXPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        serializer = ExportTransactionSerializer(data={
+            key: options[key]
+            for key in ('user_id', 'status', 'created_after',
+                        'created_before', 'output')
+            if options[key] is not None
+        })
+        if not serializer.is_valid():
+            raise CommandError(serializer.errors)
+        filters = dict(serializer.validated_data)
+        output = filters.pop('output')
+        lines = iter_export(
+            export_rows(chunk_size=options['chunk_size'], **filters), output)
+
+        if options['path'] == '-':
+            for line in lines:
+                self.stdout.write(line, ending='')
+        else:
+            with open(options['path'], 'w', newline='') as stream:
+                stream.writelines(lines)
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from transactions.models import Ledger
+from transactions.services import rebuild_ledgers
+
+
+class Command(BaseCommand):
+    """Recompute the per-user ledgers from the transactions table"""
+    help = "Rebuild every user's transaction ledger from scratch."
+
+    def handle(self, *args, **options):
+        rebuild_ledgers()
+        self.stdout.write(self.style.SUCCESS(
+            'Rebuilt %d ledgers.' % Ledger.objects.count()))
@@ -0,0 +1,54 @@
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from transactions.reconciliation import get_provider, reconcile
+
+
+class Command(BaseCommand):
+    """Settle pending transactions with the payment provider"""
+    help = "Verify pending transactions with the payment provider and " \
+           "validate or fail them."
+
+    def add_arguments(self, parser):
+        config = settings.RECONCILIATION
+        parser.add_argument('--provider', default=config['PROVIDER'],
+                            help='Name of an entry of PAYMENT_PROVIDERS.')
+        parser.add_argument('--channel', default='paystack')
+        parser.add_argument('--batch-size', type=int,
+                            default=config['BATCH_SIZE'])
+        parser.add_argument('--concurrency', type=int,
+                            default=config['CONCURRENCY'],
+                            help='Verifications in flight at once.')
+        parser.add_argument('--min-age', type=int, default=config['MIN_AGE'],
+                            help='Skip transactions younger than this many '
+                                 'seconds.')
+        parser.add_argument('--limit', type=int, default=None)
+
+    def handle(self, *args, **options):
+        try:
+            provider = get_provider(options['provider'],
+                                    concurrency=options['concurrency'])
+        except ImproperlyConfigured as exc:
+            raise CommandError(exc)
+        report = async_to_sync(self.reconcile)(provider, options)
+        self.stdout.write(self.style.SUCCESS(
+            'Checked %(checked)d transactions: %(validated)d validated, '
+            '%(failed)d failed, %(pending)d pending, %(errors)d errors.'
+            % report.as_dict()))
+
+    async def reconcile(self, provider, options):
+        try:
+            return await reconcile(provider,
+                                   channel=options['channel'],
+                                   batch_size=options['batch_size'],
+                                   concurrency=options['concurrency'],
+                                   min_age=options['min_age'],
+                                   limit=options['limit'],
+                                   progress=self.progress)
+        finally:
+            await provider.close()
+
+    def progress(self, report):
+        self.stdout.write('%d checked (%.0f/min)' % (report.checked,
+                                                     report.rate))
@@ -0,0 +1,57 @@
+# Generated by Django 4.1 on 2026-10-18 06:26
+
+from django.conf import settings
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, Max, Q, Sum
+import django.db.models.deletion
+
+
+def populate_ledgers(apps, schema_editor):
+    Transaction = apps.get_model('transactions', 'Transaction')
+    Ledger = apps.get_model('transactions', 'Ledger')
+
+    def total(field, status):
+        return Sum(field, filter=Q(status=status), default=Decimal(0))
+
+    aggregates = Transaction.objects.order_by().values('user_id').annotate(
+        transaction_count=Count('id'),
+        pending_count=Count('id', filter=Q(status='pending')),
+        success_count=Count('id', filter=Q(status='success')),
+        pending_amount=total('amount', 'pending'),
+        total_amount=total('amount', 'success'),
+        hours_purchased=total('purchased_hour', 'success'),
+        last_transaction_at=Max('created_at'),
+    )
+    Ledger.objects.bulk_create(
+        [Ledger(user_id_id=row.pop('user_id'), **row) for row in aggregates],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('transactions', '0002_transaction_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Ledger',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('transaction_count', models.IntegerField(default=0)),
+                ('pending_count', models.IntegerField(default=0)),
+                ('success_count', models.IntegerField(default=0)),
+                ('pending_amount', models.DecimalField(decimal_places=2, default=0.0, max_digits=14)),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0.0, max_digits=14)),
+                ('hours_purchased', models.DecimalField(decimal_places=2, default=0.0, max_digits=14)),
+                ('last_transaction_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user_id', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='ledger', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.RunPython(populate_ledgers, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,9 @@
+from decimal import Decimal
+
 from django.db import models
+from django.db.transaction import atomic
+from django.db.models import F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
 from products.models import Product
 from django.contrib.auth import get_user_model
 User = get_user_model()
@@ -16,6 +21,52 @@ TYPE_CHOICES = (
     ("debit", "debit"),
 )
 
+# Price of one hour of energy
+AMOUNT_PER_HOUR = 50000
+
+
+def purchased_hours(amount):
+    """Return the hours bought with `amount`"""
+    return round(Decimal(amount) / AMOUNT_PER_HOUR, 2)
+
+
+class TransactionQuerySet(models.QuerySet):
+
+    def delete(self):
+        """Delete the rows and remove them from their users' ledgers.
+
+        Transactions have no delete signal receivers, so that cascades
+        from users and products stay fast deletes.
+        """
+        from transactions.services import (invalidate_responses,
+                                           record_deleted)
+        with atomic():
+            deleted = list(self.order_by().only(
+                'user_id', 'reference', 'status', 'amount',
+                'purchased_hour'))
+            result = super().delete()
+            record_deleted(deleted)
+        invalidate_responses(deleted)
+        return result
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
+    def latest_per_user(self, limit):
+        """Restrict to each user's `limit` most recent transactions.
+
+        Rows are ranked among those matching the filters applied so far.
+        Each row is compared with the id of its user's `limit`-th most
+        recent row, read from the (user_id, id) index by a correlated
+        subquery, so a prefetch only reads the transactions of the users
+        it fetches and `limit` index entries for each of them.
+        """
+        cutoff = self.filter(user_id=OuterRef('user_id')).order_by(
+            '-id').values('id')[limit - 1:limit]
+        return self.alias(latest_cutoff=Coalesce(
+            Subquery(cutoff), 0, output_field=models.BigIntegerField(),
+        )).filter(id__gte=F('latest_cutoff'))
+
 
 class Transaction(models.Model):
     """Transactions Table"""
@@ -44,7 +95,61 @@ class Transaction(models.Model):
                                          decimal_places=2,
                                          default=0.00)
     created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = TransactionQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # customer history, newest first
+            models.Index(fields=['user_id', '-id'],
+                         name='transaction_user_recent_idx'),
+            models.Index(fields=['status', 'created_at'],
+                         name='transaction_status_created_idx'),
+            # latest change per customer for conditional GETs
+            models.Index(fields=['user_id', 'updated_at'],
+                         name='transaction_user_updated_idx'),
+            # reporting date ranges
+            models.Index(fields=['created_at'],
+                         name='transaction_created_idx'),
+            # pending rows awaiting validation, scanned per channel
+            models.Index(fields=['payment_channel', 'id'],
+                         name='transaction_pending_idx',
+                         condition=Q(status='pending')),
+        ]
 
     def __str__(self):
         return self.status
+
+    def delete(self, *args, **kwargs):
+        """Delete the transaction and remove it from the user's ledger"""
+        from transactions.services import (invalidate_responses,
+                                           record_deleted)
+        with atomic():
+            result = super().delete(*args, **kwargs)
+            record_deleted([self])
+        invalidate_responses([self])
+        return result
+
+
+class Ledger(models.Model):
+    """Per-user transaction aggregates, updated as transactions change"""
+    user_id = models.OneToOneField(User, on_delete=models.CASCADE,
+                                   related_name='ledger')
+    transaction_count = models.IntegerField(default=0)
+    pending_count = models.IntegerField(default=0)
+    success_count = models.IntegerField(default=0)
+    pending_amount = models.DecimalField(max_digits=14,
+                                         decimal_places=2,
+                                         default=0.00)
+    total_amount = models.DecimalField(max_digits=14,
+                                       decimal_places=2,
+                                       default=0.00)
+    hours_purchased = models.DecimalField(max_digits=14,
+                                          decimal_places=2,
+                                          default=0.00)
+    last_transaction_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return str(self.user_id_id)
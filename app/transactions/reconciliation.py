@@ -0,0 +1,233 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from urllib.parse import quote
+import asyncio
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from transactions.models import Transaction
+from transactions.services import (FAILED, VALIDATED,
+                                   fail_payments,
+                                   validate_payments)
+
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+except ImportError:
+    requests = None
+
+# Payment states reported by providers
+SUCCESS = 'success'
+PENDING = 'pending'
+ERROR = 'error'
+
+
+class ProviderError(Exception):
+    """The provider could not tell the state of a payment"""
+
+
+class FakeProvider:
+    """Provider answering from a dict, for tests and local runs.
+
+    `statuses` maps references to `SUCCESS`, `FAILED`, `PENDING` or
+    `ERROR`, other references get `default`. Every verification sleeps
+    `latency` seconds.
+    """
+
+    def __init__(self, concurrency=None, statuses=None, default=SUCCESS,
+                 latency=0):
+        self.statuses = statuses or {}
+        self.default = default
+        self.latency = latency
+        self.verified = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def verify(self, reference):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+        finally:
+            self.in_flight -= 1
+        self.verified.append(reference)
+        status = self.statuses.get(reference, self.default)
+        if status == ERROR:
+            raise ProviderError(reference)
+        return status
+
+    async def close(self):
+        pass
+
+
+class PaystackProvider:
+    """Paystack's verify endpoint called through one pooled session.
+
+    This is thread-pooled blocking I/O behind an asyncio interface, not
+    async I/O: requests blocks, so every `verify()` hands the call to a
+    thread pool of `concurrency` threads, one per kept-alive connection.
+    Requests in flight are bounded by the threads, and each one holds a
+    thread until Paystack answers or `PAYSTACK['TIMEOUT']` expires.
+    """
+    statuses = {
+        'success': SUCCESS,
+        'failed': FAILED,
+        'reversed': FAILED,
+    }
+
+    def __init__(self, concurrency=None):
+        if requests is None:
+            raise ImproperlyConfigured(
+                'PaystackProvider requires the requests package.')
+        config = settings.PAYSTACK
+        concurrency = concurrency or settings.RECONCILIATION['CONCURRENCY']
+        self.base_url = config['BASE_URL'].rstrip('/')
+        self.timeout = config['TIMEOUT']
+        self.session = requests.Session()
+        self.session.headers['Authorization'] = (
+            'Bearer %s' % config['SECRET_KEY'])
+        self.session.mount('https://', HTTPAdapter(
+            pool_connections=1, pool_maxsize=concurrency))
+        self.executor = ThreadPoolExecutor(concurrency)
+
+    async def verify(self, reference):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, self.fetch_status, reference)
+
+    def fetch_status(self, reference):
+        url = '%s/transaction/verify/%s' % (self.base_url,
+                                            quote(reference, safe=''))
+        try:
+            response = self.session.get(url, timeout=self.timeout)
+            response.raise_for_status()
+            data = response.json().get('data') or {}
+        except (requests.RequestException, ValueError) as exc:
+            raise ProviderError(str(exc))
+        return self.statuses.get(data.get('status'), PENDING)
+
+    async def close(self):
+        self.session.close()
+        self.executor.shutdown(wait=False)
+
+
+def get_provider(name, concurrency=None):
+    """Instantiate the provider registered as `name`"""
+    try:
+        path = settings.PAYMENT_PROVIDERS[name]
+    except KeyError:
+        raise ImproperlyConfigured('Unknown payment provider %r.' % name)
+    return import_string(path)(concurrency=concurrency)
+
+
+class ReconciliationReport:
+    """Running totals of a reconciliation run"""
+
+    def __init__(self):
+        self.checked = 0
+        self.validated = 0
+        self.failed = 0
+        self.pending = 0
+        self.errors = 0
+        self.started = time.perf_counter()
+
+    @property
+    def rate(self):
+        """Verifications per minute"""
+        elapsed = time.perf_counter() - self.started
+        return self.checked * 60 / elapsed if elapsed else 0.0
+
+    def as_dict(self):
+        return {
+            'checked': self.checked,
+            'validated': self.validated,
+            'failed': self.failed,
+            'pending': self.pending,
+            'errors': self.errors,
+        }
+
+
+def pending_references(channel, created_before, after, size):
+    """Return `(id, reference)` of the next pending rows of a channel"""
+    return list(Transaction.objects.filter(
+        status='pending',
+        payment_channel=channel,
+        id__gt=after,
+        created_at__lt=created_before,
+    ).order_by('id').values_list('id', 'reference')[:size])
+
+
+def apply_statuses(statuses, report):
+    """Validate and fail the references settled by the provider"""
+    settled = {SUCCESS: [], FAILED: []}
+    for reference, status in statuses.items():
+        if status in settled:
+            settled[status].append(reference)
+        elif status == ERROR:
+            report.errors += 1
+        else:
+            report.pending += 1
+
+    results = validate_payments(settled[SUCCESS])
+    report.validated += sum(
+        result == VALIDATED for result in results.values())
+    results = fail_payments(settled[FAILED])
+    report.failed += sum(result == FAILED for result in results.values())
+    report.checked += len(statuses)
+
+
+async def verify(provider, semaphore, reference):
+    async with semaphore:
+        try:
+            return await provider.verify(reference)
+        except ProviderError:
+            return ERROR
+
+
+async def reconcile(provider, channel='paystack', batch_size=None,
+                    concurrency=None, min_age=None, limit=None,
+                    progress=None):
+    """Verify pending transactions of `channel` against `provider`.
+
+    Pending rows older than `min_age` seconds are read `batch_size` at a
+    time in id order, so rows the provider still reports as pending are
+    not read again. Each batch is verified with at most `concurrency`
+    requests in flight, then settled with `validate_payments` and
+    `fail_payments`. The event loop only schedules verifications; how
+    they wait is up to the provider, `PaystackProvider` blocks a thread
+    per request. Stops after `limit` rows when given. `progress` is
+    called with the report after every batch.
+    """
+    config = settings.RECONCILIATION
+    batch_size = batch_size or config['BATCH_SIZE']
+    semaphore = asyncio.Semaphore(concurrency or config['CONCURRENCY'])
+    if min_age is None:
+        min_age = config['MIN_AGE']
+    created_before = timezone.now() - timedelta(seconds=min_age)
+
+    report = ReconciliationReport()
+    after = 0
+    while limit is None or report.checked < limit:
+        size = batch_size
+        if limit is not None:
+            size = min(size, limit - report.checked)
+        rows = await sync_to_async(pending_references)(
+            channel, created_before, after, size)
+        if not rows:
+            break
+        after = rows[-1][0]
+
+        references = [reference for _, reference in rows]
+        statuses = await asyncio.gather(*(
+            verify(provider, semaphore, reference)
+            for reference in references
+        ))
+        await sync_to_async(apply_statuses)(
+            dict(zip(references, statuses)), report)
+        if progress is not None:
+            progress(report)
+    return report
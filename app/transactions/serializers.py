@@ -1,8 +1,10 @@
 from rest_framework import serializers
-from transactions.models import Transaction
+from transactions.models import STATUS_CHOICES, Transaction
+from utils.metrics import TimedRepresentationMixin
 
 
-class TransactionSerializer(serializers.ModelSerializer):
+class TransactionSerializer(TimedRepresentationMixin,
+                            serializers.ModelSerializer):
     """Serializer for Transaction objects"""
 
     class Meta:
@@ -17,7 +19,8 @@ class TransactionSerializer(serializers.ModelSerializer):
                   'status')
 
 
-class ValidatePaymentSerializer(serializers.ModelSerializer):
+class ValidatePaymentSerializer(TimedRepresentationMixin,
+                                serializers.ModelSerializer):
     """Serializer for Validate Payment objects"""
 
     class Meta:
@@ -39,10 +42,42 @@ class ValidatePaymentSerializer(serializers.ModelSerializer):
                   'status')
 
 
-class RetrieveTransactionSerializer(serializers.ModelSerializer):
+class BulkValidatePaymentSerializer(serializers.Serializer):
+    """Serializer for a batch of payment references to validate"""
+    references = serializers.ListField(
+        child=serializers.CharField(max_length=255),
+        allow_empty=False,
+        max_length=1000,
+    )
+
+
+class RetrieveTransactionSerializer(TimedRepresentationMixin,
+                                    serializers.ModelSerializer):
     """Serializer to Retrieve Transaction objects"""
 
     class Meta:
         model = Transaction
         ordering = ['-id']
         fields = '__all__'
+
+
+class TransactionSummarySerializer(TimedRepresentationMixin,
+                                   serializers.Serializer):
+    """Serializer for the aggregated transactions of a user"""
+    count = serializers.IntegerField()
+    success_count = serializers.IntegerField()
+    pending_count = serializers.IntegerField()
+    total_amount = serializers.DecimalField(max_digits=14, decimal_places=2)
+    hours_purchased = serializers.DecimalField(max_digits=14,
+                                               decimal_places=2)
+    next = serializers.URLField(allow_null=True)
+
+
+class ExportTransactionSerializer(serializers.Serializer):
+    """Serializer for the transaction export filters"""
+    user_id = serializers.IntegerField(required=False)
+    status = serializers.ChoiceField(choices=STATUS_CHOICES, required=False)
+    created_after = serializers.DateTimeField(required=False)
+    created_before = serializers.DateTimeField(required=False)
+    output = serializers.ChoiceField(choices=('ndjson', 'csv'),
+                                     default='ndjson')
@@ -0,0 +1,391 @@
+from collections import defaultdict
+from decimal import Decimal
+from itertools import islice
+import uuid
+
+from django.db.models import Case, Count, F, Max, Q, Sum, Value, When
+from django.db.transaction import atomic
+from django.utils import timezone
+from products.models import Product
+from transactions.exceptions import (TransactionFailed,
+                                     TransactionValidatedAlready)
+from transactions.models import Ledger, Transaction, purchased_hours
+from utils.cache import invalidate_scopes
+
+CREATE_BATCH_SIZE = 500
+VALIDATE_CHUNK_SIZE = 500
+
+VALIDATED = 'validated'
+VALIDATED_ALREADY = 'validated_already'
+FAILED = 'failed'
+FAILED_ALREADY = 'failed_already'
+NOT_FOUND = 'not_found'
+
+# Ledger of a user without transactions
+EMPTY_LEDGER = {
+    'transaction_count': 0,
+    'pending_count': 0,
+    'success_count': 0,
+    'pending_amount': Decimal(0),
+    'total_amount': Decimal(0),
+    'hours_purchased': Decimal(0),
+    'last_transaction_at': None,
+}
+
+
+def create_transactions(user, items):
+    """Create pending transactions for `user` with bulk_create.
+
+    `items` are validated `TransactionSerializer` payloads. The product is
+    resolved once for the whole batch and rows are inserted in batches of
+    `CREATE_BATCH_SIZE`.
+    """
+    product = Product.objects.filter(
+        user_id=user.id).order_by('-id').first()
+    transactions = [
+        Transaction(user_id=user,
+                    product_id=product,
+                    reference=str(uuid.uuid4()),
+                    purchased_hour=purchased_hours(item['amount']),
+                    **item)
+        for item in items
+    ]
+    with atomic():
+        transactions = Transaction.objects.bulk_create(
+            transactions, batch_size=CREATE_BATCH_SIZE)
+        record_created(user.id, transactions)
+    invalidate_responses(transactions)
+    return transactions
+
+
+def validate_payment(transaction):
+    """Mark a pending transaction successful and credit its product.
+
+    The status change is a conditional UPDATE that only matches rows that
+    are still pending, so when several requests validate the same
+    reference only one of them credits the product, and failed payments
+    are never credited. Runs in two queries plus the ledger update.
+    """
+    now = timezone.now()
+    with atomic():
+        validated = Transaction.objects.filter(
+            pk=transaction.pk, is_active=False, status='pending'
+        ).update(status='success', is_active=True, updated_at=now)
+        if not validated:
+            if Transaction.objects.filter(pk=transaction.pk,
+                                          status='failed').exists():
+                raise TransactionFailed()
+            raise TransactionValidatedAlready()
+
+        Product.objects.filter(pk=transaction.product_id_id).update(
+            unit_in_hours=F('unit_in_hours') + transaction.purchased_hour,
+            updated_at=now)
+        record_validated([transaction])
+    invalidate_responses([transaction])
+
+    transaction.status = 'success'
+    transaction.is_active = True
+    transaction.updated_at = now
+    return transaction
+
+
+def invalidate_responses(transactions):
+    """Drop cached responses showing `transactions` or their owners.
+
+    Needed after queryset updates and bulk inserts, which do not send
+    `post_save`.
+    """
+    invalidate_scopes(*{
+        'user:%s' % transaction.user_id_id for transaction in transactions
+    }, *{
+        'transaction:%s' % transaction.reference
+        for transaction in transactions
+    })
+
+
+def bulk_increment(model, deltas, key='pk', **values):
+    """Add per-row deltas to numeric fields of many rows in one UPDATE.
+
+    `deltas` maps values of the unique `key` field to a dict of
+    `{field: delta}`. `values` are assigned to every updated row.
+    """
+    if not deltas:
+        return
+    fields = {field for changes in deltas.values() for field in changes}
+    updates = {}
+    for field in fields:
+        output_field = model._meta.get_field(field)
+        whens = [
+            When(**{key: value}, then=Value(changes[field]))
+            for value, changes in deltas.items() if field in changes
+        ]
+        updates[field] = F(field) + Case(*whens, default=Value(0),
+                                         output_field=output_field)
+    updates.update(values)
+    model.objects.filter(**{key + '__in': list(deltas)}).update(**updates)
+
+
+def credit_products(credits):
+    """Add hours to many products with a single UPDATE.
+
+    `credits` maps product ids to the hours to add to each of them.
+    """
+    bulk_increment(Product, {
+        pk: {'unit_in_hours': hours} for pk, hours in credits.items()
+    }, updated_at=timezone.now())
+
+
+def record_created(user_id, transactions):
+    """Add new pending transactions of one user to their ledger"""
+    if not transactions:
+        return
+    Ledger.objects.bulk_create([Ledger(user_id_id=user_id)],
+                               ignore_conflicts=True)
+    Ledger.objects.filter(user_id=user_id).update(
+        transaction_count=F('transaction_count') + len(transactions),
+        pending_count=F('pending_count') + len(transactions),
+        pending_amount=F('pending_amount') + sum(
+            Decimal(transaction.amount) for transaction in transactions),
+        last_transaction_at=max(
+            transaction.created_at for transaction in transactions),
+    )
+
+
+def record_validated(transactions):
+    """Move validated transactions from pending to success in the ledgers"""
+    deltas = {}
+    for transaction in transactions:
+        changes = deltas.setdefault(transaction.user_id_id, {
+            'pending_count': 0,
+            'success_count': 0,
+            'pending_amount': Decimal(0),
+            'total_amount': Decimal(0),
+            'hours_purchased': Decimal(0),
+        })
+        changes['pending_count'] -= 1
+        changes['success_count'] += 1
+        changes['pending_amount'] -= transaction.amount
+        changes['total_amount'] += transaction.amount
+        changes['hours_purchased'] += transaction.purchased_hour
+    bulk_increment(Ledger, deltas, key='user_id')
+
+
+def record_failed(transactions):
+    """Remove failed transactions from the pending totals of the ledgers"""
+    deltas = {}
+    for transaction in transactions:
+        changes = deltas.setdefault(transaction.user_id_id, {
+            'pending_count': 0,
+            'pending_amount': Decimal(0),
+        })
+        changes['pending_count'] -= 1
+        changes['pending_amount'] -= transaction.amount
+    bulk_increment(Ledger, deltas, key='user_id')
+
+
+def record_deleted(transactions):
+    """Remove deleted transactions from the ledgers of their users.
+
+    `last_transaction_at` is recomputed from the remaining transactions.
+    """
+    deltas = {}
+    for transaction in transactions:
+        changes = deltas.setdefault(transaction.user_id_id, {
+            'transaction_count': 0,
+            'pending_count': 0,
+            'success_count': 0,
+            'pending_amount': Decimal(0),
+            'total_amount': Decimal(0),
+            'hours_purchased': Decimal(0),
+        })
+        changes['transaction_count'] -= 1
+        if transaction.status == 'pending':
+            changes['pending_count'] -= 1
+            changes['pending_amount'] -= Decimal(transaction.amount)
+        elif transaction.status == 'success':
+            changes['success_count'] -= 1
+            changes['total_amount'] -= Decimal(transaction.amount)
+            changes['hours_purchased'] -= Decimal(transaction.purchased_hour)
+    bulk_increment(Ledger, deltas, key='user_id')
+    for user_id in deltas:
+        Ledger.objects.filter(user_id=user_id).update(
+            last_transaction_at=Transaction.objects.filter(
+                user_id=user_id).aggregate(Max('created_at'))[
+                    'created_at__max'])
+
+
+def ledger_totals():
+    """Return the ledger fields of each user computed from transactions"""
+    def total(field, status):
+        return Sum(field, filter=Q(status=status), default=Decimal(0))
+
+    return Transaction.objects.order_by().values('user_id').annotate(
+        transaction_count=Count('id'),
+        pending_count=Count('id', filter=Q(status='pending')),
+        success_count=Count('id', filter=Q(status='success')),
+        pending_amount=total('amount', 'pending'),
+        total_amount=total('amount', 'success'),
+        hours_purchased=total('purchased_hour', 'success'),
+        last_transaction_at=Max('created_at'),
+    )
+
+
+def rebuild_ledgers():
+    """Recompute every ledger from the transactions table"""
+    with atomic():
+        Ledger.objects.all().delete()
+        ledgers = (Ledger(user_id_id=row.pop('user_id'), **row)
+                   for row in ledger_totals().iterator())
+        while True:
+            batch = list(islice(ledgers, CREATE_BATCH_SIZE))
+            if not batch:
+                break
+            Ledger.objects.bulk_create(batch)
+
+
+def recount_ledgers(user_ids):
+    """Recompute the ledgers of `user_ids` with one aggregate query.
+
+    Used after deletes that remove transactions without loading them.
+    """
+    totals = {row.pop('user_id'): row
+              for row in ledger_totals().filter(user_id__in=user_ids)}
+    for user_id in user_ids:
+        Ledger.objects.filter(user_id=user_id).update(
+            **totals.get(user_id, EMPTY_LEDGER))
+
+
+def validate_payments(references):
+    """Validate many references with set-based queries.
+
+    Each chunk of references is handled in one transaction: one SELECT
+    locking the matching rows, one bulk status UPDATE, one grouped
+    product credit and one grouped ledger update. Returns a dict mapping
+    every reference to `VALIDATED`, `VALIDATED_ALREADY`, `FAILED` for
+    payments that failed, or `NOT_FOUND`.
+    """
+    references = list(dict.fromkeys(references))
+    results = dict.fromkeys(references, NOT_FOUND)
+
+    for start in range(0, len(references), VALIDATE_CHUNK_SIZE):
+        chunk = references[start:start + VALIDATE_CHUNK_SIZE]
+        while True:
+            try:
+                pending = validate_chunk(chunk, results)
+            except ChunkChanged:
+                continue
+            break
+        invalidate_responses(pending)
+
+    return results
+
+
+class ChunkChanged(Exception):
+    """Rows of a chunk were updated between its SELECT and UPDATE"""
+
+
+def lock_references(references, *fields):
+    """Return the transactions of `references` selected for update.
+
+    Only the fields needed to move them between statuses and `fields`
+    are loaded.
+    """
+    return list(Transaction.objects.select_for_update().filter(
+        reference__in=references
+    ).only('reference', 'status', 'is_active', 'user_id', 'amount',
+           *fields))
+
+
+def validate_chunk(chunk, results):
+    """Validate one chunk of `validate_payments` in a transaction.
+
+    `select_for_update()` is a no-op on SQLite, so a concurrent call may
+    validate some of the selected rows first. The conditional UPDATE then
+    matches fewer rows than were selected and the chunk is rolled back
+    with `ChunkChanged` to be selected again, instead of crediting
+    products for rows validated by the other call.
+    """
+    with atomic():
+        rows = lock_references(chunk, 'product_id', 'purchased_hour')
+
+        pending = []
+        credits = defaultdict(Decimal)
+        for transaction in rows:
+            if transaction.status == 'failed':
+                results[transaction.reference] = FAILED
+                continue
+            if transaction.is_active or transaction.status != 'pending':
+                results[transaction.reference] = VALIDATED_ALREADY
+                continue
+            results[transaction.reference] = VALIDATED
+            pending.append(transaction)
+            credits[transaction.product_id_id] += transaction.purchased_hour
+
+        if pending:
+            validated = Transaction.objects.filter(
+                pk__in=[transaction.pk for transaction in pending],
+                is_active=False, status='pending'
+            ).update(status='success', is_active=True,
+                     updated_at=timezone.now())
+            if validated != len(pending):
+                raise ChunkChanged()
+            credit_products(credits)
+            record_validated(pending)
+    return pending
+
+
+def fail_payments(references):
+    """Mark pending references as failed with set-based queries.
+
+    Mirrors `validate_payments`: only rows still pending are changed and
+    removed from their ledgers, and a chunk whose rows changed between
+    its SELECT and UPDATE is selected again. Returns a dict mapping every
+    reference to `FAILED`, `FAILED_ALREADY`, `VALIDATED_ALREADY` or
+    `NOT_FOUND`.
+    """
+    references = list(dict.fromkeys(references))
+    results = dict.fromkeys(references, NOT_FOUND)
+
+    for start in range(0, len(references), VALIDATE_CHUNK_SIZE):
+        chunk = references[start:start + VALIDATE_CHUNK_SIZE]
+        while True:
+            try:
+                pending = fail_chunk(chunk, results)
+            except ChunkChanged:
+                continue
+            break
+        invalidate_responses(pending)
+
+    return results
+
+
+def fail_chunk(chunk, results):
+    """Fail one chunk of `fail_payments` in a transaction.
+
+    Like `validate_chunk`, raises `ChunkChanged` when the conditional
+    UPDATE matches fewer rows than were selected as pending, so ledgers
+    are never decremented for rows another call changed.
+    """
+    with atomic():
+        rows = lock_references(chunk)
+
+        pending = []
+        for transaction in rows:
+            if transaction.status == 'failed':
+                results[transaction.reference] = FAILED_ALREADY
+                continue
+            if transaction.is_active or transaction.status != 'pending':
+                results[transaction.reference] = VALIDATED_ALREADY
+                continue
+            results[transaction.reference] = FAILED
+            pending.append(transaction)
+
+        if pending:
+            failed = Transaction.objects.filter(
+                pk__in=[transaction.pk for transaction in pending],
+                is_active=False, status='pending'
+            ).update(status='failed', updated_at=timezone.now())
+            if failed != len(pending):
+                raise ChunkChanged()
+            record_failed(pending)
+    return pending
@@ -0,0 +1,48 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from products.models import Product
+from transactions.models import Transaction
+from transactions.services import (invalidate_responses, record_created,
+                                   recount_ledgers)
+from utils.cache import invalidate_scopes
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=Transaction)
+def add_transaction_to_ledger(sender, instance, created, **kwargs):
+    """Count transactions saved one at a time in the user's ledger"""
+    if created:
+        record_created(instance.user_id_id, [instance])
+
+
+@receiver(post_save, sender=Transaction)
+def invalidate_transaction_responses(sender, instance, **kwargs):
+    invalidate_responses([instance])
+
+
+# Transactions have no delete receivers, which would turn the cascades
+# below into per-row deletes. Their own deletes update the ledgers in
+# TransactionQuerySet.delete() and Transaction.delete().
+@receiver(pre_delete, sender=User)
+def collect_user_transactions(sender, instance, **kwargs):
+    instance.cascaded_transactions = list(Transaction.objects.filter(
+        user_id=instance.pk).values_list('user_id', 'reference'))
+
+
+@receiver(pre_delete, sender=Product)
+def collect_product_transactions(sender, instance, **kwargs):
+    instance.cascaded_transactions = list(Transaction.objects.filter(
+        product_id=instance.pk).values_list('user_id', 'reference'))
+
+
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=Product)
+def remove_cascaded_transactions(sender, instance, **kwargs):
+    """Recount the ledgers and drop the responses of cascaded transactions"""
+    rows = getattr(instance, 'cascaded_transactions', [])
+    user_ids = {user_id for user_id, _ in rows}
+    recount_ledgers(user_ids)
+    invalidate_scopes(*{'user:%s' % user_id for user_id in user_ids},
+                      *{'transaction:%s' % reference for _, reference in rows})
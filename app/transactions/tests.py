@@ -1,13 +1,39 @@
-from django.test import TestCase
+from decimal import Decimal
+from io import StringIO
+import copy
+import csv
+import json
+from unittest import mock
+import threading
+import time
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection, connections
+from django.db.transaction import atomic
+from django.test import (Client, TestCase, TransactionTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
 from django.urls import reverse
+from rest_framework.authtoken.models import Token
 from rest_framework.test import APIClient
 from rest_framework import status
-from transactions.models import Transaction
+from transactions.models import Ledger, Transaction
 from products.models import Product
+from transactions import services
+from transactions.exceptions import TransactionValidatedAlready
+from transactions.reconciliation import (ERROR, FAILED, PENDING, SUCCESS,
+                                         FakeProvider, reconcile)
+from transactions.services import (fail_payments, validate_payment,
+                                   validate_payments)
+from utils.cache import invalidate_scopes, response_cache
 import uuid
 ref = uuid.uuid4().hex
 ref_2 = uuid.uuid4().hex
+# How long a thread retries validations failing on a locked database
+LOCK_RETRY_SECONDS = 10
 
 
 CREATE_TRANSACTION_URL = reverse('create-transaction')
@@ -15,6 +41,13 @@ VALIDATE_TRANSACTION_URL = reverse('validate-transaction', args=[ref])
 RETRIEVE_TRANSACTION_URL = reverse('retrieve-transaction', args=[ref])
 CUSTOMER_TRANSACTION_URL = reverse('customer-transaction')
 LIST_CUSTOMER_TRANSACTION_URL = reverse('list-customer-transaction')
+BULK_VALIDATE_TRANSACTION_URL = reverse('bulk-validate-transaction')
+BULK_CREATE_TRANSACTION_URL = reverse('bulk-create-transaction')
+EXPORT_TRANSACTION_URL = reverse('export-transaction')
+ASYNC_CREATE_TRANSACTION_URL = reverse('async-create-transaction')
+ASYNC_RETRIEVE_TRANSACTION_URL = reverse('async-retrieve-transaction',
+                                         args=[ref])
+ASYNC_CUSTOMER_TRANSACTION_URL = reverse('async-customer-transaction')
 
 
 # Create your tests here.
@@ -51,8 +84,9 @@ class publicTransactionApiTest(TestCase):
 
 class privateTransactionApiTest(TestCase):
     """Test the authorized Transaction API"""
-    def setUp(self):
-        self.user = get_user_model().objects.create_user(
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
             email='test@husteen.com',
             password='password@123',
             last_name='Smith',
@@ -62,14 +96,11 @@ class privateTransactionApiTest(TestCase):
             first_name='Husteen'
         )
 
-        self.client = APIClient()
-        self.client.force_authenticate(self.user)
-
-        self.product = Product.objects.create(
-            user_id=self.user,
+        cls.product = Product.objects.create(
+            user_id=cls.user,
         )
 
-        self.user_2 = get_user_model().objects.create_user(
+        cls.user_2 = get_user_model().objects.create_user(
             email='test2@husteen.com',
             password='password@123',
             last_name='Smith',
@@ -79,25 +110,31 @@ class privateTransactionApiTest(TestCase):
             first_name='Husteen'
         )
 
-        self.product_2 = Product.objects.create(
-            user_id=self.user_2,
+        cls.product_2 = Product.objects.create(
+            user_id=cls.user_2,
         )
 
-        self.transaction = Transaction.objects.create(
+        cls.transaction = Transaction.objects.create(
             amount=100000,
             payment_channel='paystack',
-            product_id=self.product,
-            user_id=self.user,
+            product_id=cls.product,
+            user_id=cls.user,
             reference=ref,
+            purchased_hour=2,
         )
-        self.transaction_2 = Transaction.objects.create(
+        cls.transaction_2 = Transaction.objects.create(
             amount=100000,
             payment_channel='paystack',
-            product_id=self.product,
-            user_id=self.user,
+            product_id=cls.product,
+            user_id=cls.user,
             reference=ref_2,
+            purchased_hour=3,
         )
 
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
     def test_validate_users_transactions(self):
         """Test validate users transactions"""
         res = self.client.put(VALIDATE_TRANSACTION_URL)
@@ -106,6 +143,36 @@ class privateTransactionApiTest(TestCase):
         self.assertTrue(res.data['is_active'])
         self.assertEqual(res.data['reference'], ref)
 
+    def test_validate_transaction_once(self):
+        """Test a validated transaction cannot be validated again"""
+        with self.assertNumQueries(6):
+            self.client.put(VALIDATE_TRANSACTION_URL)
+        res = self.client.put(VALIDATE_TRANSACTION_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.unit_in_hours, Decimal('2.00'))
+
+    def test_bulk_validate_transactions(self):
+        """Test validating a batch of references in a fixed query count"""
+        self.client.put(VALIDATE_TRANSACTION_URL)
+        payload = {'references': [ref, ref_2, 'missing']}
+        with self.assertNumQueries(6):
+            res = self.client.post(BULK_VALIDATE_TRANSACTION_URL, payload,
+                                   format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, [
+            {'reference': ref, 'result': 'validated_already'},
+            {'reference': ref_2, 'result': 'validated'},
+            {'reference': 'missing', 'result': 'not_found'},
+        ])
+        self.transaction_2.refresh_from_db()
+        self.assertTrue(self.transaction_2.is_active)
+        self.assertEqual(self.transaction_2.status, 'success')
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.unit_in_hours, Decimal('5.00'))
+
     def test_create_transactions_successful(self):
         """Test create transaction successful"""
         payload = {
@@ -117,6 +184,149 @@ class privateTransactionApiTest(TestCase):
         self.assertEqual(res.data['payment_channel'],
                          payload['payment_channel'])
 
+    def test_bulk_create_transactions(self):
+        """Test creating a batch of transactions in a fixed query count"""
+        payload = [
+            {'amount': 100000, 'payment_channel': 'paystack'},
+            {'amount': 25000, 'payment_channel': 'paystack'},
+            {'amount': 50000, 'payment_channel': 'bank'},
+        ]
+        with self.assertNumQueries(6):
+            res = self.client.post(BULK_CREATE_TRANSACTION_URL, payload,
+                                   format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([t['purchased_hour'] for t in res.data],
+                         ['2.00', '0.50', '1.00'])
+        self.assertEqual(len({t['reference'] for t in res.data}), 3)
+        self.assertEqual(Transaction.objects.filter(
+            user_id=self.user, product_id=self.product,
+            status='pending').count(), 5)
+
+    def test_bulk_create_transactions_requires_items(self):
+        """Test an empty batch is rejected"""
+        res = self.client.post(BULK_CREATE_TRANSACTION_URL, [],
+                               format='json')
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_ledger_tracks_created_and_validated_transactions(self):
+        """Test the ledger is updated incrementally and can be rebuilt"""
+        self.client.post(BULK_CREATE_TRANSACTION_URL,
+                         [{'amount': 50000, 'payment_channel': 'paystack'}],
+                         format='json')
+        self.client.put(VALIDATE_TRANSACTION_URL)
+        self.client.post(BULK_VALIDATE_TRANSACTION_URL,
+                         {'references': [ref_2]}, format='json')
+
+        fields = ('transaction_count', 'pending_count', 'success_count',
+                  'pending_amount', 'total_amount', 'hours_purchased',
+                  'last_transaction_at')
+        expected = (3, 1, 2, Decimal('50000.00'), Decimal('200000.00'),
+                    Decimal('5.00'),
+                    Transaction.objects.latest('id').created_at)
+        ledger = Ledger.objects.values_list(*fields).get(user_id=self.user)
+        self.assertEqual(ledger, expected)
+
+        call_command('rebuild_ledgers', stdout=StringIO())
+        ledger = Ledger.objects.values_list(*fields).get(user_id=self.user)
+        self.assertEqual(ledger, expected)
+
+    def test_failed_payment_cannot_be_validated(self):
+        """Test a failed reference is neither credited nor moved in the
+        ledger by single or bulk validation"""
+        fail_payments([ref, ref_2])
+        ledger = Ledger.objects.values_list(
+            'pending_count', 'success_count', 'pending_amount').get(
+                user_id=self.user)
+
+        res = self.client.put(VALIDATE_TRANSACTION_URL)
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        res = self.client.post(BULK_VALIDATE_TRANSACTION_URL,
+                               {'references': [ref_2]}, format='json')
+        self.assertEqual(res.data, [{'reference': ref_2,
+                                     'result': 'failed'}])
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.unit_in_hours, Decimal('0.00'))
+        self.assertEqual(Transaction.objects.filter(
+            status='failed').count(), 2)
+        self.assertEqual(Ledger.objects.values_list(
+            'pending_count', 'success_count', 'pending_amount').get(
+                user_id=self.user), ledger)
+        self.assertEqual(ledger[:2], (0, 0))
+
+    def test_ledger_tracks_deleted_transactions(self):
+        """Test deleting transactions keeps the ledger equal to a rebuild"""
+        self.client.put(VALIDATE_TRANSACTION_URL)
+        Transaction.objects.get(reference=ref).delete()
+
+        fields = ('transaction_count', 'pending_count', 'success_count',
+                  'pending_amount', 'total_amount', 'hours_purchased',
+                  'last_transaction_at')
+        ledger = Ledger.objects.values_list(*fields).get(user_id=self.user)
+        self.assertEqual(ledger[:3], (1, 1, 0))
+        call_command('rebuild_ledgers', stdout=StringIO())
+        self.assertEqual(
+            Ledger.objects.values_list(*fields).get(user_id=self.user),
+            ledger)
+
+        Transaction.objects.filter(user_id=self.user).delete()
+        self.assertEqual(
+            Ledger.objects.values_list(*fields).get(user_id=self.user),
+            (0, 0, 0, Decimal(0), Decimal(0), Decimal(0), None))
+
+    def test_cascades_recount_ledgers_in_constant_queries(self):
+        """Test deleting a user or product does not load its transactions
+        one by one and leaves ledgers equal to a rebuild"""
+        def add_transactions(user, product, count):
+            Transaction.objects.bulk_create([
+                Transaction(user_id=user, product_id=product, amount=50000,
+                            reference=uuid.uuid4().hex, purchased_hour=1)
+                for _ in range(count)
+            ])
+
+        def delete_queries(count):
+            user = get_user_model().objects.create_user(
+                email='cascade%d@husteen.com' % count,
+                password='password@123')
+            add_transactions(user, Product.objects.create(user_id=user),
+                             count)
+            with CaptureQueriesContext(connection) as queries:
+                user.delete()
+            return len(queries)
+
+        self.assertEqual(delete_queries(2), delete_queries(50))
+
+        extra = Product.objects.create(user_id=self.user)
+        add_transactions(self.user, extra, 3)
+        call_command('rebuild_ledgers', stdout=StringIO())
+        extra.delete()
+        fields = ('transaction_count', 'pending_count', 'pending_amount')
+        ledger = Ledger.objects.values_list(*fields).get(user_id=self.user)
+        self.assertEqual(ledger, (2, 2, Decimal('200000.00')))
+        call_command('rebuild_ledgers', stdout=StringIO())
+        self.assertEqual(
+            Ledger.objects.values_list(*fields).get(user_id=self.user),
+            ledger)
+
+    def test_admin_keeps_ledger_fields_read_only(self):
+        """Test the admin change page cannot edit counted fields"""
+        admin = get_user_model().objects.create_superuser(
+            email='admin@husteen.com', password='password@123')
+        client = Client()
+        client.force_login(admin)
+        transaction = Transaction.objects.get(reference=ref)
+        url = reverse('admin:transactions_transaction_change',
+                      args=[transaction.pk])
+
+        res = client.get(url)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        client.post(url, {'product_id': self.product.pk,
+                          'reference': ref, 'type': 'credit',
+                          'status': 'success', 'amount': 1})
+        transaction.refresh_from_db()
+        self.assertEqual(transaction.status, 'pending')
+
     def test_retrieve_users_transactions(self):
         """Test retrieve users Transactions"""
         res = self.client.get(RETRIEVE_TRANSACTION_URL)
@@ -134,3 +344,665 @@ class privateTransactionApiTest(TestCase):
         res = self.client.get(LIST_CUSTOMER_TRANSACTION_URL)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         self.assertEqual((res.data['count']), 2)
+
+
+class explainTransactionsCommandTest(TestCase):
+    """Test the transaction query plans use the composite indexes"""
+
+    def test_explain_uses_transaction_indexes(self):
+        """Test the hot querysets are planned against the new indexes"""
+        out = StringIO()
+        call_command('explain_transactions', stdout=out)
+
+        plans = out.getvalue()
+        self.assertIn('transaction_user_recent_idx', plans)
+        self.assertIn('transaction_status_created_idx', plans)
+        self.assertIn('transaction_pending_idx', plans)
+
+
+class transactionPaginationTest(TestCase):
+    """Test the keyset and count-less transaction pagination modes"""
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
+            email='test@husteen.com',
+            password='password@123',
+            last_name='Smith',
+            phone_number='07033562534',
+            first_name='Husteen'
+        )
+        product = Product.objects.create(user_id=cls.user)
+        for _ in range(15):
+            Transaction.objects.create(
+                amount=100000,
+                payment_channel='paystack',
+                product_id=product,
+                user_id=cls.user,
+                reference=uuid.uuid4().hex,
+            )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_cursor_pagination_walks_all_transactions(self):
+        """Test keyset pages cover every transaction newest first"""
+        res = self.client.get(CUSTOMER_TRANSACTION_URL,
+                              {'pagination': 'cursor'})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotIn('count', res.data)
+        first_page = [t['id'] for t in res.data['results']]
+
+        res = self.client.get(res.data['next'])
+        second_page = [t['id'] for t in res.data['results']]
+
+        ids = list(Transaction.objects.order_by('-id').values_list(
+            'id', flat=True))
+        self.assertEqual(first_page + second_page, ids)
+        self.assertIsNone(res.data['next'])
+
+    def test_page_without_count_skips_count_query(self):
+        """Test count=false pages run a single query"""
+        with self.assertNumQueries(1):
+            res = self.client.get(LIST_CUSTOMER_TRANSACTION_URL,
+                                  {'count': 'false', 'page': 2})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotIn('count', res.data)
+        self.assertEqual(len(res.data['results']), 5)
+        self.assertIsNone(res.data['next'])
+        self.assertIsNotNone(res.data['previous'])
+
+
+class validatePaymentConcurrencyTest(TransactionTestCase):
+    """Test concurrent validations of one reference credit it once"""
+    threads = 8
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='test@husteen.com',
+            password='password@123',
+            last_name='Smith',
+            phone_number='07033562534',
+            first_name='Husteen'
+        )
+        self.product = Product.objects.create(user_id=self.user)
+        self.transaction = Transaction.objects.create(
+            amount=100000,
+            payment_channel='paystack',
+            product_id=self.product,
+            user_id=self.user,
+            reference=ref,
+            purchased_hour=2,
+        )
+
+    def test_concurrent_validations_credit_once(self):
+        """Test only one of N simultaneous validations succeeds"""
+        barrier = threading.Barrier(self.threads)
+        results = []
+
+        def validate():
+            transaction = Transaction.objects.get(reference=ref)
+            barrier.wait()
+            deadline = time.monotonic() + LOCK_RETRY_SECONDS
+            try:
+                while time.monotonic() < deadline:
+                    try:
+                        validate_payment(transaction)
+                        results.append('validated')
+                        break
+                    except TransactionValidatedAlready:
+                        results.append('already validated')
+                        break
+                    except OperationalError:
+                        # the shared in-memory test database reports lock
+                        # contention instead of waiting on it
+                        time.sleep(0.001)
+                else:
+                    results.append('locked out')
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=validate)
+                   for _ in range(self.threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual(results.count('validated'), 1)
+        self.assertEqual(results.count('already validated'),
+                         self.threads - 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.unit_in_hours, Decimal('2.00'))
+
+    def stale_select(self, references, fields=()):
+        """Patch the chunk SELECT to first return rows read before now"""
+        with atomic():
+            stale = services.lock_references(references, *fields)
+        lock_references = services.lock_references
+        calls = []
+
+        def select(*args):
+            calls.append(args)
+            return stale if len(calls) == 1 else lock_references(*args)
+        return mock.patch.object(services, 'lock_references', select)
+
+    def test_bulk_validation_skips_rows_validated_meanwhile(self):
+        """Test rows validated between SELECT and UPDATE are credited once"""
+        Transaction.objects.create(
+            amount=100000, payment_channel='paystack',
+            product_id=self.product, user_id=self.user,
+            reference=ref_2, purchased_hour=3,
+        )
+        with self.stale_select([ref, ref_2], ('product_id', 'purchased_hour')):
+            # another call validates `ref` and commits first
+            validate_payment(Transaction.objects.get(reference=ref))
+            results = validate_payments([ref, ref_2])
+
+        self.assertEqual(results, {ref: 'validated_already',
+                                   ref_2: 'validated'})
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.unit_in_hours, Decimal('5.00'))
+        self.assertEqual(Ledger.objects.values_list(
+            'pending_count', 'success_count').get(user_id=self.user), (0, 2))
+
+    def test_bulk_failure_skips_rows_validated_meanwhile(self):
+        """Test rows validated between SELECT and UPDATE are not failed
+        and failed rows are not reported as validated"""
+        Transaction.objects.create(
+            amount=100000, payment_channel='paystack',
+            product_id=self.product, user_id=self.user,
+            reference=ref_2, purchased_hour=3,
+        )
+        with self.stale_select([ref, ref_2]):
+            # another call validates `ref` and commits first
+            validate_payment(Transaction.objects.get(reference=ref))
+            results = fail_payments([ref, ref_2])
+
+        self.assertEqual(results, {ref: 'validated_already',
+                                   ref_2: 'failed'})
+        self.assertEqual(Ledger.objects.values_list(
+            'pending_count', 'success_count', 'pending_amount').get(
+                user_id=self.user), (0, 1, Decimal(0)))
+        self.assertEqual(fail_payments([ref_2]), {ref_2: 'failed_already'})
+
+
+class exportTransactionsTest(TestCase):
+    """Test streaming transaction exports"""
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = get_user_model().objects.create_superuser(
+            email='admin@husteen.com',
+            password='password@123'
+        )
+        cls.product = Product.objects.create(user_id=cls.admin_user)
+        for reference in (ref, ref_2):
+            Transaction.objects.create(
+                amount=100000,
+                payment_channel='paystack',
+                product_id=cls.product,
+                user_id=cls.admin_user,
+                reference=reference,
+            )
+        Transaction.objects.filter(reference=ref_2).update(status='success')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin_user)
+
+    def test_export_ndjson_filtered_by_status(self):
+        """Test NDJSON exports only the requested status"""
+        res = self.client.get(EXPORT_TRANSACTION_URL, {'status': 'success'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res.streaming)
+        lines = b''.join(res.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 1)
+        row = json.loads(lines[0])
+        self.assertEqual(row['reference'], ref_2)
+        self.assertEqual(row['amount'], '100000.00')
+
+    def test_export_csv(self):
+        """Test CSV exports a header and a line per transaction"""
+        res = self.client.get(EXPORT_TRANSACTION_URL, {'output': 'csv'})
+
+        rows = list(csv.reader(
+            b''.join(res.streaming_content).decode().splitlines()))
+        self.assertEqual(rows[0][:2], ['id', 'reference'])
+        self.assertEqual([row[1] for row in rows[1:]], [ref, ref_2])
+
+    def test_export_rejects_invalid_filters(self):
+        """Test invalid filters are reported in the envelope"""
+        res = self.client.get(EXPORT_TRANSACTION_URL, {'status': 'lost'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_export_command(self):
+        """Test the command streams the export to stdout"""
+        out = StringIO()
+        call_command('export_transactions', '--user',
+                     str(self.admin_user.id), '--since',
+                     '2000-01-01T00:00:00Z', stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 2)
+
+
+@override_settings(RESPONSE_CACHE={'ALIAS': 'default', 'TIMEOUT': 300})
+class responseCacheTest(TestCase):
+    """Test cached transaction responses"""
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
+            email='test@husteen.com',
+            password='password@123'
+        )
+        cls.product = Product.objects.create(user_id=cls.user)
+        cls.transaction = Transaction.objects.create(
+            amount=100000,
+            payment_channel='paystack',
+            product_id=cls.product,
+            user_id=cls.user,
+            reference=ref,
+            purchased_hour=2,
+        )
+
+    def setUp(self):
+        response_cache().clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_repeated_retrieve_is_served_from_cache(self):
+        """Test the second retrieve runs no query"""
+        res = self.client.get(RETRIEVE_TRANSACTION_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        with self.assertNumQueries(0):
+            cached = self.client.get(RETRIEVE_TRANSACTION_URL)
+        self.assertEqual(cached.status_code, status.HTTP_200_OK)
+        self.assertEqual(cached.content, res.content)
+        self.assertEqual(cached['ETag'], res['ETag'])
+
+    def test_if_none_match_returns_not_modified(self):
+        """Test a matching ETag is answered with 304"""
+        res = self.client.get(CUSTOMER_TRANSACTION_URL)
+        etag = res['ETag']
+
+        res = self.client.get(CUSTOMER_TRANSACTION_URL,
+                              HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res.content, b'')
+
+        res = self.client.get(CUSTOMER_TRANSACTION_URL, {'count': 'false'},
+                              HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_validation_invalidates_cached_responses(self):
+        """Test validating a payment refreshes retrieve and list"""
+        res = self.client.get(RETRIEVE_TRANSACTION_URL)
+        etag = res['ETag']
+        self.client.get(CUSTOMER_TRANSACTION_URL)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            validate_payment(self.transaction)
+        # the versions only change once the transaction commits
+        with self.assertNumQueries(0):
+            self.client.get(RETRIEVE_TRANSACTION_URL)
+        for callback in callbacks:
+            callback()
+
+        res = self.client.get(RETRIEVE_TRANSACTION_URL,
+                              HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['status'], 'success')
+        res = self.client.get(CUSTOMER_TRANSACTION_URL)
+        self.assertEqual(res.data['results'][0]['status'], 'success')
+
+    def test_responses_are_cached_per_user(self):
+        """Test another user does not get the cached response"""
+        self.client.get(CUSTOMER_TRANSACTION_URL)
+        user_2 = get_user_model().objects.create_user(
+            email='test2@husteen.com',
+            password='password@123'
+        )
+        self.client.force_authenticate(user_2)
+
+        res = self.client.get(CUSTOMER_TRANSACTION_URL)
+        self.assertEqual(res.data['count'], 0)
+
+
+@override_settings(RESPONSE_CACHE={'ALIAS': 'default', 'TIMEOUT': 0})
+class conditionalGetTest(TestCase):
+    """Test ETag and Last-Modified handling without the response cache"""
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
+            email='test@husteen.com',
+            password='password@123'
+        )
+        cls.product = Product.objects.create(user_id=cls.user)
+        cls.transaction = Transaction.objects.create(
+            amount=100000,
+            payment_channel='paystack',
+            product_id=cls.product,
+            user_id=cls.user,
+            reference=ref,
+            purchased_hour=2,
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_validation_updates_modification_times(self):
+        """Test validating a payment moves updated_at forward"""
+        created = self.transaction.updated_at
+        product_updated = self.product.updated_at
+
+        validate_payment(self.transaction)
+
+        self.transaction.refresh_from_db()
+        self.product.refresh_from_db()
+        self.assertGreater(self.transaction.updated_at, created)
+        self.assertGreater(self.product.updated_at, product_updated)
+
+    def test_if_none_match_skips_serialization(self):
+        """Test a matching ETag costs only the validator query"""
+        res = self.client.get(RETRIEVE_TRANSACTION_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn('Last-Modified', res)
+
+        with self.assertNumQueries(1):
+            res = self.client.get(RETRIEVE_TRANSACTION_URL,
+                                  HTTP_IF_NONE_MATCH=res['ETag'])
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_if_modified_since_returns_not_modified(self):
+        """Test an up to date Last-Modified is answered with 304"""
+        res = self.client.get(CUSTOMER_TRANSACTION_URL)
+
+        res = self.client.get(CUSTOMER_TRANSACTION_URL,
+                              HTTP_IF_MODIFIED_SINCE=res['Last-Modified'])
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_changes_produce_a_new_etag(self):
+        """Test updates and new rows change the list ETag"""
+        etag = self.client.get(CUSTOMER_TRANSACTION_URL)['ETag']
+
+        validate_payment(self.transaction)
+        res = self.client.get(CUSTOMER_TRANSACTION_URL,
+                              HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res['ETag'], etag)
+
+        etag = res['ETag']
+        Transaction.objects.create(
+            amount=50000,
+            product_id=self.product,
+            user_id=self.user,
+            reference=ref_2,
+        )
+        res = self.client.get(CUSTOMER_TRANSACTION_URL,
+                              HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['count'], 2)
+
+
+class reconcilePaymentsTest(TestCase):
+    """Test settling pending payments with the provider"""
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
+            email='test@husteen.com',
+            password='password@123'
+        )
+        cls.product = Product.objects.create(user_id=cls.user)
+        cls.references = ['ref-%d' % number for number in range(5)]
+        for reference in cls.references:
+            Transaction.objects.create(
+                amount=100000,
+                payment_channel='paystack',
+                product_id=cls.product,
+                user_id=cls.user,
+                reference=reference,
+                purchased_hour=2,
+            )
+        Transaction.objects.create(
+            amount=100000,
+            payment_channel='card',
+            product_id=cls.product,
+            user_id=cls.user,
+            reference='card-ref',
+        )
+
+    def test_reconcile_settles_payments(self):
+        """Test provider results are applied in bulk"""
+        provider = FakeProvider(statuses={
+            'ref-0': SUCCESS,
+            'ref-1': FAILED,
+            'ref-2': PENDING,
+            'ref-3': ERROR,
+        })
+        report = async_to_sync(reconcile)(provider, batch_size=2,
+                                          concurrency=2, min_age=0)
+
+        self.assertEqual(report.as_dict(), {
+            'checked': 5,
+            'validated': 2,
+            'failed': 1,
+            'pending': 1,
+            'errors': 1,
+        })
+        self.assertEqual(sorted(provider.verified), self.references)
+        self.assertLessEqual(provider.max_in_flight, 2)
+        statuses = dict(Transaction.objects.values_list('reference',
+                                                        'status'))
+        self.assertEqual(statuses['ref-0'], 'success')
+        self.assertEqual(statuses['ref-1'], 'failed')
+        self.assertEqual(statuses['ref-2'], 'pending')
+        self.assertEqual(statuses['card-ref'], 'pending')
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.unit_in_hours, Decimal('4.00'))
+        ledger = Ledger.objects.get(user_id=self.user)
+        self.assertEqual(ledger.pending_count, 3)
+        self.assertEqual(ledger.success_count, 2)
+
+    def test_recent_transactions_are_skipped(self):
+        """Test transactions younger than min_age are not verified"""
+        provider = FakeProvider()
+        report = async_to_sync(reconcile)(provider, min_age=600)
+
+        self.assertEqual(report.checked, 0)
+        self.assertEqual(provider.verified, [])
+
+    def test_reconcile_payments_command(self):
+        """Test the command validates with the configured provider"""
+        out = StringIO()
+        call_command('reconcile_payments', provider='fake', min_age=0,
+                     limit=3, stdout=out)
+
+        self.assertIn('Checked 3 transactions: 3 validated', out.getvalue())
+        self.assertEqual(
+            Transaction.objects.filter(status='success').count(), 3)
+
+    def test_unknown_provider(self):
+        """Test an unregistered provider is reported"""
+        with self.assertRaises(CommandError):
+            call_command('reconcile_payments', provider='missing')
+
+
+@override_settings(RESPONSE_CACHE={'ALIAS': 'default', 'TIMEOUT': 0})
+class asyncTransactionApiTest(TestCase):
+    """Test the async transaction endpoints"""
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
+            email='test@husteen.com',
+            password='password@123'
+        )
+        cls.product = Product.objects.create(user_id=cls.user)
+        for reference in (ref, ref_2):
+            Transaction.objects.create(
+                amount=100000,
+                payment_channel='paystack',
+                product_id=cls.product,
+                user_id=cls.user,
+                reference=reference,
+                purchased_hour=2,
+            )
+
+    def setUp(self):
+        self.client = APIClient()
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+
+    def test_login_required(self):
+        """Test the async endpoints reject anonymous requests"""
+        client = APIClient()
+        res = client.get(ASYNC_CUSTOMER_TRANSACTION_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertFalse(res.json()['status'])
+        self.assertIn('WWW-Authenticate', res)
+
+    def test_create_transaction(self):
+        """Test creating a transaction asynchronously"""
+        payload = {'amount': 100000, 'payment_channel': 'paystack'}
+        res = self.client.post(ASYNC_CREATE_TRANSACTION_URL, payload,
+                               format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        body = res.json()
+        self.assertEqual(body['code'], 201)
+        self.assertEqual(body['data']['purchased_hour'], '2.00')
+        transaction = Transaction.objects.get(
+            reference=body['data']['reference'])
+        self.assertEqual(transaction.product_id, self.product)
+        ledger = Ledger.objects.get(user_id=self.user)
+        self.assertEqual(ledger.transaction_count, 3)
+
+    def test_create_transaction_invalid(self):
+        """Test validation errors keep the envelope"""
+        res = self.client.post(ASYNC_CREATE_TRANSACTION_URL,
+                               {'amount': 'abc'}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('amount', res.json()['data'])
+
+    def test_retrieve_matches_sync_view(self):
+        """Test the async retrieve renders the same payload"""
+        res = self.client.get(ASYNC_RETRIEVE_TRANSACTION_URL)
+        sync = self.client.get(RETRIEVE_TRANSACTION_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.json(), sync.json())
+
+        missing = reverse('async-retrieve-transaction', args=['missing'])
+        res = self.client.get(missing)
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_list_matches_sync_view(self):
+        """Test the async list paginates like the sync view"""
+        res = self.client.get(ASYNC_CUSTOMER_TRANSACTION_URL)
+        sync = self.client.get(CUSTOMER_TRANSACTION_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.json(), sync.json())
+
+        res = self.client.get(ASYNC_CUSTOMER_TRANSACTION_URL, {'page': 2})
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class replicaRoutingTest(TransactionTestCase):
+    """Test reads go to a replica unless the client wrote recently.
+
+    A TransactionTestCase, since reads inside a transaction open on the
+    primary are not routed to replicas.
+    """
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        settings_dict = copy.deepcopy(connections['default'].settings_dict)
+        settings_dict['TEST'].update(NAME=None, MIRROR=None)
+        connections.settings['replica'] = settings_dict
+        with override_settings(DATABASE_ROUTERS=[]):
+            cls.replica_name = connections['replica'].creation.create_test_db(
+                verbosity=0, autoclobber=True, serialize=False)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections['replica'].creation.destroy_test_db(
+            cls.replica_name, verbosity=0)
+        del connections['replica']
+        del connections.settings['replica']
+
+    def setUp(self):
+        self.settings = override_settings(
+            REPLICA_ROUTING={'REPLICAS': ['replica'], 'STICKY_SECONDS': 5,
+                             'CACHE': 'default'},
+            RESPONSE_CACHE={'ALIAS': 'default', 'TIMEOUT': 0})
+        self.settings.enable()
+        self.addCleanup(self.settings.disable)
+
+        self.user = get_user_model().objects.create_user(
+            email='test@husteen.com',
+            password='password@123'
+        )
+        self.product = Product.objects.create(user_id=self.user)
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+    def test_reads_use_the_replica(self):
+        """Test a safe request does not see rows only on the primary"""
+        Transaction.objects.create(amount=100000, user_id=self.user,
+                                   product_id=self.product, reference=ref)
+
+        res = self.client.get(RETRIEVE_TRANSACTION_URL)
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_reads_after_a_write_stay_on_the_primary(self):
+        """Test a transaction can be retrieved right after create"""
+        res = self.client.post(CREATE_TRANSACTION_URL,
+                               {'amount': 100000,
+                                'payment_channel': 'paystack'},
+                               format='json')
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        url = reverse('retrieve-transaction',
+                      args=[res.data['reference']])
+
+        res = self.client.get(url)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        other = APIClient()
+        token = Token.objects.create(user=get_user_model().objects.create(
+            email='other@husteen.com'))
+        other.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+        res = other.get(url)
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_reads_outside_requests_use_the_primary(self):
+        """Test commands and the shell see their own writes"""
+        Transaction.objects.create(amount=100000, user_id=self.user,
+                                   product_id=self.product, reference=ref)
+        self.assertTrue(Transaction.objects.filter(reference=ref).exists())
+
+    def test_cache_fills_after_invalidation_use_the_primary(self):
+        """Test a lagging replica is not cached under a new version"""
+        response_cache().clear()
+        Transaction.objects.create(amount=100000, user_id=self.user,
+                                   product_id=self.product, reference=ref)
+        cached = {'ALIAS': 'default', 'TIMEOUT': 300}
+        routing = dict(settings.REPLICA_ROUTING)
+
+        with override_settings(RESPONSE_CACHE=cached,
+                               REPLICA_ROUTING=dict(routing,
+                                                    STICKY_SECONDS=0)):
+            res = self.client.get(CUSTOMER_TRANSACTION_URL)
+        self.assertEqual(res.data['count'], 0)
+
+        invalidate_scopes('user:%s' % self.user.pk)
+        with override_settings(RESPONSE_CACHE=cached):
+            res = self.client.get(CUSTOMER_TRANSACTION_URL)
+            self.assertEqual(res.data['count'], 1)
@@ -5,12 +5,25 @@ from transactions import views
 urlpatterns = [
      path('create', views.CreateTransactionAPIView.as_view(),
           name="create-transaction"),
+     path('create/bulk', views.BulkCreateTransactionAPIView.as_view(),
+          name="bulk-create-transaction"),
+     path('validate/bulk/', views.BulkValidatePaymentAPIView.as_view(),
+          name="bulk-validate-transaction"),
      path('validate/<slug:reference>/', views.ValidatePaymentAPIView.as_view(),
           name="validate-transaction"),
+     path('async/create', views.AsyncCreateTransactionAPIView.as_view(),
+          name="async-create-transaction"),
+     path('async/<slug:reference>/',
+          views.AsyncTransactionRetrieveAPIView.as_view(),
+          name="async-retrieve-transaction"),
+     path('async/', views.AsyncListCustomerTransactionAPIView.as_view(),
+          name="async-customer-transaction"),
      path('<slug:reference>/', views.TransactionRetrieveDetail.as_view(),
           name="retrieve-transaction"),
      path('', views.ListCustomerTransactionAPIView.as_view(),
           name="customer-transaction"),
+     path('export', views.ExportTransactionAPIView.as_view(),
+          name="export-transaction"),
      path('list', views.ListTransactionAPIView.as_view(),
           name="list-customer-transaction"),
 ]
@@ -1,14 +1,21 @@
-from rest_framework import generics
-from rest_framework.authentication import TokenAuthentication
-from rest_framework.permissions import IsAuthenticated
+from rest_framework import generics, status
+from rest_framework.response import Response
+from accounts.authentication import CachedTokenAuthentication
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from django_filters.rest_framework import DjangoFilterBackend
 from transactions import serializers
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
-from utils.renderers import CustomRenderer
+from utils.cache import CachedResponseMixin, ConditionalResponseMixin
+from utils.renderers import CustomRenderer, FastCustomRenderer
+from utils.pagination import AsyncPageNumberPagination, TransactionPagination
+from utils.views import AsyncAPIView
 from products.models import Product
-from transactions.models import Transaction
-from transactions.exceptions import (
-    TransactionValidatedAlready,)
+from transactions.models import Transaction, purchased_hours
+from transactions.export import CONTENT_TYPES, export_rows, iter_export
+from transactions.services import (create_transactions,
+                                   validate_payment,
+                                   validate_payments)
 import uuid
 from django.contrib.auth import get_user_model
 User = get_user_model()
@@ -16,7 +23,7 @@ User = get_user_model()
 
 class CreateTransactionAPIView(generics.CreateAPIView):
     """Manage data in the database"""
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
     queryset = Transaction.objects.all().order_by('-id')
     serializer_class = serializers.TransactionSerializer
@@ -26,17 +33,33 @@ class CreateTransactionAPIView(generics.CreateAPIView):
         """Create new Transaction"""
         product = Product.objects.filter(
             user_id=self.request.user.id).order_by('-id').first()
-        amount = self.request.POST.get('amount')
-        purchased_hour = float(int(amount)/50000)
+        amount = serializer.validated_data['amount']
         serializer.save(user_id=self.request.user,
                         reference=uuid.uuid4(),
-                        purchased_hour=purchased_hour,
+                        purchased_hour=purchased_hours(amount),
                         product_id=product)
 
 
+class BulkCreateTransactionAPIView(generics.CreateAPIView):
+    """Create a batch of transactions"""
+    authentication_classes = (CachedTokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+    serializer_class = serializers.TransactionSerializer
+    renderer_classes = [CustomRenderer]
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.update(many=True, allow_empty=False, max_length=5000)
+        return super().get_serializer(*args, **kwargs)
+
+    def perform_create(self, serializer):
+        """Create the Transactions with bulk inserts"""
+        serializer.instance = create_transactions(
+            self.request.user, serializer.validated_data)
+
+
 class ValidatePaymentAPIView(generics.UpdateAPIView):
     """Manage data in the database"""
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
     queryset = Transaction.objects.all().order_by('-id')
     serializer_class = serializers.ValidatePaymentSerializer
@@ -45,42 +68,60 @@ class ValidatePaymentAPIView(generics.UpdateAPIView):
 
     def perform_update(self, serializer):
         """Update transaction status"""
-        lookup_field = self.kwargs["reference"]
-        transaction = Transaction.objects.filter(
-            reference=lookup_field).first()
-        if transaction and not transaction.is_active:
-            serializer.save(status='success', is_active=True)
+        validate_payment(serializer.instance)
 
-            # update the purchased unit for a user
-            product = Product.objects.filter(
-                user_id=transaction.user_id).first()
-            product.unit_in_hours += transaction.purchased_hour
-            product.save()
-        else:
-            raise TransactionValidatedAlready()
+
+class BulkValidatePaymentAPIView(generics.GenericAPIView):
+    """Validate a batch of payment references"""
+    authentication_classes = (CachedTokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+    serializer_class = serializers.BulkValidatePaymentSerializer
+    renderer_classes = [CustomRenderer]
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        references = serializer.validated_data['references']
+        results = validate_payments(references)
+        return Response([
+            {'reference': reference, 'result': result}
+            for reference, result in results.items()
+        ])
 
 
-class TransactionRetrieveDetail(generics.RetrieveAPIView):
+class TransactionRetrieveDetail(CachedResponseMixin,
+                                ConditionalResponseMixin,
+                                generics.RetrieveAPIView):
     """Manage data in the database"""
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
     queryset = Transaction.objects.all().order_by('-id')
     serializer_class = serializers.RetrieveTransactionSerializer
     renderer_classes = [CustomRenderer]
     lookup_field = 'reference'
 
+    def get_queryset(self):
+        return Transaction.objects.filter(reference=self.kwargs['reference'])
+
     def get_object(self):
         lookup_field = self.kwargs["reference"]
         return get_object_or_404(Transaction, reference=lookup_field)
 
+    def get_cache_scopes(self):
+        return super().get_cache_scopes() + [
+            'transaction:%s' % self.kwargs['reference']]
 
-class ListCustomerTransactionAPIView(generics.ListAPIView):
+
+class ListCustomerTransactionAPIView(CachedResponseMixin,
+                                     ConditionalResponseMixin,
+                                     generics.ListAPIView):
     """Manage data in the database"""
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
     queryset = Transaction.objects.all().order_by('-id')
     serializer_class = serializers.RetrieveTransactionSerializer
-    renderer_classes = [CustomRenderer]
+    renderer_classes = [FastCustomRenderer]
+    pagination_class = TransactionPagination
 
     def get_queryset(self):
         return Transaction.objects.filter(
@@ -89,10 +130,86 @@ class ListCustomerTransactionAPIView(generics.ListAPIView):
 
 class ListTransactionAPIView(generics.ListAPIView):
     """Manage data in the database"""
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
     queryset = Transaction.objects.all().order_by('-id')
     serializer_class = serializers.RetrieveTransactionSerializer
-    renderer_classes = [CustomRenderer]
+    renderer_classes = [FastCustomRenderer]
+    pagination_class = TransactionPagination
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['id', 'user_id']
+
+
+class ExportTransactionAPIView(generics.GenericAPIView):
+    """Stream transactions as NDJSON or CSV"""
+    authentication_classes = (CachedTokenAuthentication,)
+    permission_classes = (IsAuthenticated, IsAdminUser)
+    serializer_class = serializers.ExportTransactionSerializer
+    renderer_classes = [CustomRenderer]
+
+    def get(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        filters = dict(serializer.validated_data)
+        output = filters.pop('output')
+
+        response = StreamingHttpResponse(
+            iter_export(export_rows(**filters), output),
+            content_type=CONTENT_TYPES[output])
+        response['Content-Disposition'] = (
+            'attachment; filename="transactions.%s"' % output)
+        return response
+
+
+class AsyncCreateTransactionAPIView(AsyncAPIView):
+    """Create a Transaction without holding a worker thread"""
+    authentication_classes = (CachedTokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+    renderer_classes = [CustomRenderer]
+
+    async def post(self, request, *args, **kwargs):
+        serializer = serializers.TransactionSerializer(
+            data=self.parse_body(request))
+        serializer.is_valid(raise_exception=True)
+        product = await Product.objects.filter(
+            user_id=request.user.id).order_by('-id').afirst()
+        amount = serializer.validated_data['amount']
+        transaction = await Transaction.objects.acreate(
+            user_id=request.user,
+            reference=uuid.uuid4(),
+            purchased_hour=purchased_hours(amount),
+            product_id=product,
+            **serializer.validated_data)
+        serializer = serializers.TransactionSerializer(transaction)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+
+class AsyncTransactionRetrieveAPIView(AsyncAPIView):
+    """Retrieve a Transaction by reference with the async ORM"""
+    authentication_classes = (CachedTokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+    renderer_classes = [CustomRenderer]
+
+    async def get(self, request, reference):
+        try:
+            transaction = await Transaction.objects.aget(reference=reference)
+        except Transaction.DoesNotExist:
+            raise Http404
+        serializer = serializers.RetrieveTransactionSerializer(transaction)
+        return Response(serializer.data)
+
+
+class AsyncListCustomerTransactionAPIView(AsyncAPIView):
+    """List the authenticated user's Transactions with the async ORM"""
+    authentication_classes = (CachedTokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+    renderer_classes = [FastCustomRenderer]
+    pagination_class = AsyncPageNumberPagination
+
+    async def get(self, request):
+        queryset = Transaction.objects.filter(
+            user_id=request.user.id).order_by('-id')
+        paginator = self.pagination_class()
+        page = await paginator.paginate_queryset(queryset, request)
+        serializer = serializers.RetrieveTransactionSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
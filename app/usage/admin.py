@@ -0,0 +1,6 @@
+from django.contrib import admin
+from usage import models
+
+
+# Register your models here.
+admin.site.register(models.UsageRollup)
@@ -0,0 +1,7 @@
+from rest_framework.exceptions import APIException
+
+
+class UnknownProduct(APIException):
+    status_code = 400
+    default_detail = "Readings reference products you do not own."
+    default_code = "unknown_product"
@@ -0,0 +1,237 @@
+from queue import Queue
+import gzip
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+from rest_framework.fields import empty
+from rest_framework.exceptions import ValidationError
+from accounts.onboarding import chunked
+from products.models import Product
+from usage.models import Reading
+from usage.serializers import ReadingSerializer
+from usage.services import store_readings
+from utils.renderers import orjson
+
+MAX_REPORTED_ERRORS = 100
+
+# orjson errors subclass ValueError like the stdlib ones
+json_loads = json.loads if orjson is None else orjson.loads
+
+
+class IngestReport:
+    """Running totals of a streaming reading ingest.
+
+    `accepted` counts stored readings and `duplicates` valid readings
+    skipped because an earlier ingest already stored them. `failure`
+    holds the exception that stopped the writer, readings accepted
+    before it are stored.
+    """
+
+    def __init__(self):
+        self.accepted = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.errors = []
+        self.failure = None
+        self.started = time.perf_counter()
+
+    @property
+    def rate(self):
+        elapsed = time.perf_counter() - self.started
+        lines = self.accepted + self.duplicates + self.rejected
+        return lines / elapsed if elapsed else 0.0
+
+    def add_error(self, line, detail):
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line, 'errors': detail})
+
+    def as_dict(self):
+        return {
+            'accepted': self.accepted,
+            'duplicates': self.duplicates,
+            'rejected': self.rejected,
+            'errors': self.errors,
+            'failed': self.failure is not None,
+            'rate': round(self.rate, 1),
+        }
+
+
+class ProductLookup:
+    """Answer whether readings may be stored for a product id.
+
+    A user's products are loaded once. Without a user, as for the file
+    loader, or for staff users every existing product is accepted and
+    looked up the first time its id is seen.
+    """
+
+    def __init__(self, user=None):
+        self.any_product = user is None or user.is_staff
+        self.known = {}
+        if not self.any_product:
+            self.known = dict.fromkeys(Product.objects.filter(
+                user_id=user.id).values_list('pk', flat=True), True)
+
+    def __contains__(self, product_id):
+        allowed = self.known.get(product_id)
+        if allowed is None:
+            allowed = self.any_product and Product.objects.filter(
+                pk=product_id).exists()
+            self.known[product_id] = allowed
+        return allowed
+
+
+class SkippedLine(str):
+    """Error reported in place of a line that was not read"""
+
+
+def open_lines(stream, compressed, max_line=None, max_bytes=None):
+    """Iterate the byte lines of `stream`, gunzipping it when compressed.
+
+    Lines are read at most `max_line` bytes at a time, so a body without
+    newlines is never held in memory: longer lines are skipped and a
+    `SkippedLine` is yielded instead. Once more than `max_bytes` bytes
+    were read, counted after decompression, a last `SkippedLine` ends
+    the iteration.
+    """
+    max_line = max_line or settings.USAGE['STREAM_MAX_LINE_BYTES']
+    if compressed:
+        stream = gzip.GzipFile(fileobj=stream, mode='rb')
+    total = 0
+    while True:
+        line = stream.readline(max_line + 1)
+        if not line:
+            return
+        total += len(line)
+        if len(line) > max_line:
+            while not line.endswith(b'\n') and not (
+                    max_bytes and total > max_bytes):
+                line = stream.readline(max_line)
+                if not line:
+                    break
+                total += len(line)
+            line = SkippedLine('Line longer than %d bytes.' % max_line)
+        if max_bytes and total > max_bytes:
+            yield SkippedLine('Stream larger than %d bytes, the rest was '
+                              'not read.' % max_bytes)
+            return
+        yield line
+
+
+def parse_readings(lines, products, report, limit=None):
+    """Yield `Reading` instances for the valid NDJSON `lines`.
+
+    Lines are decoded with orjson when it is installed and validated with
+    the `ReadingSerializer` fields one at a time. Invalid lines, lines
+    skipped by `open_lines` and readings of products outside `products`
+    are added to `report`. Stops with an error after `limit` lines.
+    """
+    fields = ReadingSerializer().fields
+    number = 0
+    for number, line in enumerate(lines, 1):
+        if limit is not None and number > limit:
+            report.add_error(number, 'Too many readings, at most %d are '
+                                     'accepted per stream.' % limit)
+            return
+        if isinstance(line, SkippedLine):
+            report.add_error(number, str(line))
+            continue
+        if not line.strip():
+            continue
+        try:
+            row = json_loads(line)
+        except ValueError:
+            report.add_error(number, 'Invalid JSON.')
+            continue
+        if not isinstance(row, dict):
+            report.add_error(number, 'Expected a JSON object.')
+            continue
+
+        values = {}
+        errors = {}
+        for name, field in fields.items():
+            try:
+                values[name] = field.run_validation(row.get(name, empty))
+            except ValidationError as exc:
+                errors[name] = exc.detail
+        if errors:
+            report.add_error(number, errors)
+        elif values['product_id'] not in products:
+            report.add_error(number, {'product_id': ['Unknown product.']})
+        else:
+            yield Reading(product_id_id=values['product_id'],
+                          recorded_at=values['recorded_at'],
+                          hours=values['hours'])
+
+
+class ReadingWriter(threading.Thread):
+    """Insert the batches put on `batches` until it yields None.
+
+    Readings already stored for the same product and time are skipped,
+    so a resent stream is not counted twice. After a failed insert the
+    remaining batches are drained without writing, so the producer never
+    blocks on a full queue, and the exception is kept in `error`.
+    """
+
+    def __init__(self, batches, report):
+        super().__init__(name='reading-writer', daemon=True)
+        self.batches = batches
+        self.report = report
+        self.error = None
+
+    def run(self):
+        try:
+            while True:
+                batch = self.batches.get()
+                if batch is None:
+                    return
+                if self.error is not None:
+                    continue
+                try:
+                    stored = store_readings(batch)
+                except Exception as exc:
+                    self.error = exc
+                else:
+                    self.report.accepted += stored
+                    self.report.duplicates += len(batch) - stored
+        finally:
+            connection.close()
+
+
+def ingest_stream(lines, products, batch_size=None, queue_size=None,
+                  limit=None, progress=None):
+    """Parse NDJSON reading `lines` and store them from a writer thread.
+
+    Parsing and validation run in the calling thread while a
+    `ReadingWriter` inserts `batch_size` readings at a time. The queue
+    between them holds at most `queue_size` batches, so a slow database
+    throttles the reader instead of buffering the whole stream. Batches
+    are committed as they are written; rejected lines are reported and
+    do not stop the ingest. A failed insert stops the ingest and is kept
+    in the report's `failure`, resending the stream then stores the
+    missing readings only. `progress` is called with the report after
+    every batch.
+    """
+    config = settings.USAGE
+    batch_size = batch_size or config['INGEST_BATCH_SIZE']
+    queue_size = queue_size or config['INGEST_QUEUE_BATCHES']
+    report = IngestReport()
+    batches = Queue(maxsize=queue_size)
+    writer = ReadingWriter(batches, report)
+    writer.start()
+    try:
+        for batch in chunked(parse_readings(lines, products, report, limit),
+                             batch_size):
+            batches.put(batch)
+            if progress is not None:
+                progress(report)
+            if writer.error is not None:
+                break
+    finally:
+        batches.put(None)
+        writer.join()
+    report.failure = writer.error
+    return report
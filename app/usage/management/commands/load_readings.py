@@ -0,0 +1,82 @@
+import os
+import shutil
+
+from django.core.management.base import BaseCommand, CommandError
+from usage.ingest import ProductLookup, ingest_stream, open_lines
+
+EXTENSIONS = ('.ndjson', '.ndjson.gz')
+
+
+class Command(BaseCommand):
+    """Store readings from dropped NDJSON files"""
+    help = "Load readings from NDJSON files, gzip compressed when they " \
+           "end with .gz. Directories are scanned for *.ndjson and " \
+           "*.ndjson.gz files."
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+')
+        parser.add_argument('--batch-size', type=int)
+        parser.add_argument('--queue-size', type=int,
+                            help='Batches waiting for the writer before '
+                                 'parsing blocks.')
+        parser.add_argument('--archive',
+                            help='Move loaded files to this directory.')
+
+    def handle(self, *args, **options):
+        archive = options['archive']
+        if archive and not os.path.isdir(archive):
+            raise CommandError('%s is not a directory.' % archive)
+
+        # Without a user, readings are accepted for every existing product
+        products = ProductLookup()
+        accepted = duplicates = rejected = 0
+        for path in self.find_files(options['paths']):
+            try:
+                stream = open(path, 'rb')
+            except OSError as exc:
+                raise CommandError(exc)
+            with stream:
+                try:
+                    report = ingest_stream(
+                        open_lines(stream, path.endswith('.gz')), products,
+                        batch_size=options['batch_size'],
+                        queue_size=options['queue_size'],
+                        progress=self.progress)
+                except (OSError, EOFError) as exc:
+                    raise CommandError('%s: %s' % (path, exc))
+
+            for error in report.errors:
+                self.stderr.write('%s line %s: %s' % (path, error['line'],
+                                                      error['errors']))
+            if report.failure is not None:
+                raise CommandError('%s: stored %d readings, then failed: %s'
+                                   % (path, report.accepted, report.failure))
+            self.stdout.write('%s: accepted %d, duplicates %d, rejected %d '
+                              '(%.0f lines/s)' % (
+                                  path, report.accepted, report.duplicates,
+                                  report.rejected, report.rate))
+            accepted += report.accepted
+            duplicates += report.duplicates
+            rejected += report.rejected
+            if archive:
+                shutil.move(path, os.path.join(archive,
+                                               os.path.basename(path)))
+
+        self.stdout.write(self.style.SUCCESS(
+            'Accepted %d readings, skipped %d duplicates, rejected %d.'
+            % (accepted, duplicates, rejected)))
+
+    def find_files(self, paths):
+        for path in paths:
+            if not os.path.isdir(path):
+                yield path
+                continue
+            for name in sorted(os.listdir(path)):
+                if name.endswith(EXTENSIONS):
+                    yield os.path.join(path, name)
+
+    def progress(self, report):
+        self.stdout.write('%d accepted, %d duplicates, %d rejected '
+                          '(%.0f lines/s)' % (report.accepted,
+                                              report.duplicates,
+                                              report.rejected, report.rate))
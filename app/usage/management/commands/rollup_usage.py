@@ -0,0 +1,27 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from usage.services import rollup_readings
+
+
+class Command(BaseCommand):
+    """Aggregate new consumption readings"""
+    help = "Fold readings past the checkpoint into the hourly and daily " \
+           "rollups and debit the consumed hours from their products."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int,
+                            default=settings.USAGE['ROLLUP_BATCH_SIZE'])
+
+    def handle(self, *args, **options):
+        self.started = time.perf_counter()
+        rolled = rollup_readings(batch_size=options['batch_size'],
+                                 progress=self.progress)
+        self.stdout.write(self.style.SUCCESS(
+            'Rolled up %d readings.' % rolled))
+
+    def progress(self, rolled):
+        elapsed = time.perf_counter() - self.started
+        self.stdout.write('%d readings (%.0f/s)' % (
+            rolled, rolled / elapsed if elapsed else 0))
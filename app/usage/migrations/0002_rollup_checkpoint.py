@@ -0,0 +1,19 @@
+from django.db import migrations
+
+
+def create_checkpoint(apps, schema_editor):
+    RollupCheckpoint = apps.get_model('usage', 'RollupCheckpoint')
+    # rollups read and lock this row, they never create it
+    RollupCheckpoint.objects.using(schema_editor.connection.alias) \
+        .get_or_create(name='usage')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('usage', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_checkpoint, migrations.RunPython.noop),
+    ]
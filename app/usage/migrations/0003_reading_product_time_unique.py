@@ -0,0 +1,37 @@
+# Generated by Django 4.1 on 2026-10-18 07:57
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def delete_duplicate_readings(apps, schema_editor):
+    # already rolled up copies stay counted, the rollups are never reduced
+    Reading = apps.get_model('usage', 'Reading')
+    db = schema_editor.connection.alias
+    duplicates = Reading.objects.using(db).order_by().values(
+        'product_id', 'recorded_at',
+    ).annotate(keep=Min('id'), count=Count('id')).filter(count__gt=1)
+    for row in list(duplicates):
+        Reading.objects.using(db).filter(
+            product_id=row['product_id'], recorded_at=row['recorded_at'],
+        ).exclude(pk=row['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('usage', '0002_rollup_checkpoint'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicate_readings,
+                             migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='reading',
+            name='reading_product_time_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='reading',
+            constraint=models.UniqueConstraint(fields=('product_id', 'recorded_at'), name='reading_product_time_unique'),
+        ),
+    ]
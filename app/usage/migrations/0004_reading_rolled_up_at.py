@@ -0,0 +1,38 @@
+# Generated by Django 4.1 on 2026-10-18 08:04
+
+from django.db import migrations, models
+
+
+def mark_rolled_up(apps, schema_editor):
+    # readings up to the old id checkpoint are already in the rollups
+    RollupCheckpoint = apps.get_model('usage', 'RollupCheckpoint')
+    Reading = apps.get_model('usage', 'Reading')
+    db = schema_editor.connection.alias
+    for checkpoint in RollupCheckpoint.objects.using(db):
+        Reading.objects.using(db).filter(
+            pk__lte=checkpoint.last_reading_id, rolled_up_at__isnull=True,
+        ).update(rolled_up_at=checkpoint.updated_at)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('usage', '0003_reading_product_time_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reading',
+            name='rolled_up_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(mark_rolled_up, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='rollupcheckpoint',
+            name='last_reading_id',
+        ),
+        migrations.AddIndex(
+            model_name='reading',
+            index=models.Index(condition=models.Q(('rolled_up_at__isnull', True)), fields=['id'], name='reading_pending_rollup_idx'),
+        ),
+    ]
@@ -0,0 +1,59 @@
+from django.db import models
+from products.models import Product
+
+
+PERIOD_CHOICES = (
+    ("hour", "hour"),
+    ("day", "day"),
+)
+
+
+class Reading(models.Model):
+    """Energy hours consumed by a product, appended by meters.
+
+    Rows are only updated once, when `rollup_readings` claims them by
+    setting `rolled_up_at`. A product has one reading per time, so resent
+    readings can be skipped instead of being counted twice.
+    """
+    product_id = models.ForeignKey(Product, on_delete=models.CASCADE,
+                                   related_name='readings', db_index=False)
+    recorded_at = models.DateTimeField()
+    hours = models.DecimalField(max_digits=8, decimal_places=2)
+    rolled_up_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product_id', 'recorded_at'],
+                                    name='reading_product_time_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['id'],
+                         condition=models.Q(rolled_up_at__isnull=True),
+                         name='reading_pending_rollup_idx'),
+        ]
+
+
+class UsageRollup(models.Model):
+    """Hours consumed by a product in one hour or day"""
+    product_id = models.ForeignKey(Product, on_delete=models.CASCADE,
+                                   related_name='usage', db_index=False)
+    period = models.CharField(max_length=10, choices=PERIOD_CHOICES)
+    bucket = models.DateTimeField()
+    hours = models.DecimalField(max_digits=14,
+                                decimal_places=2,
+                                default=0.00)
+    reading_count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['product_id', 'period', 'bucket'],
+                name='usage_rollup_bucket_unique'),
+        ]
+
+
+class RollupCheckpoint(models.Model):
+    """Row locked by every rollup batch, so rollups run one at a time"""
+    name = models.CharField(max_length=50, unique=True)
+    updated_at = models.DateTimeField(auto_now=True)
@@ -0,0 +1,56 @@
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Bucket width of each rollup period, in seconds
+PERIOD_SECONDS = {'hour': 3600, 'day': 86400}
+
+
+def aggregate(product_ids, timestamps, centihours, width):
+    """Sum consumption per product and `width` seconds wide bucket.
+
+    The arguments are parallel sequences of product ids, epoch seconds
+    and hours in hundredths. Returns `{(product_id, bucket_start):
+    (centihours, readings)}` with bucket starts in epoch seconds.
+    Vectorized with NumPy when it is installed.
+    """
+    if numpy is not None:
+        return aggregate_arrays(product_ids, timestamps, centihours, width)
+
+    totals = {}
+    for product_id, timestamp, value in zip(product_ids, timestamps,
+                                            centihours):
+        key = (product_id, timestamp - timestamp % width)
+        total = totals.get(key)
+        if total is None:
+            totals[key] = [value, 1]
+        else:
+            total[0] += value
+            total[1] += 1
+    return {key: tuple(total) for key, total in totals.items()}
+
+
+def aggregate_arrays(product_ids, timestamps, centihours, width):
+    """NumPy implementation of `aggregate`.
+
+    Product ids and bucket numbers are packed in one int64 key, so a
+    single `unique` groups the readings and `bincount` sums the groups.
+    """
+    buckets = numpy.asarray(timestamps, dtype=numpy.int64) // width
+    keys = numpy.asarray(product_ids, dtype=numpy.int64) << 32 | buckets
+    unique, inverse = numpy.unique(keys, return_inverse=True)
+    inverse = inverse.ravel()
+    # float64 sums are exact for integers below 2**53
+    sums = numpy.bincount(inverse,
+                          weights=numpy.asarray(centihours,
+                                                dtype=numpy.float64),
+                          minlength=len(unique))
+    counts = numpy.bincount(inverse, minlength=len(unique))
+    return {
+        (key >> 32, (key & 0xFFFFFFFF) * width): (total, count)
+        for key, total, count in zip(unique.tolist(),
+                                     numpy.rint(sums).astype(
+                                         numpy.int64).tolist(),
+                                     counts.tolist())
+    }
@@ -0,0 +1,25 @@
+from rest_framework import serializers
+from usage.models import UsageRollup
+from utils.metrics import TimedRepresentationMixin
+
+
+class ReadingSerializer(serializers.Serializer):
+    """Serializer for one consumption reading of a product"""
+    product_id = serializers.IntegerField(min_value=1)
+    recorded_at = serializers.DateTimeField()
+    hours = serializers.DecimalField(max_digits=8,
+                                     decimal_places=2,
+                                     min_value=0)
+
+
+class UsageRollupSerializer(TimedRepresentationMixin,
+                            serializers.ModelSerializer):
+    """Serializer for UsageRollup objects"""
+
+    class Meta:
+        model = UsageRollup
+        fields = ('product_id',
+                  'period',
+                  'bucket',
+                  'hours',
+                  'reading_count')
@@ -0,0 +1,197 @@
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+import logging
+
+from django.conf import settings
+from django.db.transaction import atomic
+from django.utils import timezone
+from accounts.onboarding import chunked
+from products.models import Product
+from transactions.services import bulk_increment
+from usage.exceptions import UnknownProduct
+from usage.models import Reading, RollupCheckpoint, UsageRollup
+from usage.rollups import PERIOD_SECONDS, aggregate
+from utils.cache import invalidate_scopes
+
+INGEST_BATCH_SIZE = 1000
+ROLLUP_CHUNK_SIZE = 500
+# row locked by rollups, created by the 0002_rollup_checkpoint migration
+ROLLUP_CHECKPOINT = 'usage'
+
+logger = logging.getLogger(__name__)
+
+
+def owned_products(user, product_ids):
+    """Return the ids among `product_ids` that `user` may report for"""
+    products = Product.objects.filter(pk__in=set(product_ids))
+    if not user.is_staff:
+        products = products.filter(user_id=user.id)
+    return set(products.values_list('pk', flat=True))
+
+
+def ingest_readings(user, items):
+    """Append validated `ReadingSerializer` payloads with bulk inserts.
+
+    Every reading must belong to a product of `user`, staff users may
+    report for any product. Readings already stored for the same product
+    and time are skipped, so retried requests are not counted twice.
+    Returns the number of inserted readings.
+    """
+    product_ids = [item['product_id'] for item in items]
+    allowed = owned_products(user, product_ids)
+    unknown = sorted(set(product_ids) - allowed)
+    if unknown:
+        raise UnknownProduct('Unknown products: %s.'
+                             % ', '.join(map(str, unknown)))
+
+    readings = (Reading(product_id_id=item['product_id'],
+                        recorded_at=item['recorded_at'],
+                        hours=item['hours'])
+                for item in items)
+    return sum(store_readings(batch)
+               for batch in chunked(readings, INGEST_BATCH_SIZE))
+
+
+def store_readings(readings):
+    """Insert `readings`, skipping those of an already stored product and
+    time, and return how many were inserted.
+
+    `bulk_create(ignore_conflicts=True)` does not tell which rows it
+    skipped, so the stored keys are looked up first in the same
+    transaction. A reading inserted by a concurrent call in between is
+    counted by both calls, it is still stored once.
+    """
+    keys = {(reading.product_id_id, reading.recorded_at)
+            for reading in readings}
+    times = [recorded_at for _, recorded_at in keys]
+    with atomic():
+        stored = set(Reading.objects.filter(
+            product_id__in={product_id for product_id, _ in keys},
+            recorded_at__range=(min(times), max(times)),
+        ).values_list('product_id', 'recorded_at'))
+        Reading.objects.bulk_create(readings, ignore_conflicts=True)
+    return len(keys - stored)
+
+
+def rollup_readings(batch_size=None, progress=None):
+    """Fold new readings into the rollups and debit their products.
+
+    Readings not rolled up yet are read `batch_size` at a time in id
+    order and aggregated per product into hourly and daily UTC buckets.
+    Each batch claims its readings by setting `rolled_up_at`, updates
+    the rollups and subtracts the consumed hours from
+    `Product.unit_in_hours` with one UPDATE in a single transaction, so
+    readings are counted exactly once, even when they commit out of id
+    order. Batches lock the checkpoint row, so rollups run one at a time.
+    Products left with negative hours are logged as a warning.
+    `progress` is called with the running total after every batch.
+    Returns the number of rolled up readings.
+    """
+    batch_size = batch_size or settings.USAGE['ROLLUP_BATCH_SIZE']
+    rolled = 0
+    while True:
+        with atomic():
+            RollupCheckpoint.objects.select_for_update().get(
+                name=ROLLUP_CHECKPOINT)
+            rows = claim_readings(batch_size)
+            if not rows:
+                return rolled
+            overdrawn = rollup_rows(rows)
+        if overdrawn:
+            logger.warning('Usage overdrew products: %s',
+                           ', '.join(map(str, overdrawn)))
+        rolled += len(rows)
+        if progress is not None:
+            progress(rolled)
+
+
+def claim_readings(batch_size):
+    """Mark up to `batch_size` readings as rolled up and return their rows.
+
+    Only rows whose `rolled_up_at` this UPDATE set are returned, as
+    `(id, product_id, recorded_at, hours)` tuples.
+    """
+    pending = Reading.objects.filter(rolled_up_at__isnull=True)
+    ids = list(pending.order_by('pk').values_list('pk', flat=True)[
+        :batch_size])
+    now = timezone.now()
+    pending.filter(pk__in=ids).update(rolled_up_at=now)
+    return list(Reading.objects.filter(
+        pk__in=ids, rolled_up_at=now,
+    ).order_by('pk').values_list('pk', 'product_id', 'recorded_at', 'hours'))
+
+
+def rollup_rows(rows):
+    """Apply `(id, product_id, recorded_at, hours)` reading rows.
+
+    Returns the ids of the debited products whose balance went below
+    zero.
+    """
+    _, product_ids, times, hours = zip(*rows)
+    timestamps = [int(time.timestamp()) for time in times]
+    centihours = [int(value * 100) for value in hours]
+
+    now = timezone.now()
+    debits = {}
+    for period, width in PERIOD_SECONDS.items():
+        totals = aggregate(product_ids, timestamps, centihours, width)
+        save_rollups(period, totals, now)
+        if period == 'day':
+            for (product_id, _), (total, _) in totals.items():
+                debits[product_id] = debits.get(product_id, 0) + total
+
+    overdrawn = []
+    for chunk in chunked(sorted(debits), ROLLUP_CHUNK_SIZE):
+        bulk_increment(Product, {
+            product_id: {'unit_in_hours': -Decimal(debits[product_id])
+                         .scaleb(-2)}
+            for product_id in chunk
+        }, updated_at=now)
+        products = Product.objects.filter(pk__in=chunk).values_list(
+            'pk', 'user_id', 'unit_in_hours')
+        invalidate_scopes(*{'user:%s' % user_id
+                            for _, user_id, _ in products})
+        overdrawn.extend(product_id for product_id, _, balance in products
+                         if balance < 0)
+    return overdrawn
+
+
+def save_rollups(period, totals, now):
+    """Add aggregated `totals` to the stored rollups of `period`.
+
+    Existing rollups are read and written back with an upsert,
+    `ROLLUP_CHUNK_SIZE` buckets at a time to bound the query parameters.
+    """
+    for chunk in chunked(sorted(totals), ROLLUP_CHUNK_SIZE):
+        buckets = [bucket for _, bucket in chunk]
+        existing = {
+            (product_id, int(bucket.timestamp())): (hours, count)
+            for product_id, bucket, hours, count in
+            UsageRollup.objects.filter(
+                period=period,
+                product_id__in={product_id for product_id, _ in chunk},
+                bucket__range=(bucket_time(min(buckets)),
+                               bucket_time(max(buckets))),
+            ).values_list('product_id', 'bucket', 'hours', 'reading_count')
+        }
+        rollups = []
+        for key in chunk:
+            total, count = totals[key]
+            hours, previous = existing.get(key, (Decimal(0), 0))
+            rollups.append(UsageRollup(
+                product_id_id=key[0],
+                period=period,
+                bucket=bucket_time(key[1]),
+                hours=hours + Decimal(total).scaleb(-2),
+                reading_count=previous + count,
+                updated_at=now))
+        UsageRollup.objects.bulk_create(
+            rollups, batch_size=INGEST_BATCH_SIZE, update_conflicts=True,
+            # Django 4.1 puts these names in the SQL verbatim, hence the
+            # column name of the foreign key
+            unique_fields=['product_id_id', 'period', 'bucket'],
+            update_fields=['hours', 'reading_count', 'updated_at'])
+
+
+def bucket_time(bucket):
+    return datetime.fromtimestamp(bucket, tz=dt_timezone.utc)
@@ -0,0 +1,358 @@
+from datetime import datetime, timezone
+from decimal import Decimal
+from io import StringIO
+import gzip
+import json
+import os
+import tempfile
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import IntegrityError
+from django.test import (SimpleTestCase, TestCase, TransactionTestCase,
+                         override_settings)
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from products.models import Product
+from usage import rollups
+from usage.models import Reading, RollupCheckpoint, UsageRollup
+from usage.services import ROLLUP_CHECKPOINT, rollup_readings
+
+INGEST_READINGS_URL = reverse('ingest-readings')
+LIST_USAGE_URL = reverse('list-usage')
+STREAM_READINGS_URL = reverse('stream-readings')
+
+
+def reading(product, recorded_at, hours):
+    return {'product_id': product.pk,
+            'recorded_at': recorded_at,
+            'hours': hours}
+
+
+def ndjson(*lines):
+    return b''.join(
+        (line if isinstance(line, bytes) else json.dumps(line).encode())
+        + b'\n' for line in lines)
+
+
+class aggregateTest(SimpleTestCase):
+    """Test grouping readings into buckets"""
+
+    def test_numpy_matches_python(self):
+        """Test both implementations return the same buckets"""
+        product_ids = [1, 2, 1, 1, 2]
+        timestamps = [0, 10, 3599, 3600, 90000]
+        centihours = [5, 7, 11, 13, 17]
+        expected = {
+            (1, 0): (16, 2),
+            (2, 0): (7, 1),
+            (1, 3600): (13, 1),
+            (2, 90000): (17, 1),
+        }
+        with mock.patch.object(rollups, 'numpy', None):
+            self.assertEqual(rollups.aggregate(
+                product_ids, timestamps, centihours, 3600), expected)
+        if rollups.numpy is None:
+            self.skipTest('NumPy is not installed')
+        self.assertEqual(rollups.aggregate(
+            product_ids, timestamps, centihours, 3600), expected)
+
+
+@override_settings(RESPONSE_CACHE={'ALIAS': 'default', 'TIMEOUT': 0})
+class usageApiTest(TestCase):
+    """Test ingesting and reading consumption"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
+            email='test@husteen.com',
+            password='password@123'
+        )
+        cls.product = Product.objects.create(user_id=cls.user,
+                                             unit_in_hours=10)
+        other = get_user_model().objects.create_user(
+            email='other@husteen.com',
+            password='password@123'
+        )
+        cls.other_product = Product.objects.create(user_id=other,
+                                                   unit_in_hours=10)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_ingest_readings(self):
+        """Test a batch of readings is stored"""
+        payload = [
+            reading(self.product, '2024-01-01T10:05:00Z', '0.25'),
+            reading(self.product, '2024-01-01T10:10:00Z', '0.50'),
+        ]
+        res = self.client.post(INGEST_READINGS_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.data['created'], 2)
+        self.assertEqual(res.data['duplicates'], 0)
+        self.assertEqual(Reading.objects.filter(
+            product_id=self.product).count(), 2)
+
+        payload.append(reading(self.product, '2024-01-01T10:15:00Z', '0.25'))
+        res = self.client.post(INGEST_READINGS_URL, payload, format='json')
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.data['created'], 1)
+        self.assertEqual(res.data['duplicates'], 2)
+        self.assertEqual(Reading.objects.filter(
+            product_id=self.product).count(), 3)
+
+    def test_ingest_rejects_foreign_products(self):
+        """Test readings for another user's product are refused"""
+        payload = [
+            reading(self.product, '2024-01-01T10:05:00Z', '0.25'),
+            reading(self.other_product, '2024-01-01T10:05:00Z', '0.25'),
+        ]
+        res = self.client.post(INGEST_READINGS_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Reading.objects.exists())
+
+    def test_ingest_rejects_negative_hours(self):
+        """Test consumption cannot be negative"""
+        payload = [reading(self.product, '2024-01-01T10:05:00Z', '-1')]
+        res = self.client.post(INGEST_READINGS_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_rollups_debit_products(self):
+        """Test readings roll up once into hours and days"""
+        Reading.objects.bulk_create([
+            Reading(product_id=self.product, hours=hours,
+                    recorded_at=datetime(2024, 1, 1, hour, minute,
+                                         tzinfo=timezone.utc))
+            for hour, minute, hours in ((10, 15, '0.25'), (10, 30, '0.50'),
+                                        (11, 30, '1.00'))
+        ])
+        self.assertEqual(rollup_readings(batch_size=2), 3)
+        self.assertEqual(rollup_readings(), 0)
+
+        hourly = UsageRollup.objects.filter(
+            period='hour').order_by('bucket')
+        self.assertEqual([(r.hours, r.reading_count) for r in hourly],
+                         [(Decimal('0.75'), 2), (Decimal('1.00'), 1)])
+        daily = UsageRollup.objects.get(period='day')
+        self.assertEqual(daily.bucket,
+                         datetime(2024, 1, 1, tzinfo=timezone.utc))
+        self.assertEqual(daily.hours, Decimal('1.75'))
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.unit_in_hours, Decimal('8.25'))
+
+        Reading.objects.create(product_id=self.product, hours='0.25',
+                               recorded_at=datetime(2024, 1, 1, 11, 45,
+                                                    tzinfo=timezone.utc))
+        out = StringIO()
+        call_command('rollup_usage', stdout=out)
+        self.assertIn('Rolled up 1 readings.', out.getvalue())
+        daily.refresh_from_db()
+        self.assertEqual(daily.hours, Decimal('2.00'))
+        self.assertEqual(daily.reading_count, 4)
+
+    def test_rollups_report_overdrawn_products(self):
+        """Test products debited below zero hours are logged"""
+        Reading.objects.create(product_id=self.product, hours='12.50',
+                               recorded_at=datetime(2024, 1, 1, 10, 30,
+                                                    tzinfo=timezone.utc))
+        with self.assertLogs('usage.services', 'WARNING') as logs:
+            rollup_readings()
+
+        self.assertIn(str(self.product.pk), logs.output[0])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.unit_in_hours, Decimal('-2.50'))
+
+    def test_rollup_checkpoint_exists(self):
+        """Test the migrations create the rollup checkpoint"""
+        self.assertTrue(RollupCheckpoint.objects.filter(
+            name=ROLLUP_CHECKPOINT).exists())
+
+    def test_rollups_count_readings_committed_out_of_order(self):
+        """Test a lower id committed after a rollup is still rolled up"""
+        def create(pk, hour):
+            Reading.objects.create(pk=pk, product_id=self.product,
+                                   hours='1.00',
+                                   recorded_at=datetime(2024, 1, 1, hour,
+                                                        tzinfo=timezone.utc))
+
+        create(10, 10)
+        self.assertEqual(rollup_readings(), 1)
+        create(5, 11)
+        self.assertEqual(rollup_readings(), 1)
+        self.assertEqual(rollup_readings(), 0)
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.unit_in_hours, Decimal('8.00'))
+        self.assertFalse(Reading.objects.filter(
+            rolled_up_at__isnull=True).exists())
+
+    def test_list_usage(self):
+        """Test users only see the rollups of their products"""
+        Reading.objects.bulk_create([
+            Reading(product_id=product, hours='1.00',
+                    recorded_at=datetime(2024, 1, 1, 10,
+                                         tzinfo=timezone.utc))
+            for product in (self.product, self.other_product)
+        ])
+        rollup_readings()
+
+        res = self.client.get(LIST_USAGE_URL, {'period': 'day'})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['count'], 1)
+        result = res.data['results'][0]
+        self.assertEqual(result['product_id'], self.product.pk)
+        self.assertEqual(result['hours'], '1.00')
+
+
+@override_settings(RESPONSE_CACHE={'ALIAS': 'default', 'TIMEOUT': 0})
+class streamIngestTest(TransactionTestCase):
+    """Test the NDJSON ingestion pipeline, which writes from a thread"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='test@husteen.com',
+            password='password@123'
+        )
+        self.product = Product.objects.create(user_id=self.user)
+        other = get_user_model().objects.create_user(
+            email='other@husteen.com',
+            password='password@123'
+        )
+        self.other_product = Product.objects.create(user_id=other)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_stream_gzip_readings(self):
+        """Test valid lines are stored and invalid ones reported"""
+        body = ndjson(
+            *[reading(self.product, '2024-01-01T10:%02d:00Z' % minute,
+                      '0.25') for minute in range(5)],
+            b'{not json',
+            reading(self.other_product, '2024-01-01T10:00:00Z', '0.25'),
+            reading(self.product, '2024-01-01T10:00:00Z', '-1'),
+            b'',
+            [1, 2],
+        )
+        with override_settings(USAGE=dict(
+                settings.USAGE, INGEST_BATCH_SIZE=2)):
+            res = self.client.post(STREAM_READINGS_URL, gzip.compress(body),
+                                   content_type='application/x-ndjson',
+                                   HTTP_CONTENT_ENCODING='gzip')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['accepted'], 5)
+        self.assertEqual(res.data['rejected'], 4)
+        self.assertEqual([error['line'] for error in res.data['errors']],
+                         [6, 7, 8, 10])
+        self.assertIn('product_id', res.data['errors'][1]['errors'])
+        self.assertIn('hours', res.data['errors'][2]['errors'])
+        self.assertEqual(Reading.objects.filter(
+            product_id=self.product).count(), 5)
+
+    def test_stream_limit_and_bad_gzip(self):
+        """Test oversized streams stop and corrupt bodies are refused"""
+        body = ndjson(*[reading(self.product, '2024-01-01T10:%02d:00Z'
+                                % minute, '0.25') for minute in range(3)])
+        with override_settings(USAGE=dict(
+                settings.USAGE, STREAM_MAX_READINGS=2)):
+            res = self.client.post(STREAM_READINGS_URL, body,
+                                   content_type='application/x-ndjson')
+        self.assertEqual(res.data['accepted'], 2)
+        self.assertEqual(res.data['rejected'], 1)
+
+        res = self.client.post(STREAM_READINGS_URL, body,
+                               content_type='application/x-ndjson',
+                               HTTP_CONTENT_ENCODING='gzip')
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_stream_failure_reports_and_retries(self):
+        """Test a failed write returns the report and resends are safe"""
+        body = ndjson(*[reading(self.product, '2024-01-01T10:%02d:00Z'
+                                % minute, '0.25') for minute in range(4)])
+        bulk_create = Reading.objects.bulk_create
+        batches = []
+
+        def fail_second_batch(batch, **kwargs):
+            batches.append(batch)
+            if len(batches) == 2:
+                raise IntegrityError('product deleted')
+            return bulk_create(batch, **kwargs)
+
+        with override_settings(USAGE=dict(
+                settings.USAGE, INGEST_BATCH_SIZE=2)):
+            with mock.patch.object(Reading.objects, 'bulk_create',
+                                   side_effect=fail_second_batch), \
+                    self.assertLogs('usage.views', 'ERROR'):
+                res = self.client.post(STREAM_READINGS_URL, body,
+                                       content_type='application/x-ndjson')
+            self.assertEqual(res.status_code,
+                             status.HTTP_500_INTERNAL_SERVER_ERROR)
+            self.assertEqual(res.data['accepted'], 2)
+            self.assertTrue(res.data['failed'])
+            self.assertEqual(Reading.objects.count(), 2)
+
+            res = self.client.post(STREAM_READINGS_URL, body,
+                                   content_type='application/x-ndjson')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['accepted'], 2)
+        self.assertEqual(res.data['duplicates'], 2)
+        self.assertFalse(res.data['failed'])
+        self.assertEqual(Reading.objects.count(), 4)
+
+    def test_stream_size_limits(self):
+        """Test long lines are skipped and big bodies are cut off"""
+        body = ndjson(reading(self.product, '2024-01-01T10:00:00Z', '0.25'),
+                      {'padding': 'x' * 200},
+                      reading(self.product, '2024-01-01T11:00:00Z', '0.25'))
+        bomb = gzip.compress(b' ' * 10 ** 6)
+        with override_settings(USAGE=dict(
+                settings.USAGE, STREAM_MAX_LINE_BYTES=100,
+                STREAM_MAX_BYTES=1000)):
+            res = self.client.post(STREAM_READINGS_URL, body,
+                                   content_type='application/x-ndjson')
+            self.assertEqual(res.data['accepted'], 2)
+            self.assertEqual(res.data['errors'], [
+                {'line': 2, 'errors': 'Line longer than 100 bytes.'}])
+
+            res = self.client.post(STREAM_READINGS_URL, bomb,
+                                   content_type='application/x-ndjson',
+                                   HTTP_CONTENT_ENCODING='gzip')
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            self.assertEqual(res.data['accepted'], 0)
+            self.assertEqual(res.data['rejected'], 1)
+            self.assertIn('Stream larger than 1000 bytes',
+                          res.data['errors'][0]['errors'])
+
+    def test_load_readings_command(self):
+        """Test dropped files are loaded for any product and archived"""
+        with tempfile.TemporaryDirectory() as drop, \
+                tempfile.TemporaryDirectory() as archive:
+            with gzip.open(os.path.join(drop, 'a.ndjson.gz'), 'wb') as f:
+                f.write(ndjson(
+                    reading(self.product, '2024-01-01T10:00:00Z', '1.00'),
+                    reading(self.other_product, '2024-01-01T10:00:00Z',
+                            '2.00')))
+            with open(os.path.join(drop, 'b.ndjson'), 'wb') as f:
+                f.write(ndjson({'product_id': 0,
+                                'recorded_at': '2024-01-01T10:00:00Z',
+                                'hours': '1.00'}))
+            with open(os.path.join(drop, 'notes.txt'), 'w') as f:
+                f.write('skipped')
+
+            out = StringIO()
+            call_command('load_readings', drop, archive=archive,
+                         stdout=out, stderr=StringIO())
+
+            self.assertIn('Accepted 2 readings, skipped 0 duplicates, '
+                          'rejected 1.', out.getvalue())
+            self.assertEqual(sorted(os.listdir(archive)),
+                             ['a.ndjson.gz', 'b.ndjson'])
+            self.assertEqual(os.listdir(drop), ['notes.txt'])
+        self.assertEqual(Reading.objects.count(), 2)
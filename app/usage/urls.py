@@ -0,0 +1,10 @@
+from django.urls import path
+from usage import views
+
+urlpatterns = [
+     path('readings', views.IngestReadingsAPIView.as_view(),
+          name="ingest-readings"),
+     path('readings/stream', views.StreamReadingsAPIView.as_view(),
+          name="stream-readings"),
+     path('', views.ListUsageAPIView.as_view(), name="list-usage"),
+]
@@ -0,0 +1,89 @@
+import logging
+
+from rest_framework import generics, status
+from rest_framework.exceptions import ParseError
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from django_filters.rest_framework import DjangoFilterBackend
+from django.conf import settings
+from accounts.authentication import CachedTokenAuthentication
+from usage import serializers
+from usage.ingest import ProductLookup, ingest_stream, open_lines
+from usage.models import UsageRollup
+from usage.services import ingest_readings
+from utils.renderers import CustomRenderer, FastCustomRenderer
+
+logger = logging.getLogger(__name__)
+
+
+class IngestReadingsAPIView(generics.GenericAPIView):
+    """Append a batch of consumption readings"""
+    authentication_classes = (CachedTokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+    serializer_class = serializers.ReadingSerializer
+    renderer_classes = [CustomRenderer]
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(
+            data=request.data, many=True, allow_empty=False,
+            max_length=settings.USAGE['INGEST_MAX_READINGS'])
+        serializer.is_valid(raise_exception=True)
+        readings = serializer.validated_data
+        created = ingest_readings(request.user, readings)
+        return Response({'created': created,
+                         'duplicates': len(readings) - created},
+                        status=status.HTTP_201_CREATED)
+
+
+class StreamReadingsAPIView(generics.GenericAPIView):
+    """Append readings streamed as NDJSON, optionally gzip compressed.
+
+    The body is parsed line by line while a writer thread stores the
+    readings, so it is never held in memory. Invalid or over-long lines
+    are rejected and reported without failing the request, reading stops
+    after STREAM_MAX_BYTES decompressed bytes. When storing fails the
+    partial report is returned with a 500; stored readings are skipped
+    when the client resends the stream.
+    """
+    authentication_classes = (CachedTokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+    renderer_classes = [CustomRenderer]
+
+    def post(self, request, *args, **kwargs):
+        stream = request.stream
+        if stream is None:
+            raise ParseError('Empty request body.')
+        compressed = request.headers.get('Content-Encoding') == 'gzip'
+        config = settings.USAGE
+        lines = open_lines(stream, compressed,
+                           max_bytes=config['STREAM_MAX_BYTES'])
+        try:
+            report = ingest_stream(lines, ProductLookup(request.user),
+                                   limit=config['STREAM_MAX_READINGS'])
+        except (OSError, EOFError) as exc:
+            raise ParseError('Invalid gzip body: %s' % exc)
+        if report.failure is not None:
+            logger.error('Storing streamed readings failed',
+                         exc_info=report.failure)
+            return Response(report.as_dict(),
+                            status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return Response(report.as_dict())
+
+
+class ListUsageAPIView(generics.ListAPIView):
+    """Hourly or daily consumption of the user's products"""
+    authentication_classes = (CachedTokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+    serializer_class = serializers.UsageRollupSerializer
+    renderer_classes = [FastCustomRenderer]
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = {
+        'period': ['exact'],
+        'product_id': ['exact'],
+        'bucket': ['gte', 'lt'],
+    }
+
+    def get_queryset(self):
+        return UsageRollup.objects.filter(
+            product_id__user_id=self.request.user.id
+        ).order_by('-bucket', 'product_id')
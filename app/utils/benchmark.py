@@ -0,0 +1,53 @@
+from contextlib import contextmanager
+import math
+import os
+import tempfile
+import time
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import setup_databases, teardown_databases
+
+
+@contextmanager
+def benchmark_database(verbosity=0, file_backed=False):
+    """Run the block against freshly created test databases.
+
+    Benchmarks seed and mutate a lot of rows so they never touch the
+    configured databases. With `file_backed`, a SQLite test database is
+    created in a temporary file instead of memory, for large volumes or
+    concurrent connections.
+    """
+    settings_dict = connections.settings[DEFAULT_DB_ALIAS]
+    test_name = settings_dict['TEST'].get('NAME')
+    with tempfile.TemporaryDirectory() as directory:
+        if file_backed and settings_dict['ENGINE'].endswith('sqlite3'):
+            settings_dict['TEST']['NAME'] = os.path.join(
+                directory, 'benchmark.sqlite3')
+        try:
+            old_config = setup_databases(verbosity, interactive=False)
+            try:
+                yield
+            finally:
+                teardown_databases(old_config, verbosity)
+        finally:
+            settings_dict['TEST']['NAME'] = test_name
+
+
+@contextmanager
+def timer():
+    """Yield a dict whose `elapsed` key is set when the block exits"""
+    result = {'elapsed': 0.0}
+    start = time.perf_counter()
+    try:
+        yield result
+    finally:
+        result['elapsed'] = time.perf_counter() - start
+
+
+def percentile(values, percent):
+    """Return the `percent` percentile of `values` by nearest rank"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(percent / 100 * len(ordered)))
+    return ordered[rank - 1]
@@ -0,0 +1,235 @@
+from collections import OrderedDict
+from urllib.parse import urlencode
+import hashlib
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Count, Max
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date, parse_http_date_safe
+from utils.routers import primary
+
+MISSING = object()
+
+
+class TTLCache:
+    """Thread-safe LRU mapping whose entries expire after `ttl` seconds"""
+
+    def __init__(self, maxsize, ttl, timer=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.timer = timer
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.entries.get(key, MISSING)
+            if entry is MISSING:
+                return default
+            value, expires = entry
+            if expires <= self.timer():
+                del self.entries[key]
+                return default
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (value, self.timer() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+
+def scope_version_key(scope):
+    return 'response-scope:%s' % scope
+
+
+def response_cache():
+    return caches[settings.RESPONSE_CACHE['ALIAS']]
+
+
+def new_scope_version():
+    """Return a unique version recording when it was created"""
+    return '%s-%.3f' % (uuid.uuid4().hex, time.time())
+
+
+def changed_recently(versions):
+    """Tell whether a version is younger than the replica sticky window.
+
+    Replicas may not have the writes behind such versions yet.
+    """
+    window = settings.REPLICA_ROUTING['STICKY_SECONDS']
+    now = time.time()
+    for version in versions:
+        _, dash, created = version.rpartition('-')
+        # versions written before they recorded a time are old enough
+        if dash and now - float(created) < window:
+            return True
+    return False
+
+
+def get_scope_versions(scopes):
+    """Return the current version of each scope, creating missing ones"""
+    cache = response_cache()
+    keys = [scope_version_key(scope) for scope in scopes]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, new_scope_version(), None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def invalidate_scopes(*scopes):
+    """Orphan every cached response that depends on one of `scopes`.
+
+    The versions change once the current transaction commits: changed
+    earlier, a concurrent GET could still read the old rows and cache
+    them under the new version.
+    """
+    if scopes:
+        transaction.on_commit(lambda: bump_scope_versions(scopes))
+
+
+def bump_scope_versions(scopes):
+    response_cache().set_many({
+        scope_version_key(scope): new_scope_version() for scope in scopes
+    }, None)
+
+
+class ConditionalResponseMixin:
+    """Answer conditional GETs from the newest `updated_at` of the queryset.
+
+    `get_validators()` runs one aggregate query for the row count and the
+    latest modification. A matching `If-None-Match` or `If-Modified-Since`
+    gets a 304 before anything is serialized, otherwise the validators are
+    sent as `ETag` and `Last-Modified`.
+    """
+    modified_field = 'updated_at'
+
+    def get_validators(self):
+        """Return the ETag and Last-Modified timestamp of the response"""
+        queryset = self.filter_queryset(self.get_queryset())
+        state = queryset.order_by().aggregate(
+            count=Count('pk'), last_modified=Max(self.modified_field))
+        if state['last_modified'] is None:
+            return None, None
+        tag = '%s|%s|%s' % (self.request.get_full_path(), state['count'],
+                            state['last_modified'].isoformat())
+        etag = quote_etag(hashlib.md5(tag.encode()).hexdigest())
+        return etag, int(state['last_modified'].timestamp())
+
+    def get(self, request, *args, **kwargs):
+        etag, last_modified = self.get_validators()
+        if etag is not None:
+            not_modified = get_conditional_response(
+                request, etag=etag, last_modified=last_modified)
+            if not_modified is not None:
+                return not_modified
+
+        response = super().get(request, *args, **kwargs)
+        if etag is not None and response.status_code == 200:
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+        return response
+
+
+class CachedResponseMixin:
+    """Cache rendered GET responses per user, endpoint and query params.
+
+    Cache keys embed the version of every scope returned by
+    `get_cache_scopes()`, so `invalidate_scopes()` makes the affected
+    entries unreachable. Responses are stored with their `ETag` and
+    `Last-Modified` headers and conditional requests matching them are
+    answered with 304 without re-serializing. Within the replica sticky
+    window of an invalidation, responses are built from the primary so
+    that a lagging replica is not cached under the new version.
+    """
+    cached_headers = ('ETag', 'Last-Modified')
+
+    def get_cache_scopes(self):
+        return ['user:%s' % self.request.user.pk]
+
+    def get_response_cache_key(self, versions):
+        request = self.request
+        params = urlencode(sorted(request.query_params.lists()), doseq=True)
+        parts = [
+            request.resolver_match.view_name,
+            request.path,
+            str(request.user.pk),
+            params,
+        ] + versions
+        digest = hashlib.md5('|'.join(parts).encode()).hexdigest()
+        return 'response:%s' % digest
+
+    def get(self, request, *args, **kwargs):
+        if not settings.RESPONSE_CACHE['TIMEOUT']:
+            return super().get(request, *args, **kwargs)
+        versions = get_scope_versions(self.get_cache_scopes())
+        key = self.get_response_cache_key(versions)
+        entry = response_cache().get(key)
+        if entry is None:
+            self.response_cache_key = key
+            if changed_recently(versions):
+                with primary():
+                    return super().get(request, *args, **kwargs)
+            return super().get(request, *args, **kwargs)
+
+        content, content_type, headers = entry
+        response = self.conditional_response(request, headers)
+        if response is None:
+            response = HttpResponse(content, content_type=content_type)
+        for header, value in headers.items():
+            response[header] = value
+        return response
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs)
+        key = getattr(self, 'response_cache_key', None)
+        if key is None or response.status_code != 200:
+            return response
+
+        response.render()
+        if not response.has_header('ETag'):
+            response['ETag'] = quote_etag(
+                hashlib.md5(response.content).hexdigest())
+        headers = {
+            header: response[header] for header in self.cached_headers
+            if response.has_header(header)
+        }
+        response_cache().set(
+            key, (response.content, response['Content-Type'], headers),
+            settings.RESPONSE_CACHE['TIMEOUT'])
+        conditional = self.conditional_response(request, headers)
+        if conditional is not None:
+            for header, value in headers.items():
+                conditional[header] = value
+            return conditional
+        return response
+
+    def conditional_response(self, request, headers):
+        """Return a 304 or 412 response when `headers` answer the request"""
+        last_modified = headers.get('Last-Modified')
+        if last_modified is not None:
+            last_modified = parse_http_date_safe(last_modified)
+        return get_conditional_response(
+            request, etag=headers.get('ETag'), last_modified=last_modified)
@@ -0,0 +1,38 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.checks import Error, register
+
+
+def per_process(alias):
+    """Tell whether the cache `alias` is private to each process"""
+    return isinstance(caches[alias], LocMemCache)
+
+
+@register()
+def check_response_cache(app_configs, **kwargs):
+    """Refuse response caching on a cache that other processes miss"""
+    config = settings.RESPONSE_CACHE
+    if config['TIMEOUT'] and per_process(config['ALIAS']):
+        return [Error(
+            'RESPONSE_CACHE uses the per-process cache %r.' % config['ALIAS'],
+            hint='Invalidations would only reach the process that wrote. '
+                 'Set CACHE_URL or a RESPONSE_CACHE TIMEOUT of 0.',
+            id='utils.E001',
+        )]
+    return []
+
+
+@register()
+def check_replica_routing(app_configs, **kwargs):
+    """Refuse replica stickiness that other processes cannot see"""
+    config = settings.REPLICA_ROUTING
+    if config['REPLICAS'] and per_process(config['CACHE']):
+        return [Error(
+            'REPLICA_ROUTING remembers writers in the per-process cache '
+            '%r.' % config['CACHE'],
+            hint='A request after a write may reach another process and '
+                 'read a lagging replica. Set CACHE_URL.',
+            id='utils.E002',
+        )]
+    return []
@@ -0,0 +1,213 @@
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+from itertools import accumulate, chain
+import random
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import connection
+from django.db.models import Max
+from django.db.transaction import atomic
+from django.utils import timezone
+from accounts.onboarding import chunked
+from products.models import Product
+from transactions.models import AMOUNT_PER_HOUR, Transaction, purchased_hours
+from transactions.services import rebuild_ledgers
+from utils.cache import invalidate_scopes
+
+FACTORY_BATCH_SIZE = 5000
+FACTORY_PASSWORD = 'password@123'
+
+# Share of each status among generated transactions
+STATUS_MIX = (('success', 0.75), ('pending', 0.2), ('failed', 0.05))
+
+# Generated amounts buy between 1 and MAX_HOURS hours
+MAX_HOURS = 20
+
+# Parameters per multi-row INSERT on backends without executemany speed
+MAX_QUERY_PARAMS = 32000
+
+
+def insert_rows(model, fields, rows, batch_size=FACTORY_BATCH_SIZE):
+    """Insert value tuples for `fields` of `model` without instances.
+
+    Values must already be prepared for the database. Concrete fields
+    missing from `fields` get their default, or the current time for
+    `auto_now` and `auto_now_add` fields. SQLite runs `executemany`, other
+    backends multi-row INSERTs. Returns the number of inserted rows.
+    """
+    now = timezone.now()
+    model_fields = [model._meta.get_field(name) for name in fields]
+    missing = [field for field in model._meta.concrete_fields
+               if field not in model_fields and not field.primary_key]
+    defaults = tuple(
+        field.get_db_prep_save(
+            now if getattr(field, 'auto_now', False)
+            or getattr(field, 'auto_now_add', False)
+            else field.get_default(), connection)
+        for field in missing)
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(field.column)
+                        for field in model_fields + missing)
+    width = len(model_fields) + len(missing)
+    row_sql = '(%s)' % ', '.join(['%s'] * width)
+    sql = 'INSERT INTO %s (%s) VALUES ' % (quote(model._meta.db_table),
+                                           columns)
+    rows_per_query = max(1, MAX_QUERY_PARAMS // width)
+
+    inserted = 0
+    with connection.cursor() as cursor:
+        for batch in chunked((row + defaults for row in rows), batch_size):
+            if connection.vendor == 'sqlite':
+                cursor.executemany(sql + row_sql, batch)
+            else:
+                for part in chunked(batch, rows_per_query):
+                    cursor.execute(sql + ', '.join([row_sql] * len(part)),
+                                   list(chain.from_iterable(part)))
+            inserted += len(batch)
+    return inserted
+
+
+@contextmanager
+def deferred_indexes(*models):
+    """Drop the `Meta.indexes` of `models` and build them after the block.
+
+    One index build after a bulk load is much cheaper than updating
+    every index for each inserted row.
+    """
+    with connection.schema_editor() as editor:
+        for model in models:
+            for index in model._meta.indexes:
+                editor.remove_index(model, index)
+    try:
+        yield
+    finally:
+        with connection.schema_editor() as editor:
+            for model in models:
+                for index in model._meta.indexes:
+                    editor.add_index(model, index)
+
+
+def reset_sequences(*models):
+    """Move primary key sequences past explicitly inserted ids"""
+    statements = connection.ops.sequence_reset_sql(no_style(), models)
+    with connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+
+def next_id(model):
+    return (model.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+
+
+def invalidate_users(user_ids, batch_size=FACTORY_BATCH_SIZE):
+    """Drop cached responses of users whose rows were inserted raw.
+
+    The raw inserts send no signals, so the response cache would keep
+    serving the payloads from before the seeding.
+    """
+    for chunk in chunked(sorted(set(user_ids)), batch_size):
+        invalidate_scopes(*('user:%s' % user_id for user_id in chunk))
+
+
+def create_users(count, email_prefix='user', password=FACTORY_PASSWORD,
+                 batch_size=FACTORY_BATCH_SIZE):
+    """Insert `count` users with one product each.
+
+    The password is hashed once and shared by every user. Ids are
+    assigned up front so products need no lookups. Returns a list of
+    `(user_id, product_id)` pairs.
+    """
+    User = get_user_model()
+    password_hash = make_password(password)
+
+    def user(number):
+        return {
+            'id': first_user + number,
+            'password': password_hash,
+            'is_superuser': False,
+            'email': '%s%d@example.com' % (email_prefix,
+                                           first_user + number),
+            'first_name': 'User',
+            'last_name': str(number),
+            'phone_number': '0803%07d' % number,
+            'state': 'Lagos',
+            'address': 'Lagos, Nigeria',
+            'is_active': True,
+            'is_staff': False,
+        }
+
+    with atomic():
+        first_user = next_id(User)
+        first_product = next_id(Product)
+        # columns follow the model, other fields get their defaults
+        fields = [field.attname for field in User._meta.concrete_fields
+                  if field.attname in user(0)]
+        users = (tuple(values[name] for name in fields)
+                 for values in map(user, range(count)))
+        insert_rows(User, fields, users, batch_size)
+        pairs = [(first_user + number, first_product + number)
+                 for number in range(count)]
+        insert_rows(Product, ['user_id', 'id'], pairs, batch_size)
+        reset_sequences(User, Product)
+    invalidate_users((user_id for user_id, _ in pairs), batch_size)
+    return pairs
+
+
+def create_transactions(pairs, count, status_mix=STATUS_MIX,
+                        batch_size=FACTORY_BATCH_SIZE, seed=None, skew=0.0,
+                        days=365):
+    """Insert `count` transactions over the `(user_id, product_id)` pairs.
+
+    With `skew` 0 every pair gets the same share. Higher values follow
+    Zipf's law, so the first pairs own most transactions, like heavy
+    customers do. Creation times grow with the id over the last `days`.
+    Ledgers are rebuilt once at the end and the cached responses of the
+    owners are invalidated.
+    """
+    if count > 0 and not pairs:
+        raise ValueError('Transactions need at least one owner.')
+    rng = random.Random(seed)
+    owners = list(accumulate(1 / (rank ** skew)
+                             for rank in range(1, len(pairs) + 1)))
+    statuses = [status for status, _ in status_mix]
+    status_weights = list(accumulate(weight for _, weight in status_mix))
+
+    # prepare the few distinct values once instead of per row
+    field = Transaction._meta.get_field
+    amounts = [(field('amount').get_db_prep_save(amount, connection),
+                field('purchased_hour').get_db_prep_save(
+                    purchased_hours(amount), connection))
+               for amount in (Decimal(hours * AMOUNT_PER_HOUR)
+                              for hours in range(1, MAX_HOURS + 1))]
+    prepare_time = field('created_at').get_db_prep_save
+    start = timezone.now() - timedelta(days=days)
+    step = timedelta(days=days) / max(1, count)
+    owner_ids = set()
+
+    def transactions():
+        for offset in range(0, count, batch_size):
+            size = min(batch_size, count - offset)
+            batch_owners = rng.choices(pairs, cum_weights=owners, k=size)
+            batch_statuses = rng.choices(statuses,
+                                         cum_weights=status_weights, k=size)
+            batch_amounts = rng.choices(amounts, k=size)
+            owner_ids.update(user_id for user_id, _ in batch_owners)
+            for number, ((user_id, product_id), status,
+                         (amount, hours)) in enumerate(zip(
+                    batch_owners, batch_statuses, batch_amounts), offset):
+                created_at = prepare_time(start + step * number, connection)
+                yield (user_id, product_id, '%032x' % rng.getrandbits(128),
+                       status, status == 'success', amount, 'paystack',
+                       hours, created_at, created_at)
+
+    with atomic():
+        insert_rows(Transaction, ['user_id', 'product_id', 'reference',
+                                  'status', 'is_active', 'amount',
+                                  'payment_channel', 'purchased_hour',
+                                  'created_at', 'updated_at'],
+                    transactions(), batch_size)
+        rebuild_ledgers()
+    invalidate_users(owner_ids, batch_size)
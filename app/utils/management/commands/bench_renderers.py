@@ -0,0 +1,66 @@
+from decimal import Decimal
+import json
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.response import Response
+from transactions.models import Transaction
+from transactions.serializers import RetrieveTransactionSerializer
+from utils.benchmark import timer
+from utils.renderers import CustomRenderer, FastCustomRenderer, orjson
+
+
+class Command(BaseCommand):
+    """Compare the stdlib and fast-path envelope renderers"""
+    help = "Benchmark CustomRenderer against FastCustomRenderer."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000,
+                            help='Transactions in the rendered page.')
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        page = self.build_page(options['rows'])
+        context = {'response': Response(status=200)}
+
+        outputs = {}
+        for renderer_class in (CustomRenderer, FastCustomRenderer):
+            renderer = renderer_class()
+            with timer() as result:
+                for _ in range(options['repeat']):
+                    output = renderer.render(page, renderer_context=context)
+            outputs[renderer_class] = output
+            self.stdout.write('%-20s %8.2f ms/render %8.1f MB/s' % (
+                renderer_class.__name__,
+                result['elapsed'] * 1000 / options['repeat'],
+                len(output) * options['repeat'] / result['elapsed'] / 1e6))
+
+        if orjson is None:
+            self.stdout.write('orjson is not installed, FastCustomRenderer '
+                              'used the stdlib encoder.')
+        if json.loads(outputs[CustomRenderer]) != json.loads(
+                outputs[FastCustomRenderer]):
+            self.stderr.write('Renderer outputs differ.')
+
+    def build_page(self, rows):
+        """Serialize `rows` unsaved transactions like a list page"""
+        now = timezone.now()
+        transactions = [
+            Transaction(id=pk,
+                        product_id_id=1,
+                        user_id_id=1,
+                        reference='%032x' % pk,
+                        amount=Decimal('100000.00'),
+                        payment_channel='paystack',
+                        purchased_hour=Decimal('2.00'),
+                        created_at=now,
+                        updated_at=now)
+            for pk in range(1, rows + 1)
+        ]
+        return {
+            'count': rows,
+            'next': None,
+            'previous': None,
+            'results': RetrieveTransactionSerializer(
+                transactions, many=True).data,
+        }
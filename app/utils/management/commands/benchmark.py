@@ -0,0 +1,267 @@
+import json
+import logging
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from accounts import urls as accounts_urls
+from transactions import urls as transactions_urls
+from transactions.models import Transaction
+from utils.benchmark import benchmark_database, percentile, timer
+from utils.factories import (FACTORY_PASSWORD,
+                             create_transactions,
+                             create_users,
+                             deferred_indexes)
+
+# Endpoints that hash a password on every request run fewer iterations
+SLOW_ENDPOINTS = ('users:create', 'users:create-admin', 'users:token',
+                  'users:bulk-create')
+VALIDATE_BATCH_SIZE = 20
+# Repeated GETs would be answered from the response cache, measure the
+# database work instead
+UNCACHED = {'ALIAS': 'default', 'TIMEOUT': 0}
+
+
+class Command(BaseCommand):
+    """Measure every accounts and transactions endpoint on seeded data"""
+    help = "Seed a throwaway database and benchmark every URL of " \
+           "accounts.urls and transactions.urls, optionally against a " \
+           "stored baseline."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100000)
+        parser.add_argument('--transactions', type=int, default=5000000)
+        parser.add_argument('--iterations', type=int, default=50,
+                            help='Requests per endpoint.')
+        parser.add_argument('--output', help='Write the results as JSON.')
+        parser.add_argument('--baseline',
+                            help='JSON results to compare against.')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='Allowed p95 slowdown against the '
+                                 'baseline, as a fraction.')
+
+    def handle(self, *args, **options):
+        scenarios = self.get_scenarios()
+        missing = sorted(set(self.url_names()) - set(scenarios))
+        if missing:
+            raise CommandError('No benchmark scenario for: %s.'
+                               % ', '.join(missing))
+
+        with benchmark_database(file_backed=True):
+            with timer() as seeding:
+                self.seed(options['users'], options['transactions'])
+            self.stdout.write('Seeded %d users and %d transactions in '
+                              '%.1fs.' % (options['users'],
+                                          options['transactions'],
+                                          seeding['elapsed']))
+            endpoints = self.run_scenarios(scenarios, options['iterations'])
+
+        results = {
+            'vendor': connection.vendor,
+            'users': options['users'],
+            'transactions': options['transactions'],
+            'iterations': options['iterations'],
+            'endpoints': endpoints,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, indent=2, sort_keys=True)
+        if options['baseline']:
+            self.compare(endpoints, options['baseline'],
+                         options['tolerance'])
+
+    def url_names(self):
+        for pattern in accounts_urls.urlpatterns:
+            yield '%s:%s' % (accounts_urls.app_name, pattern.name)
+        for pattern in transactions_urls.urlpatterns:
+            yield pattern.name
+
+    def seed(self, users, transactions):
+        pairs = create_users(users)
+        with deferred_indexes(Transaction):
+            create_transactions(pairs, transactions, seed=0)
+
+        User = get_user_model()
+        self.admin = User.objects.create_superuser(
+            email='bench-admin@example.com', password=FACTORY_PASSWORD)
+        self.customer = User.objects.get(pk=pairs[0][0])
+        self.admin_client = self.token_client(self.admin)
+        self.customer_client = self.token_client(self.customer)
+        self.references = list(Transaction.objects.filter(
+            user_id=self.customer).values_list('reference', flat=True)[:50])
+        self.pending = list(Transaction.objects.filter(
+            status='pending').values_list('reference', flat=True)[:20000])
+
+    def token_client(self, user):
+        client = APIClient(raise_request_exception=False)
+        token = Token.objects.create(user=user)
+        client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+        return client
+
+    def next_pending(self, count=1):
+        if len(self.pending) < count:
+            raise CommandError('Ran out of pending transactions, seed '
+                               'more transactions or lower --iterations.')
+        references = self.pending[-count:]
+        del self.pending[-count:]
+        return references
+
+    def get_scenarios(self):
+        """Map URL names to functions building the i-th request.
+
+        Each function returns the client, method, URL and payload.
+        """
+        def new_user(number):
+            return {
+                'email': 'bench-new-%s@example.com' % number,
+                'password': FACTORY_PASSWORD,
+                'first_name': 'Bench',
+                'last_name': 'User',
+                'phone_number': '08030000000',
+            }
+
+        transaction = {'amount': 100000, 'payment_channel': 'paystack'}
+        return {
+            'users:create': lambda i: (
+                self.admin_client, 'post', reverse('users:create'),
+                new_user(i)),
+            'users:bulk-create': lambda i: (
+                self.admin_client, 'post', reverse('users:bulk-create'),
+                [new_user('%d-%d' % (i, row)) for row in range(10)]),
+            'users:token': lambda i: (
+                APIClient(), 'post', reverse('users:token'),
+                {'email': self.customer.email,
+                 'password': FACTORY_PASSWORD}),
+            'users:update': lambda i: (
+                self.customer_client, 'get', reverse('users:update'), None),
+            'users:create-admin': lambda i: (
+                self.admin_client, 'post', reverse('users:create-admin'),
+                new_user('admin-%d' % i)),
+            'users:update-user-details': lambda i: (
+                self.admin_client, 'get',
+                reverse('users:update-user-details',
+                        args=[self.customer.pk]), None),
+            'users:list-user': lambda i: (
+                self.admin_client, 'get', reverse('users:list-user'), None),
+            'create-transaction': lambda i: (
+                self.customer_client, 'post', reverse('create-transaction'),
+                transaction),
+            'bulk-create-transaction': lambda i: (
+                self.customer_client, 'post',
+                reverse('bulk-create-transaction'), [transaction] * 100),
+            'bulk-validate-transaction': lambda i: (
+                self.customer_client, 'post',
+                reverse('bulk-validate-transaction'),
+                {'references': self.next_pending(VALIDATE_BATCH_SIZE)}),
+            'validate-transaction': lambda i: (
+                self.customer_client, 'put',
+                reverse('validate-transaction',
+                        args=self.next_pending()), None),
+            'async-create-transaction': lambda i: (
+                self.customer_client, 'post',
+                reverse('async-create-transaction'), transaction),
+            'async-retrieve-transaction': lambda i: (
+                self.customer_client, 'get',
+                reverse('async-retrieve-transaction',
+                        args=[self.references[i % len(self.references)]]),
+                None),
+            'async-customer-transaction': lambda i: (
+                self.customer_client, 'get',
+                reverse('async-customer-transaction'), None),
+            'retrieve-transaction': lambda i: (
+                self.customer_client, 'get',
+                reverse('retrieve-transaction',
+                        args=[self.references[i % len(self.references)]]),
+                None),
+            'customer-transaction': lambda i: (
+                self.customer_client, 'get',
+                reverse('customer-transaction'), None),
+            'export-transaction': lambda i: (
+                self.admin_client, 'get', reverse('export-transaction'),
+                {'user_id': self.customer.pk}),
+            'list-customer-transaction': lambda i: (
+                self.admin_client, 'get',
+                reverse('list-customer-transaction'), None),
+        }
+
+    def run_scenarios(self, scenarios, iterations):
+        request_logger = logging.getLogger('django.request')
+        level = request_logger.level
+        request_logger.setLevel(logging.CRITICAL)
+        try:
+            with override_settings(RESPONSE_CACHE=UNCACHED):
+                return {
+                    name: self.run_scenario(
+                        name, scenario,
+                        max(1, iterations // 10) if name in SLOW_ENDPOINTS
+                        else iterations)
+                    for name, scenario in scenarios.items()
+                }
+        finally:
+            request_logger.setLevel(level)
+
+    def run_scenario(self, name, scenario, iterations):
+        latencies = []
+        queries = []
+        errors = 0
+        with timer() as total:
+            for number in range(iterations):
+                client, method, url, data = scenario(number)
+                with CaptureQueriesContext(connection) as captured, \
+                        timer() as elapsed:
+                    response = getattr(client, method)(
+                        url, data, format=None if method == 'get' else 'json')
+                    if response.streaming:
+                        b''.join(response.streaming_content)
+                latencies.append(elapsed['elapsed'])
+                queries.append(len(captured))
+                errors += response.status_code >= 400
+
+        result = {
+            'requests': iterations,
+            'errors': errors,
+            'throughput': iterations / total['elapsed'],
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p95_ms': percentile(latencies, 95) * 1000,
+            'p99_ms': percentile(latencies, 99) * 1000,
+            'queries_mean': sum(queries) / len(queries),
+            'queries_max': max(queries),
+        }
+        self.stdout.write(
+            '%-28s %8.1f req/s p50 %8.2f p95 %8.2f p99 %8.2f ms '
+            '%5.1f queries %d errors' % (
+                name, result['throughput'], result['p50_ms'],
+                result['p95_ms'], result['p99_ms'], result['queries_mean'],
+                errors))
+        return result
+
+    def compare(self, endpoints, path, tolerance):
+        """Fail on p95 slowdowns above `tolerance`, extra queries or errors"""
+        with open(path) as baseline_file:
+            baseline = json.load(baseline_file)['endpoints']
+
+        regressions = []
+        for name, expected in baseline.items():
+            result = endpoints.get(name)
+            if result is None:
+                continue
+            if result['p95_ms'] > expected['p95_ms'] * (1 + tolerance):
+                regressions.append('%s p95 %.2fms > baseline %.2fms' % (
+                    name, result['p95_ms'], expected['p95_ms']))
+            if result['queries_max'] > expected['queries_max']:
+                regressions.append('%s runs %d queries > baseline %d' % (
+                    name, result['queries_max'], expected['queries_max']))
+            if result['errors'] > expected['errors']:
+                regressions.append('%s fails %d requests > baseline %d' % (
+                    name, result['errors'], expected['errors']))
+
+        if regressions:
+            raise CommandError('Regressions against %s:\n%s' % (
+                path, '\n'.join(regressions)))
+        self.stdout.write(self.style.SUCCESS(
+            'No regression against %s.' % path))
@@ -0,0 +1,136 @@
+from urllib.parse import urlsplit
+import asyncio
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from utils.benchmark import percentile
+
+
+class HttpConnection:
+    """Minimal keep-alive HTTP/1.1 client connection"""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = self.writer = None
+
+    async def request(self, payload):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(
+                self.host, self.port)
+        self.writer.write(payload)
+        await self.writer.drain()
+
+        status = int((await self.reader.readline()).split()[1])
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get('transfer-encoding') == 'chunked':
+            while True:
+                size = int((await self.reader.readline()).strip(), 16)
+                await self.reader.readexactly(size + 2)
+                if not size:
+                    break
+        elif 'content-length' in headers:
+            await self.reader.readexactly(int(headers['content-length']))
+        else:
+            await self.reader.read()
+            headers['connection'] = 'close'
+
+        if headers.get('connection', '').lower() == 'close':
+            self.close()
+        return status
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+class Command(BaseCommand):
+    """Compare requests/sec and latency of running servers"""
+    help = "Load test one or more running servers, e.g. WSGI against ASGI."
+
+    def add_arguments(self, parser):
+        parser.add_argument('targets', nargs='+',
+                            help='label=URL pairs, e.g. '
+                                 'wsgi=http://localhost:8008/api/accounts/')
+        parser.add_argument('--token', help='API token of the client.')
+        parser.add_argument('--requests', type=int, default=10000)
+        parser.add_argument('--concurrency', type=int, default=200)
+        parser.add_argument('--method', default='GET')
+        parser.add_argument('--data', help='JSON body of every request.')
+
+    def handle(self, *args, **options):
+        self.stdout.write('%-12s %9s %7s %10s %9s %9s' % (
+            'target', 'requests', 'errors', 'req/s', 'p50 ms', 'p99 ms'))
+        for target in options['targets']:
+            label, _, url = target.rpartition('=')
+            parts = urlsplit(url)
+            if parts.scheme != 'http':
+                raise CommandError('Only http:// URLs are supported.')
+            payload = self.build_request(parts, options)
+            result = asyncio.run(self.load(
+                parts.hostname, parts.port or 80, payload, options))
+            self.stdout.write('%-12s %9d %7d %10.1f %9.2f %9.2f' % (
+                label or parts.netloc,
+                len(result['latencies']),
+                result['errors'],
+                len(result['latencies']) / result['elapsed'],
+                percentile(result['latencies'], 50) * 1000,
+                percentile(result['latencies'], 99) * 1000))
+
+    def build_request(self, parts, options):
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        lines = ['%s %s HTTP/1.1' % (options['method'].upper(), path),
+                 'Host: %s' % parts.netloc,
+                 'Connection: keep-alive']
+        if options['token']:
+            lines.append('Authorization: Token %s' % options['token'])
+        body = b''
+        if options['data']:
+            body = json.dumps(json.loads(options['data'])).encode()
+            lines.append('Content-Type: application/json')
+        lines.append('Content-Length: %d' % len(body))
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode() + body
+
+    async def load(self, host, port, payload, options):
+        latencies = []
+        errors = 0
+        remaining = options['requests']
+
+        async def worker():
+            nonlocal errors, remaining
+            connection = HttpConnection(host, port)
+            while remaining > 0:
+                remaining -= 1
+                start = time.perf_counter()
+                try:
+                    status = await connection.request(payload)
+                except (OSError, ValueError, IndexError,
+                        asyncio.IncompleteReadError):
+                    connection.close()
+                    errors += 1
+                    continue
+                if status >= 400:
+                    errors += 1
+                    continue
+                latencies.append(time.perf_counter() - start)
+            connection.close()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            worker() for _ in range(options['concurrency'])))
+        return {
+            'latencies': latencies,
+            'errors': errors,
+            'elapsed': time.perf_counter() - start,
+        }
@@ -0,0 +1,107 @@
+from argparse import ArgumentTypeError
+from contextlib import nullcontext
+import math
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from transactions.models import STATUS_CHOICES, Transaction
+from utils.benchmark import timer
+from utils.factories import (FACTORY_BATCH_SIZE,
+                             STATUS_MIX,
+                             create_transactions,
+                             create_users,
+                             deferred_indexes)
+
+# Page cache for the seeding connection, in KiB
+SQLITE_SEED_CACHE_SIZE = 512 * 1024
+
+
+def status_mix(value):
+    """Parse `success=0.75,pending=0.2,failed=0.05`"""
+    mix = []
+    for item in value.split(','):
+        status, _, weight = item.partition('=')
+        if status not in dict(STATUS_CHOICES):
+            raise ArgumentTypeError('Unknown status %r.' % status)
+        try:
+            mix.append((status, float(weight)))
+        except ValueError:
+            raise ArgumentTypeError('Invalid weight %r.' % weight)
+    error = status_mix_error(mix)
+    if error:
+        raise ArgumentTypeError(error)
+    return tuple(mix)
+
+
+def status_mix_error(mix):
+    """Return why the weights of `mix` cannot be drawn from, if they can't"""
+    weights = [weight for _, weight in mix]
+    if not all(math.isfinite(weight) and weight >= 0 for weight in weights):
+        return 'Status weights must be finite and not negative.'
+    if not any(weights):
+        return 'At least one status weight must be positive.'
+    return None
+
+
+class Command(BaseCommand):
+    """Fill the database with synthetic users, products and transactions"""
+    help = "Bulk insert synthetic users with one product each and " \
+           "transactions spread over them."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--transactions', type=int, default=1000000)
+        parser.add_argument('--skew', type=float, default=1.0,
+                            help="Zipf exponent of transactions per user, "
+                                 "0 spreads them evenly.")
+        parser.add_argument('--status-mix', type=status_mix,
+                            default=STATUS_MIX,
+                            help='e.g. success=0.75,pending=0.2,failed=0.05')
+        parser.add_argument('--days', type=int, default=365,
+                            help='Spread creation times over this many '
+                                 'days.')
+        parser.add_argument('--email-prefix', default='user')
+        parser.add_argument('--batch-size', type=int,
+                            default=FACTORY_BATCH_SIZE)
+        parser.add_argument('--seed', type=int, default=None,
+                            help='Random seed for reproducible data.')
+
+    def handle(self, *args, **options):
+        if options['transactions'] > 0 and options['users'] <= 0:
+            raise CommandError('Transactions need users to own them, '
+                               'pass --users 1 or more.')
+        error = status_mix_error(options['status_mix'])
+        if error:
+            raise CommandError(error)
+
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA cache_size = -%d'
+                               % SQLITE_SEED_CACHE_SIZE)
+
+        with timer() as users:
+            pairs = create_users(options['users'],
+                                 email_prefix=options['email_prefix'],
+                                 batch_size=options['batch_size'])
+        self.report('users', options['users'], users['elapsed'])
+
+        # rebuilding indexes only pays off when the table at least doubles
+        if options['transactions'] >= Transaction.objects.count():
+            indexes = deferred_indexes(Transaction)
+        else:
+            indexes = nullcontext()
+        with timer() as transactions:
+            with indexes:
+                create_transactions(pairs, options['transactions'],
+                                    status_mix=options['status_mix'],
+                                    batch_size=options['batch_size'],
+                                    seed=options['seed'],
+                                    skew=options['skew'],
+                                    days=options['days'])
+        self.report('transactions', options['transactions'],
+                    transactions['elapsed'])
+
+    def report(self, name, count, elapsed):
+        self.stdout.write(self.style.SUCCESS(
+            'Created %d %s in %.1fs (%.0f rows/min).' % (
+                count, name, elapsed, count / elapsed * 60 if elapsed else 0)))
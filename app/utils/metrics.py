@@ -0,0 +1,267 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+
+request_metrics = ContextVar('request_metrics', default=None)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+                    5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class RequestMetrics:
+    """Measurements of the request being served"""
+    __slots__ = ('queries', 'db_time', 'serialize_time', 'serializing',
+                 'render_time')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serialize_time = 0.0
+        self.serializing = False
+        self.render_time = 0.0
+
+
+def record_query(execute, sql, params, many, context):
+    """Database execute wrapper adding queries to the current request"""
+    metrics = request_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.db_time += time.perf_counter() - start
+        metrics.queries += 1
+
+
+def install_query_recorder(connection):
+    """Count the queries of `connection` in the current request.
+
+    Installed on every connection as it is created, so queries of
+    `sync_to_async` threads are counted for the request that awaits them.
+    """
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@contextmanager
+def record_render():
+    """Add the duration of the block to the current request's render time"""
+    metrics = request_metrics.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if metrics is not None:
+            metrics.render_time += time.perf_counter() - start
+
+
+@contextmanager
+def record_serialization():
+    """Add the duration of the block to the current request's
+    serialization time.
+
+    Blocks nested in one being recorded, like nested serializers, are
+    part of its duration and not added again.
+    """
+    metrics = request_metrics.get()
+    if metrics is None or metrics.serializing:
+        yield
+        return
+    metrics.serializing = True
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.serializing = False
+        metrics.serialize_time += time.perf_counter() - start
+
+
+class TimedRepresentationMixin:
+    """Serializer mixin recording `to_representation` with
+    `record_serialization`.
+
+    Queries run while serializing, e.g. for related fields, are part of
+    both the database and the serialization time.
+    """
+
+    def to_representation(self, instance):
+        with record_serialization():
+            return super().to_representation(instance)
+
+
+class Histogram:
+    """Prometheus histogram with one series per label set"""
+
+    def __init__(self, name, documentation, labels, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, label_values, value):
+        series = self.series.get(label_values)
+        if series is None:
+            series = self.series[label_values] = {
+                'counts': [0] * (len(self.buckets) + 1),
+                'sum': 0.0,
+            }
+        series['counts'][bisect_left(self.buckets, value)] += 1
+        series['sum'] += value
+
+    def expose(self):
+        lines = [
+            '# HELP %s %s' % (self.name, self.documentation),
+            '# TYPE %s histogram' % self.name,
+        ]
+        bounds = [repr(float(bound)) for bound in self.buckets] + ['+Inf']
+        for label_values, series in sorted(self.series.items()):
+            labels = ','.join('%s="%s"' % (label, escape(value))
+                              for label, value in zip(self.labels,
+                                                      label_values))
+            prefix = labels + ',' if labels else ''
+            total = 0
+            for bound, count in zip(bounds, series['counts']):
+                total += count
+                lines.append('%s_bucket{%sle="%s"} %d' % (
+                    self.name, prefix, bound, total))
+            lines.append('%s_sum{%s} %r' % (self.name, labels, series['sum']))
+            lines.append('%s_count{%s} %d' % (self.name, labels, total))
+        return lines
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"')
+
+
+class MetricsRegistry:
+    """Per process request histograms.
+
+    Every worker process keeps its own registry; Prometheus aggregates
+    the scraped series across instances.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.duration = Histogram(
+            'http_request_duration_seconds', 'Total request latency.',
+            ('view', 'method', 'status'), DURATION_BUCKETS)
+        self.queries = Histogram(
+            'http_request_db_queries', 'Database queries per request.',
+            ('view',), QUERY_BUCKETS)
+        self.db_time = Histogram(
+            'http_request_db_duration_seconds',
+            'Time spent in database queries per request.',
+            ('view',), DURATION_BUCKETS)
+        self.serialize_time = Histogram(
+            'http_response_serialize_duration_seconds',
+            'Time spent serializing the response data.',
+            ('view',), DURATION_BUCKETS)
+        self.render_time = Histogram(
+            'http_response_render_duration_seconds',
+            'Time spent rendering the response envelope.',
+            ('view',), DURATION_BUCKETS)
+
+    def observe(self, view, method, status, duration, metrics):
+        with self.lock:
+            self.duration.observe((view, method, str(status)), duration)
+            self.queries.observe((view,), metrics.queries)
+            self.db_time.observe((view,), metrics.db_time)
+            self.serialize_time.observe((view,), metrics.serialize_time)
+            self.render_time.observe((view,), metrics.render_time)
+
+    def expose(self):
+        with self.lock:
+            lines = []
+            for histogram in (self.duration, self.queries, self.db_time,
+                              self.serialize_time, self.render_time):
+                lines.extend(histogram.expose())
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+class MetricsMiddleware:
+    """Record latency, queries, serialization and render time of every
+    request.
+
+    Measurements are exposed per response in a `Server-Timing` header and
+    aggregated by resolved URL name in `registry` for `metrics_view`.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        start = time.perf_counter()
+        with self.recording(metrics):
+            response = self.get_response(request)
+        return self.record(request, response, metrics,
+                           time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        start = time.perf_counter()
+        with self.recording(metrics):
+            response = await self.get_response(request)
+        return self.record(request, response, metrics,
+                           time.perf_counter() - start)
+
+    @contextmanager
+    def recording(self, metrics):
+        """Make `metrics` current for the queries of every connection"""
+        for connection in connections.all():
+            # opened before utils.signals was connected
+            install_query_recorder(connection)
+        token = request_metrics.set(metrics)
+        try:
+            yield
+        finally:
+            request_metrics.reset(token)
+
+    def record(self, request, response, metrics, duration):
+        match = request.resolver_match
+        view = match.view_name if match is not None else 'unresolved'
+        registry.observe(view, request.method, response.status_code,
+                         duration, metrics)
+        response['Server-Timing'] = (
+            'db;dur=%.2f;desc="%d queries", serialize;dur=%.2f, '
+            'render;dur=%.2f, total;dur=%.2f' % (
+                metrics.db_time * 1000, metrics.queries,
+                metrics.serialize_time * 1000, metrics.render_time * 1000,
+                duration * 1000))
+        return response
+
+
+def metrics_view(request):
+    """Prometheus text exposition of `registry`.
+
+    Not found unless `METRICS['TOKEN']` is set or `DEBUG` is on.
+    """
+    token = settings.METRICS['TOKEN']
+    if not token and not settings.DEBUG:
+        raise Http404()
+    if token and request.META.get('HTTP_AUTHORIZATION') != 'Bearer ' + token:
+        return HttpResponseForbidden()
+    return HttpResponse(registry.expose(),
+                        content_type='text/plain; version=0.0.4')
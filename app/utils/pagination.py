@@ -0,0 +1,162 @@
+from collections import OrderedDict
+from math import ceil
+
+from rest_framework import pagination
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+FALSE_VALUES = ('0', 'false', 'no', 'off')
+
+
+class KeysetPagination(pagination.CursorPagination):
+    """Cursor pagination ordered on `-id`, or `-created_at` on request.
+
+    Pages are fetched with `WHERE id < <position>` so every page costs the
+    same as the first one, and no `COUNT(*)` is run.
+    """
+    ordering = '-id'
+    ordering_query_param = 'ordering'
+    orderings = {
+        '-id': ('-id',),
+        '-created_at': ('-created_at', '-id'),
+    }
+
+    def get_ordering(self, request, queryset, view):
+        ordering = request.query_params.get(self.ordering_query_param)
+        return self.orderings.get(ordering, (self.ordering,))
+
+
+class TransactionPagination(pagination.PageNumberPagination):
+    """Page number pagination with opt-in keyset and count-less modes.
+
+    `?pagination=cursor` switches to `KeysetPagination` and
+    `?count=false` skips the `COUNT(*)` of page number pagination.
+    """
+    mode_query_param = 'pagination'
+    count_query_param = 'count'
+    keyset_pagination_class = KeysetPagination
+
+    keyset_paginator = None
+    count_skipped = False
+
+    def paginate_queryset(self, queryset, request, view=None):
+        mode = request.query_params.get(self.mode_query_param)
+        if mode == 'cursor':
+            self.keyset_paginator = self.keyset_pagination_class()
+            return self.keyset_paginator.paginate_queryset(
+                queryset, request, view)
+
+        count = request.query_params.get(self.count_query_param, '')
+        if count.lower() not in FALSE_VALUES:
+            return super().paginate_queryset(queryset, request, view)
+        return self.paginate_queryset_without_count(queryset, request)
+
+    def paginate_queryset_without_count(self, queryset, request):
+        """Fetch one extra row to detect a next page instead of counting"""
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        try:
+            self.page_number = int(
+                request.query_params.get(self.page_query_param, 1))
+        except ValueError:
+            self.page_number = 0
+        if self.page_number < 1:
+            raise NotFound(self.invalid_page_message)
+
+        offset = (self.page_number - 1) * page_size
+        rows = list(queryset[offset:offset + page_size + 1])
+        self.has_next = len(rows) > page_size
+        self.count_skipped = True
+        self.request = request
+        return rows[:page_size]
+
+    def get_paginated_response(self, data):
+        if self.keyset_paginator is not None:
+            return self.keyset_paginator.get_paginated_response(data)
+        if not self.count_skipped:
+            return super().get_paginated_response(data)
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
+
+    def get_next_link(self):
+        if not self.count_skipped:
+            return super().get_next_link()
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.page_query_param,
+                                   self.page_number + 1)
+
+    def get_previous_link(self):
+        if not self.count_skipped:
+            return super().get_previous_link()
+        if self.page_number == 1:
+            return None
+        url = self.request.build_absolute_uri()
+        if self.page_number == 2:
+            return remove_query_param(url, self.page_query_param)
+        return replace_query_param(url, self.page_query_param,
+                                   self.page_number - 1)
+
+    def to_html(self):
+        if self.keyset_paginator is not None:
+            return self.keyset_paginator.to_html()
+        return super().to_html()
+
+
+class AsyncPageNumberPagination:
+    """Page number pagination for `AsyncAPIView` using the async ORM.
+
+    Returns the same `count`/`next`/`previous`/`results` payload as
+    PageNumberPagination.
+    """
+    page_size = api_settings.PAGE_SIZE
+    page_query_param = 'page'
+    invalid_page_message = pagination.PageNumberPagination.invalid_page_message
+
+    async def paginate_queryset(self, queryset, request):
+        try:
+            self.page_number = int(
+                request.GET.get(self.page_query_param, 1))
+        except ValueError:
+            self.page_number = 0
+        self.count = await queryset.acount()
+        last_page = max(1, ceil(self.count / self.page_size))
+        if not 1 <= self.page_number <= last_page:
+            raise NotFound(self.invalid_page_message)
+
+        self.last_page = last_page
+        self.request = request
+        offset = (self.page_number - 1) * self.page_size
+        return [row async for row in queryset[offset:offset + self.page_size]]
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('count', self.count),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
+
+    def get_next_link(self):
+        if self.page_number >= self.last_page:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.page_query_param,
+                                   self.page_number + 1)
+
+    def get_previous_link(self):
+        if self.page_number == 1:
+            return None
+        url = self.request.build_absolute_uri()
+        if self.page_number == 2:
+            return remove_query_param(url, self.page_query_param)
+        return replace_query_param(url, self.page_query_param,
+                                   self.page_number - 1)
@@ -1,9 +1,27 @@
 from rest_framework.renderers import JSONRenderer
+from utils.metrics import record_render
+
+try:
+    import orjson
+    ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+except ImportError:
+    orjson = None
 
 
 class CustomRenderer(JSONRenderer):
 
     def render(self, data, accepted_media_type=None, renderer_context=None):
+        with record_render():
+            return self.render_envelope(
+                data, accepted_media_type, renderer_context)
+
+    def render_envelope(self, data, accepted_media_type, renderer_context):
+        response = self.get_envelope(data, renderer_context)
+        return super(CustomRenderer, self).render(
+            response, accepted_media_type, renderer_context)
+
+    def get_envelope(self, data, renderer_context):
+        """Wrap `data` in the status/code/data/message envelope"""
         status_code = renderer_context['response'].status_code
         response = {
           "status": True,
@@ -17,8 +35,26 @@ class CustomRenderer(JSONRenderer):
             response["data"] = None
             try:
                 response["message"] = data["detail"]
-            except KeyError:
+            except (KeyError, TypeError):
                 response["data"] = data
 
-        return super(CustomRenderer, self).render(
-            response, accepted_media_type, renderer_context)
+        return response
+
+
+class FastCustomRenderer(CustomRenderer):
+    """CustomRenderer encoding with orjson when it is installed.
+
+    Falls back to the stdlib encoder of `CustomRenderer` without orjson
+    or when an indented response is requested. Types orjson does not
+    encode the same way as DRF are passed to DRF's encoder.
+    """
+    def render_envelope(self, data, accepted_media_type, renderer_context):
+        renderer_context = renderer_context or {}
+        if orjson is None or self.get_indent(
+                accepted_media_type, renderer_context):
+            return super().render_envelope(
+                data, accepted_media_type, renderer_context)
+
+        response = self.get_envelope(data, renderer_context)
+        return orjson.dumps(response, default=self.encoder_class().default,
+                            option=ORJSON_OPTIONS)
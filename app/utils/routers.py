@@ -0,0 +1,116 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+import hashlib
+import random
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Reads outside of requests, as in management commands and the shell,
+# stay on the primary: ReplicaRoutingMiddleware releases them per request
+use_primary = ContextVar('use_primary', default=True)
+
+
+@contextmanager
+def primary():
+    """Send every read of the block to the primary database"""
+    token = use_primary.set(True)
+    try:
+        yield
+    finally:
+        use_primary.reset(token)
+
+
+class ReplicaRouter:
+    """Send reads to one of REPLICA_ROUTING['REPLICAS'], writes to default.
+
+    Only reads of requests let through by `ReplicaRoutingMiddleware` go
+    to replicas. Reads stay on the primary outside of requests, inside
+    `primary()`, in pinned requests and in transactions open on the
+    primary, where they may depend on writes that replicas have not seen
+    yet.
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = settings.REPLICA_ROUTING['REPLICAS']
+        if (not replicas or use_primary.get()
+                or connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaRoutingMiddleware:
+    """Pin requests of clients that wrote recently to the primary.
+
+    Clients are told apart by their Authorization header or session
+    cookie before authentication runs. Unsafe requests read from the
+    primary and keep the client's reads there for
+    REPLICA_ROUTING['STICKY_SECONDS'], so a transaction is found right
+    after it was created.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        key, pinned = self.process_request(request)
+        token = use_primary.set(pinned)
+        try:
+            response = self.get_response(request)
+        finally:
+            use_primary.reset(token)
+        self.process_response(request, key)
+        return response
+
+    async def __acall__(self, request):
+        key, pinned = self.process_request(request)
+        token = use_primary.set(pinned)
+        try:
+            response = await self.get_response(request)
+        finally:
+            use_primary.reset(token)
+        self.process_response(request, key)
+        return response
+
+    def get_client_key(self, request):
+        credential = request.META.get('HTTP_AUTHORIZATION') or \
+            request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+        if not credential:
+            return None
+        digest = hashlib.sha256(credential.encode()).hexdigest()
+        return 'replica-sticky:%s' % digest
+
+    def process_request(self, request):
+        key = self.get_client_key(request)
+        if request.method not in SAFE_METHODS:
+            return key, True
+        if key is None:
+            return key, False
+        return key, bool(self.cache().get(key))
+
+    def process_response(self, request, key):
+        if key is not None and request.method not in SAFE_METHODS:
+            self.cache().set(key, True,
+                             settings.REPLICA_ROUTING['STICKY_SECONDS'])
+
+    def cache(self):
+        return caches[settings.REPLICA_ROUTING['CACHE']]
@@ -0,0 +1,47 @@
+import django
+from django.test import override_settings
+from django.test.runner import DiscoverRunner
+from django.test.runner import ParallelTestSuite as BaseParallelTestSuite
+
+# Settings of every test process, including parallel workers
+TEST_SETTINGS = {
+    # PBKDF2 iterations, hashing strength is not under test
+    'PASSWORD_HASH_ITERATIONS': 1,
+    # parallel test workers are daemonic and cannot start hashing processes
+    'ONBOARDING_HASH_WORKERS': 0,
+}
+
+
+class ParallelTestSuite(BaseParallelTestSuite):
+    """Parallel suite applying TEST_SETTINGS in spawned workers.
+
+    Forked workers inherit the settings of the runner, spawned ones, the
+    default on macOS, import the settings module afresh.
+    """
+
+    def process_setup(*args):
+        """Set up Django in a spawned worker.
+
+        Called through `__func__` without an instance, like the method it
+        overrides.
+        """
+        django.setup()
+        override_settings(**TEST_SETTINGS).enable()
+
+
+class TestRunner(DiscoverRunner):
+    """Test runner applying TEST_SETTINGS, e.g. single iteration hashing.
+
+    Parallel workers started with `--parallel` get the same settings and
+    each run against their own copy of the test database.
+    """
+    parallel_test_suite = ParallelTestSuite
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.test_settings = override_settings(**TEST_SETTINGS)
+        self.test_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.test_settings.disable()
+        super().teardown_test_environment(**kwargs)
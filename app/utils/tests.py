@@ -1,3 +1,469 @@
-# from django.test import TestCase
+from contextvars import copy_context
+from datetime import datetime, timezone
+from decimal import Decimal
+from unittest import mock
+import io
+import json
+import os
+import tempfile
+import threading
 
-# # Create your tests here.
+from django.conf import settings
+from django.core.management.base import CommandError
+from django.db import connection, connections
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import (SimpleTestCase, TestCase, TransactionTestCase,
+                         override_settings)
+from django.urls import reverse
+from rest_framework.test import APIClient
+from app.database import (OPTIMIZED_SQLITE_PRAGMAS,
+                          caches_from_env,
+                          database_from_env,
+                          sqlite_pragmas_from_env)
+from rest_framework.response import Response
+from utils import checks, renderers
+from transactions.models import Ledger, Transaction
+from utils.cache import TTLCache, get_scope_versions
+from utils.factories import create_transactions, create_users
+from utils.management.commands.benchmark import Command as BenchmarkCommand
+from utils.metrics import (Histogram, MetricsMiddleware, RequestMetrics,
+                           record_serialization, registry)
+from utils.renderers import CustomRenderer, FastCustomRenderer
+
+
+class fastRendererTest(SimpleTestCase):
+    """Test FastCustomRenderer keeps the CustomRenderer contract"""
+
+    def render(self, renderer_class, data, status_code=200):
+        context = {'response': Response(status=status_code)}
+        return renderer_class().render(data, renderer_context=context)
+
+    def assertSameOutput(self, data, status_code=200):
+        expected = self.render(CustomRenderer, data, status_code)
+        output = self.render(FastCustomRenderer, data, status_code)
+        self.assertEqual(json.loads(output), json.loads(expected))
+        return json.loads(output)
+
+    def test_success_envelope(self):
+        """Test successful responses render the same envelope"""
+        data = {
+            'amount': Decimal('100000.00'),
+            'created_at': datetime(2022, 11, 26, 15, 33, 0, 123456,
+                                   tzinfo=timezone.utc),
+            'reference': 'ref',
+        }
+        output = self.assertSameOutput(data)
+
+        self.assertTrue(output['status'])
+        self.assertEqual(output['data']['created_at'],
+                         '2022-11-26T15:33:00.123456Z')
+
+    def test_error_envelopes(self):
+        """Test error details and validation errors render the same"""
+        output = self.assertSameOutput({'detail': 'Not found.'}, 404)
+        self.assertEqual(output['message'], 'Not found.')
+        self.assertIsNone(output['data'])
+
+        output = self.assertSameOutput({'amount': ['Required.']}, 400)
+        self.assertEqual(output['data'], {'amount': ['Required.']})
+
+    def test_falls_back_without_orjson(self):
+        """Test the stdlib encoder is used when orjson is missing"""
+        with mock.patch.object(renderers, 'orjson', None):
+            output = self.render(FastCustomRenderer, {'id': 1})
+        self.assertEqual(output, self.render(CustomRenderer, {'id': 1}))
+
+
+class ttlCacheTest(SimpleTestCase):
+    """Test the in-process TTL LRU cache"""
+
+    def test_entries_expire(self):
+        """Test entries are dropped once their TTL has passed"""
+        now = [0]
+        cache = TTLCache(10, ttl=5, timer=lambda: now[0])
+        cache.set('key', 'value')
+        now[0] = 4
+        self.assertEqual(cache.get('key'), 'value')
+        now[0] = 5
+        self.assertIsNone(cache.get('key'))
+
+    def test_least_recently_used_entry_is_evicted(self):
+        """Test the cache stays bounded by evicting the oldest entry"""
+        cache = TTLCache(2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual((cache.get('a'), cache.get('b'), cache.get('c')),
+                         (1, None, 3))
+
+
+class databaseConfigTest(SimpleTestCase):
+    """Test the environment driven database settings"""
+
+    def test_default_sqlite(self):
+        """Test the local SQLite file is used without DATABASE_URL"""
+        config = database_from_env({}, '/srv/db.sqlite3')
+
+        self.assertEqual(config['ENGINE'], 'django.db.backends.sqlite3')
+        self.assertEqual(config['NAME'], '/srv/db.sqlite3')
+        self.assertEqual(config['CONN_MAX_AGE'], 0)
+
+    def test_server_database(self):
+        """Test a server URL gets persistent checked connections"""
+        config = database_from_env({
+            'DATABASE_URL': 'postgres://green:p%40ss@db:5433/energy'
+                            '?sslmode=require',
+            'DATABASE_POOLER': 'pgbouncer',
+        }, '/srv/db.sqlite3')
+
+        self.assertEqual(config['ENGINE'], 'django.db.backends.postgresql')
+        self.assertEqual(config['NAME'], 'energy')
+        self.assertEqual(config['USER'], 'green')
+        self.assertEqual(config['PASSWORD'], 'p@ss')
+        self.assertEqual(config['HOST'], 'db')
+        self.assertEqual(config['PORT'], '5433')
+        self.assertEqual(config['OPTIONS'], {'sslmode': 'require'})
+        self.assertEqual(config['CONN_MAX_AGE'], 60)
+        self.assertTrue(config['CONN_HEALTH_CHECKS'])
+        self.assertTrue(config['DISABLE_SERVER_SIDE_CURSORS'])
+
+    def test_unsupported_scheme(self):
+        """Test unknown DATABASE_URL schemes are rejected"""
+        with self.assertRaises(ValueError):
+            database_from_env({'DATABASE_URL': 'oracle://db/x'}, '')
+
+    def test_shared_cache(self):
+        """Test CACHE_URL adds a shared cache next to the local one"""
+        self.assertNotIn('shared', caches_from_env({}))
+        caches = caches_from_env({'CACHE_URL': 'redis://cache:6379/1'})
+        self.assertEqual(caches['shared'], {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': 'redis://cache:6379/1',
+        })
+        caches = caches_from_env({'CACHE_URL': 'memcached://cache:11211'})
+        self.assertEqual(caches['shared']['LOCATION'], 'cache:11211')
+        self.assertEqual(caches['default']['BACKEND'],
+                         'django.core.cache.backends.locmem.LocMemCache')
+        with self.assertRaises(ValueError):
+            caches_from_env({'CACHE_URL': 'mongodb://cache'})
+
+    @override_settings(CACHES={
+        'default': {'BACKEND':
+                    'django.core.cache.backends.locmem.LocMemCache'},
+        'shared': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+                   'LOCATION': 'cache'},
+    })
+    def test_response_cache_check(self):
+        """Test response caching is refused on a per-process cache"""
+        with override_settings(RESPONSE_CACHE={'ALIAS': 'default',
+                                               'TIMEOUT': 300}):
+            self.assertEqual([error.id for error in
+                              checks.check_response_cache(None)],
+                             ['utils.E001'])
+        with override_settings(RESPONSE_CACHE={'ALIAS': 'default',
+                                               'TIMEOUT': 0}):
+            self.assertEqual(checks.check_response_cache(None), [])
+        with override_settings(RESPONSE_CACHE={'ALIAS': 'shared',
+                                               'TIMEOUT': 300}):
+            self.assertEqual(checks.check_response_cache(None), [])
+
+    @override_settings(CACHES={
+        'default': {'BACKEND':
+                    'django.core.cache.backends.locmem.LocMemCache'},
+        'shared': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+                   'LOCATION': 'cache'},
+    })
+    def test_replica_routing_check(self):
+        """Test replicas need writers remembered in a shared cache"""
+        routing = {'REPLICAS': ['replica_1'], 'STICKY_SECONDS': 5}
+        with override_settings(REPLICA_ROUTING=dict(routing,
+                                                    CACHE='default')):
+            self.assertEqual([error.id for error in
+                              checks.check_replica_routing(None)],
+                             ['utils.E002'])
+        with override_settings(REPLICA_ROUTING=dict(routing,
+                                                    CACHE='shared')):
+            self.assertEqual(checks.check_replica_routing(None), [])
+        with override_settings(REPLICA_ROUTING=dict(routing, REPLICAS=[],
+                                                    CACHE='default')):
+            self.assertEqual(checks.check_replica_routing(None), [])
+
+    def test_optimized_sqlite_pragmas(self):
+        """Test new SQLite connections get the optimized PRAGMAs"""
+        pragmas = sqlite_pragmas_from_env(
+            {'DATABASE_SQLITE_MODE': 'optimized'})
+        self.assertEqual(pragmas, OPTIMIZED_SQLITE_PRAGMAS)
+
+        with tempfile.TemporaryDirectory() as directory, \
+                override_settings(SQLITE_PRAGMAS=pragmas):
+            settings_dict = dict(connection.settings_dict,
+                                 NAME=os.path.join(directory, 'db.sqlite3'))
+            wrapper = DatabaseWrapper(settings_dict, alias='pragmas')
+            try:
+                with wrapper.cursor() as cursor:
+                    cursor.execute('PRAGMA journal_mode')
+                    journal_mode = cursor.fetchone()[0]
+                    cursor.execute('PRAGMA busy_timeout')
+                    busy_timeout = cursor.fetchone()[0]
+            finally:
+                wrapper.close()
+
+        self.assertEqual(journal_mode, 'wal')
+        self.assertEqual(busy_timeout, 5000)
+
+
+class histogramTest(SimpleTestCase):
+    """Test the Prometheus histogram exposition"""
+
+    def test_buckets_are_cumulative(self):
+        """Test observations fall in the first bucket they fit under"""
+        histogram = Histogram('latency', 'Latency.', ('view',), (0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 3):
+            histogram.observe(('list-user',), value)
+
+        self.assertEqual(histogram.expose(), [
+            '# HELP latency Latency.',
+            '# TYPE latency histogram',
+            'latency_bucket{view="list-user",le="0.1"} 2',
+            'latency_bucket{view="list-user",le="1.0"} 3',
+            'latency_bucket{view="list-user",le="+Inf"} 4',
+            'latency_sum{view="list-user"} 3.65',
+            'latency_count{view="list-user"} 4',
+        ])
+
+
+@override_settings(RESPONSE_CACHE={'ALIAS': 'default', 'TIMEOUT': 0})
+class metricsMiddlewareTest(TestCase):
+    """Test per request instrumentation"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
+            email='test@husteen.com', password='password@123')
+
+    def setUp(self):
+        registry.reset()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_server_timing_header(self):
+        """Test responses report query count, db and render time"""
+        res = self.client.get(reverse('customer-transaction'))
+
+        timing = res['Server-Timing']
+        self.assertIn('db;dur=', timing)
+        self.assertIn('desc="2 queries"', timing)
+        self.assertIn('serialize;dur=', timing)
+        self.assertIn('render;dur=', timing)
+        self.assertIn('total;dur=', timing)
+
+    def test_queries_of_other_threads_are_counted(self):
+        """Test connections of sync_to_async threads record queries"""
+        metrics = RequestMetrics()
+
+        def query():
+            try:
+                with connections['default'].cursor() as cursor:
+                    cursor.execute('SELECT 1')
+            finally:
+                connections['default'].close()
+
+        with MetricsMiddleware(None).recording(metrics):
+            worker = threading.Thread(target=copy_context().run,
+                                      args=(query,))
+            worker.start()
+            worker.join()
+        self.assertEqual(metrics.queries, 1)
+
+    def test_nested_serialization_is_recorded_once(self):
+        """Test nested serializers do not add their time again"""
+        metrics = RequestMetrics()
+        with MetricsMiddleware(None).recording(metrics), \
+                mock.patch('utils.metrics.time.perf_counter',
+                           side_effect=[1.0, 1.5]):
+            with record_serialization():
+                with record_serialization():
+                    pass
+        self.assertEqual(metrics.serialize_time, 0.5)
+        self.assertFalse(metrics.serializing)
+
+    @override_settings(METRICS={'TOKEN': 'scrape'})
+    def test_metrics_endpoint(self):
+        """Test requests are aggregated by URL name"""
+        self.client.get(reverse('customer-transaction'))
+        self.client.get(reverse('customer-transaction'))
+
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer scrape')
+        res = self.client.get(reverse('metrics'))
+        body = res.content.decode()
+        self.assertEqual(res['Content-Type'],
+                         'text/plain; version=0.0.4')
+        self.assertIn('http_request_duration_seconds_count{'
+                      'view="customer-transaction",method="GET",'
+                      'status="200"} 2', body)
+        self.assertIn('http_request_db_queries_bucket{'
+                      'view="customer-transaction",le="2.0"} 2', body)
+        self.assertIn('http_response_serialize_duration_seconds_count{'
+                      'view="customer-transaction"} 2', body)
+
+    @override_settings(METRICS={'TOKEN': 'scrape'})
+    def test_metrics_token(self):
+        """Test the endpoint requires the configured bearer token"""
+        client = APIClient()
+        res = client.get(reverse('metrics'))
+        self.assertEqual(res.status_code, 403)
+
+        client.credentials(HTTP_AUTHORIZATION='Bearer scrape')
+        res = client.get(reverse('metrics'))
+        self.assertEqual(res.status_code, 200)
+
+    @override_settings(METRICS={'TOKEN': ''})
+    def test_metrics_hidden_without_token(self):
+        """Test the endpoint is not served without a token unless DEBUG"""
+        res = APIClient().get(reverse('metrics'))
+        self.assertEqual(res.status_code, 404)
+
+        with override_settings(DEBUG=True):
+            res = APIClient().get(reverse('metrics'))
+        self.assertEqual(res.status_code, 200)
+
+
+class factoriesTest(TestCase):
+    """Test the bulk data factories"""
+
+    def test_create_users(self):
+        """Test users share one password and get a product each"""
+        pairs = create_users(3, batch_size=2)
+
+        users = get_user_model().objects.order_by('email')
+        self.assertEqual(len(pairs), 3)
+        self.assertEqual(users.count(), 3)
+        self.assertTrue(users[0].check_password('password@123'))
+        self.assertEqual(len({user.password for user in users}), 1)
+        self.assertEqual(
+            {user.product.get().pk for user in users},
+            {product_id for _, product_id in pairs})
+
+    def test_skewed_transactions(self):
+        """Test skew gives the first users most transactions"""
+        pairs = create_users(10)
+        create_transactions(pairs, 1000, seed=0, skew=2)
+
+        ledgers = Ledger.objects.order_by('user_id')
+        self.assertGreater(ledgers[0].transaction_count, 500)
+        self.assertGreater(ledgers[0].transaction_count,
+                           ledgers[9].transaction_count)
+
+    def test_create_transactions(self):
+        """Test transactions are spread over users with ledgers"""
+        pairs = create_users(2)
+        create_transactions(pairs, 10, batch_size=3, seed=0)
+
+        self.assertEqual(Transaction.objects.count(), 10)
+        for user_id, product_id in pairs:
+            transactions = Transaction.objects.filter(user_id=user_id)
+            self.assertEqual(Ledger.objects.get(
+                user_id=user_id).transaction_count, transactions.count())
+            self.assertFalse(transactions.exclude(
+                product_id=product_id).exists())
+
+    def test_transactions_spread_per_row(self):
+        """Test creation times grow within a batch too"""
+        pairs = create_users(1)
+        create_transactions(pairs, 6, batch_size=3, seed=0, days=6)
+
+        times = list(Transaction.objects.order_by('pk').values_list(
+            'created_at', flat=True))
+        self.assertEqual(len(set(times)), 6)
+        self.assertEqual(times, sorted(times))
+
+    def test_transactions_need_owners(self):
+        """Test transactions are not drawn from an empty set of users"""
+        with self.assertRaises(ValueError):
+            create_transactions([], 3)
+        create_transactions([], 0)
+
+    def test_seeding_invalidates_cached_responses(self):
+        """Test the owners' response cache scopes get new versions"""
+        pairs = create_users(1)
+        user_id = pairs[0][0]
+        [version] = get_scope_versions(['user:%s' % user_id])
+        with self.captureOnCommitCallbacks(execute=True):
+            create_transactions(pairs, 3, seed=0)
+
+        self.assertNotEqual(
+            get_scope_versions(['user:%s' % user_id]), [version])
+
+
+class seedCommandTest(TransactionTestCase):
+    """Test the seed command"""
+
+    def test_seed(self):
+        """Test users, products and transactions follow the options"""
+        call_command('seed', users=5, transactions=50, seed=0,
+                     status_mix=(('pending', 1.0),), stdout=io.StringIO())
+
+        self.assertEqual(get_user_model().objects.count(), 5)
+        self.assertEqual(Ledger.objects.count(), 5)
+        self.assertEqual(
+            Transaction.objects.filter(status='pending').count(), 50)
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(
+                cursor, Transaction._meta.db_table)
+        for index in Transaction._meta.indexes:
+            self.assertIn(index.name, constraints)
+
+    def test_seed_rejects_impossible_options(self):
+        """Test transactions without users or status weights are refused
+        before anything is inserted"""
+        with self.assertRaisesMessage(CommandError, '--users 1 or more'):
+            call_command('seed', users=0, transactions=5,
+                         stdout=io.StringIO())
+        with self.assertRaisesMessage(CommandError, 'must be positive'):
+            call_command('seed', users=5, transactions=5,
+                         status_mix=(('pending', 0.0), ('failed', 0.0)),
+                         stdout=io.StringIO())
+        with self.assertRaisesMessage(CommandError, 'not negative'):
+            call_command('seed', '--status-mix', 'success=2,failed=-1',
+                         users=5, transactions=5, stdout=io.StringIO())
+
+        self.assertFalse(get_user_model().objects.exists())
+
+
+class benchmarkCommandTest(SimpleTestCase):
+    """Test the benchmark command"""
+
+    def test_every_endpoint_has_a_scenario(self):
+        """Test new URLs must be added to the benchmark"""
+        command = BenchmarkCommand()
+        self.assertEqual(set(command.url_names()),
+                         set(command.get_scenarios()))
+
+    def test_compare_fails_on_more_errors(self):
+        """Test requests failing more often than the baseline regress"""
+        result = {'p95_ms': 10.0, 'queries_max': 3, 'errors': 0}
+        with tempfile.NamedTemporaryFile('w', suffix='.json',
+                                         delete=False) as baseline:
+            json.dump({'endpoints': {'customer-transaction': result}},
+                      baseline)
+        self.addCleanup(os.remove, baseline.name)
+        command = BenchmarkCommand(stdout=io.StringIO())
+
+        command.compare({'customer-transaction': result}, baseline.name, 0.25)
+        with self.assertRaisesMessage(CommandError, 'fails 2 requests'):
+            command.compare({'customer-transaction': dict(result, errors=2)},
+                            baseline.name, 0.25)
+
+    @override_settings(RESPONSE_CACHE={'ALIAS': 'default', 'TIMEOUT': 300})
+    def test_scenarios_bypass_the_response_cache(self):
+        """Test repeated requests are not answered from the cache"""
+        command = BenchmarkCommand()
+        timeouts = []
+        with mock.patch.object(
+                command, 'run_scenario', lambda *args: timeouts.append(
+                    settings.RESPONSE_CACHE['TIMEOUT'])):
+            command.run_scenarios({'customer-transaction': None}, 1)
+        self.assertEqual(timeouts, [0])
@@ -0,0 +1,101 @@
+import json
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.views import View
+from rest_framework import exceptions, status
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from utils.renderers import CustomRenderer
+
+
+class AsyncAPIView(View):
+    """Async counterpart of DRF's APIView for simple JSON endpoints.
+
+    Handlers are `async def` methods returning a DRF `Response`. Requests
+    are authenticated with `authentication_classes` and checked against
+    `permission_classes` like APIView does, and responses and errors are
+    rendered with the first of `renderer_classes`, so the payloads keep
+    the envelope of the sync views.
+    """
+    authentication_classes = ()
+    permission_classes = ()
+    renderer_classes = [CustomRenderer]
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+        view.csrf_exempt = True
+        return view
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            await sync_to_async(self.initial)(request)
+            response = await super().dispatch(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(request, exc)
+        return self.finalize_response(request, response)
+
+    def initial(self, request):
+        """Authenticate the request and check permissions"""
+        request.user, request.auth = AnonymousUser(), None
+        for authenticator in self.get_authenticators():
+            user_auth = authenticator.authenticate(request)
+            if user_auth is not None:
+                request.user, request.auth = user_auth
+                break
+
+        for permission in self.get_permissions():
+            if not permission.has_permission(request, self):
+                if request.auth is None and self.authentication_classes:
+                    raise exceptions.NotAuthenticated()
+                raise exceptions.PermissionDenied(
+                    getattr(permission, 'message', None))
+
+    def get_authenticators(self):
+        return [auth() for auth in self.authentication_classes]
+
+    def get_permissions(self):
+        return [permission() for permission in self.permission_classes]
+
+    def parse_body(self, request):
+        """Return the JSON or form data sent with the request"""
+        if request.content_type == 'application/json':
+            try:
+                return json.loads(request.body or b'{}')
+            except ValueError as exc:
+                raise exceptions.ParseError(
+                    'JSON parse error - %s' % exc)
+        return request.POST
+
+    def handle_exception(self, request, exc):
+        """Turn DRF exceptions and Http404 into error responses"""
+        if isinstance(exc, (exceptions.NotAuthenticated,
+                            exceptions.AuthenticationFailed)):
+            authenticators = self.get_authenticators()
+            if authenticators:
+                exc.auth_header = authenticators[0].authenticate_header(
+                    request)
+            else:
+                exc.status_code = status.HTTP_403_FORBIDDEN
+
+        exception_handler = api_settings.EXCEPTION_HANDLER
+        response = exception_handler(exc, {'view': self, 'request': request})
+        if response is None:
+            raise exc
+        response.exception = True
+        return response
+
+    def finalize_response(self, request, response):
+        if not isinstance(response, Response):
+            return response
+        renderer = self.renderer_classes[0]()
+        response.accepted_renderer = renderer
+        response.accepted_media_type = renderer.media_type
+        response.renderer_context = {
+            'view': self,
+            'request': request,
+            'args': self.args,
+            'kwargs': self.kwargs,
+        }
+        return response.render()